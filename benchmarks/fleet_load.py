@@ -0,0 +1,345 @@
+import sys
+import os
+
+if __name__ == "__main__" and __package__ is None:
+    file_path = os.path.abspath(__file__)
+    parent_dir = os.path.dirname(os.path.dirname(file_path))
+    sys.path.append(parent_dir)
+
+import argparse
+import gzip
+import hashlib
+import http.client
+import json
+import math
+import multiprocessing
+import platform
+import random
+import socket
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+def make_image(path, size_mb):
+    """
+    生成用于测试的随机固件镜像
+
+    参数:
+        path (str): 镜像路径
+        size_mb (int): 镜像大小(MB)
+
+    返回:
+        str: 镜像的MD5
+    """
+    md5 = hashlib.md5()
+    with open(path, "wb") as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(size_mb):
+            f.write(block)
+            md5.update(block)
+    return md5.hexdigest()
+
+def make_update_data(port, size, md5sum):
+    """
+    生成指向回环服务器固件的合成更新数据
+
+    返回:
+        dict: 更新数据
+    """
+    return {
+        "code": 0,
+        "msg": "ok",
+        "data": {
+            "version": {
+                "versionName": "99.99.99",
+                "deltaUrl": f"http://127.0.0.1:{port}/image.img",
+                "md5sum": md5sum,
+                "fileSize": size,
+                "segmentMd5": json.dumps([{"num": 0, "startpos": 0, "endpos": size, "md5": md5sum}])
+            }
+        }
+    }
+
+def free_port():
+    """
+    获取一个空闲的回环端口
+
+    返回:
+        int: 端口号
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def serve(port, image_path, update_data, options):
+    """
+    子进程入口：运行HttpServer，与负载生成线程不共享GIL
+
+    参数:
+        port (int): 监听端口
+        image_path (str): 固件路径
+        update_data (dict): 更新数据
+        options (dict): 传给HttpServer的其他参数
+    """
+    from src.utils.io import IO
+    from src.core.server import HttpServer
+    IO.info = lambda *args, **kwargs: None
+    HttpServer(port=port, image_path=image_path, update_data=update_data, **options).run()
+
+def wait_ready(port):
+    """
+    等待服务器开始监听
+    """
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+
+def percentile(values, p):
+    """
+    计算最近秩百分位数
+
+    参数:
+        values (list): 已排序的数值
+        p (float): 百分位(0-100)
+
+    返回:
+        float: 百分位数，列表为空时返回None
+    """
+    if not values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[min(rank, len(values)) - 1]
+
+def jain_index(values):
+    """
+    计算Jain公平性指数，1表示所有客户端完全相同，1/n表示一台独占
+
+    返回:
+        float: 公平性指数，列表为空时返回None
+    """
+    if not values:
+        return None
+    total = sum(values)
+    squares = sum(v * v for v in values)
+    return total * total / (len(values) * squares) if squares else 1.0
+
+class Pen:
+    """模拟的词典笔，发送真实的checkVersion请求后按响应中的deltaUrl下载固件，可中途断开并用Range续传"""
+
+    def __init__(self, index, port, resume_at=None, verify=False):
+        """
+        初始化Pen对象
+
+        参数:
+            index (int): 编号，用作请求体中的序列号
+            port (int): 服务器端口
+            resume_at (int): 下载到该字节数后断开并续传，默认为None表示一次下载完成
+            verify (bool): 是否校验下载内容的MD5，默认为False
+        """
+        self.index = index
+        self.port = port
+        self.resume_at = resume_at
+        self.verify = verify
+        self.requests = 0
+        self.received = 0
+        self.check_time = None
+        self.ttlb = None
+        self.error = None
+        self.valid = None
+
+    def request(self, conn, method, path, body=None, headers=None):
+        """
+        发送请求并返回响应
+        """
+        conn.request(method, path, body=body, headers=headers or {})
+        self.requests += 1
+        return conn.getresponse()
+
+    def run(self):
+        """
+        执行一次完整的更新流程，异常记录在error中
+        """
+        try:
+            self.update()
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+
+    def update(self):
+        """
+        checkVersion后下载固件
+        """
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=300)
+        start = time.perf_counter()
+        body = json.dumps({"sn": f"PEN{self.index:06d}", "version": "1.0.0", "timestamp": int(time.time())})
+        response = self.request(conn, "POST", "/product/1/ota/checkVersion", body,
+                                {"Content-Type": "application/json", "Accept-Encoding": "gzip"})
+        payload = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"checkVersion status {response.status}")
+        if response.getheader("Content-Encoding") == "gzip":
+            payload = gzip.decompress(payload)
+        version = json.loads(payload)["data"]["version"]
+        self.check_time = time.perf_counter() - start
+
+        path = urlsplit(version["deltaUrl"]).path
+        md5 = hashlib.md5() if self.verify else None
+        start = time.perf_counter()
+        response = self.request(conn, "GET", path)
+        if response.status != 200:
+            raise RuntimeError(f"image status {response.status}")
+        etag = response.getheader("ETag")
+        limit = self.resume_at if self.resume_at is not None else float("inf")
+        while self.received < limit:
+            chunk = response.read(min(1024 * 1024, limit - self.received))
+            if not chunk:
+                break
+            self.received += len(chunk)
+            if md5:
+                md5.update(chunk)
+        conn.close()
+
+        if self.resume_at is not None and self.received < version["fileSize"]:
+            # 模拟断线后重新连接，从已收到的位置续传
+            conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=300)
+            headers = {"Range": f"bytes={self.received}-"}
+            if etag:
+                headers["If-Range"] = etag
+            response = self.request(conn, "GET", path, headers=headers)
+            if response.status != 206:
+                raise RuntimeError(f"resume status {response.status}")
+            while True:
+                chunk = response.read(1024 * 1024)
+                if not chunk:
+                    break
+                self.received += len(chunk)
+                if md5:
+                    md5.update(chunk)
+            conn.close()
+
+        self.ttlb = time.perf_counter() - start
+        if self.received != version["fileSize"]:
+            raise RuntimeError(f"received {self.received} of {version['fileSize']} bytes")
+        if md5:
+            self.valid = md5.hexdigest() == version["md5sum"]
+
+def run_fleet(port, pens, size, resume_ratio, verify, seed):
+    """
+    同时启动一批模拟词典笔
+
+    返回:
+        tuple: (总耗时, Pen列表)
+    """
+    rng = random.Random(seed)
+    fleet = []
+    for index in range(pens):
+        resume_at = rng.randrange(1, size) if size > 1 and rng.random() < resume_ratio else None
+        fleet.append(Pen(index, port, resume_at, verify))
+    threads = [threading.Thread(target=pen.run) for pen in fleet]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, fleet
+
+def summarize(elapsed, fleet):
+    """
+    汇总一次负载测试的结果
+
+    返回:
+        dict: 吞吐量、TTLB百分位和公平性等指标
+    """
+    done = [pen for pen in fleet if pen.error is None]
+    ttlb = sorted(pen.ttlb for pen in done)
+    check = sorted(pen.check_time for pen in fleet if pen.check_time is not None)
+    rates = [pen.received / pen.ttlb / 1024 / 1024 for pen in done if pen.ttlb]
+    total_bytes = sum(pen.received for pen in fleet)
+    requests = sum(pen.requests for pen in fleet)
+    return {
+        "elapsed_s": elapsed,
+        "pens": len(fleet),
+        "completed": len(done),
+        "errors": len(fleet) - len(done),
+        "error_samples": sorted({pen.error for pen in fleet if pen.error})[:5],
+        "resumed": sum(1 for pen in fleet if pen.resume_at is not None),
+        "corrupt": sum(1 for pen in done if pen.valid is False),
+        "requests": requests,
+        "requests_per_s": requests / elapsed,
+        "mb_per_s": total_bytes / 1024 / 1024 / elapsed,
+        "check_version_ms": {p: percentile(check, float(p)) * 1000 if check else None for p in ("50", "99")},
+        "ttlb_s": {p: percentile(ttlb, float(p)) for p in ("50", "90", "99", "100")},
+        "per_pen_mb_per_s": {
+            "min": min(rates) if rates else None,
+            "max": max(rates) if rates else None,
+            "jain_index": jain_index(rates)
+        }
+    }
+
+def main():
+    """
+    在回环端口上启动HttpServer，模拟一批词典笔执行完整的更新流程，
+    输出请求数/秒、MB/秒、下载耗时(TTLB)百分位和各词典笔速率的公平性，并写入JSON便于比较不同后端和参数。
+    负载生成与服务器分处两个进程，单核机器上二者会互相争用CPU
+    """
+    parser = argparse.ArgumentParser(description="Simulated pen fleet load test for HttpServer")
+    parser.add_argument("--pens", type=int, nargs="+", default=[10, 100], help="Fleet sizes to run, one case each")
+    parser.add_argument("--size-mb", type=int, default=16)
+    parser.add_argument("--engines", nargs="+", default=["flask", "asyncio"])
+    parser.add_argument("--serve-mode", choices=["flask", "sendfile", "mmap"], default="flask")
+    parser.add_argument("--server-workers", type=int)
+    parser.add_argument("--max-transfers", type=int)
+    parser.add_argument("--bandwidth-limit", type=float, help="MB/s")
+    parser.add_argument("--client-bandwidth", type=float, help="MB/s")
+    parser.add_argument("--resume-ratio", type=float, default=0.2, help="Fraction of pens that disconnect mid-download and resume with Range")
+    parser.add_argument("--verify", action="store_true", help="Check the MD5 of every download")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default="fleet_load.json")
+    args = parser.parse_args()
+
+    options = {
+        "serve_mode": args.serve_mode,
+        "workers": args.server_workers,
+        "max_transfers": args.max_transfers,
+        "bandwidth_limit": args.bandwidth_limit * 1024 * 1024 if args.bandwidth_limit else None,
+        "client_bandwidth": args.client_bandwidth * 1024 * 1024 if args.client_bandwidth else None
+    }
+    report = {
+        "settings": dict(vars(args)),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "cases": []
+    }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "image.img")
+        md5sum = make_image(path, args.size_mb)
+        size = args.size_mb * 1024 * 1024
+
+        for engine in args.engines:
+            port = free_port()
+            process = multiprocessing.Process(target=serve, args=(port, path, make_update_data(port, size, md5sum), dict(options, engine=engine)), daemon=True)
+            process.start()
+            wait_ready(port)
+            try:
+                for pens in args.pens:
+                    elapsed, fleet = run_fleet(port, pens, size, args.resume_ratio, args.verify, args.seed)
+                    result = summarize(elapsed, fleet)
+                    result["engine"] = engine
+                    report["cases"].append(result)
+                    ttlb = result["ttlb_s"]
+                    print(f"{engine:<8} {pens:5d} pens  {elapsed:8.3f}s  {result['requests_per_s']:8.1f} req/s  "
+                          f"{result['mb_per_s']:9.1f} MB/s  ttlb p50 {ttlb['50'] or 0:7.3f}s p99 {ttlb['99'] or 0:7.3f}s  "
+                          f"jain {result['per_pen_mb_per_s']['jain_index'] or 0:.3f}  errors {result['errors']}")
+            finally:
+                process.terminate()
+                process.join()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
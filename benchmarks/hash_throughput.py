@@ -0,0 +1,71 @@
+import sys
+import os
+
+if __name__ == "__main__" and __package__ is None:
+    file_path = os.path.abspath(__file__)
+    parent_dir = os.path.dirname(os.path.dirname(file_path))
+    sys.path.append(parent_dir)
+
+import argparse
+import tempfile
+import time
+from src.core.patcher import Patcher
+from src.core.hasher import DigestEngine
+
+def make_image(path, size_mb, segment_count):
+    """
+    生成用于测试的随机固件镜像和分段列表
+
+    参数:
+        path (str): 镜像路径
+        size_mb (int): 镜像大小(MB)
+        segment_count (int): 分段数量
+
+    返回:
+        list: 分段列表，每项为(start, end)元组
+    """
+    size = size_mb * 1024 * 1024
+    with open(path, "wb") as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(size_mb):
+            f.write(block)
+    step = size // segment_count
+    return [(i * step, min(size, (i + 1) * step)) for i in range(segment_count)]
+
+def legacy(path, segments):
+    """
+    原有代码路径：整文件MD5、SHA1和每个分段各读取一次文件
+    """
+    for start, end in segments:
+        Patcher.calc_segment_md5(path, start, end)
+    Patcher.calc_md5(path)
+    Patcher.calc_sha1(path)
+
+def main():
+    """
+    对比原有哈希计算路径与单遍/并行计算的吞吐量
+    """
+    parser = argparse.ArgumentParser(description="Firmware hashing throughput benchmark")
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--segments", type=int, default=32)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "image.img")
+        segments = make_image(path, args.size_mb, args.segments)
+
+        cases = [("legacy", lambda: legacy(path, segments)),
+                 ("single-pass", lambda: DigestEngine.compute_file(path, segments))]
+        for workers in args.workers:
+            cases.append((f"parallel x{workers}",
+                          lambda w=workers: DigestEngine.compute_file_parallel(path, segments, workers=w)))
+
+        for name, func in cases:
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            print(f"{name:<16} {elapsed:8.3f}s  {args.size_mb / elapsed:9.1f} MB/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import sys
+import os
+
+if __name__ == "__main__" and __package__ is None:
+    file_path = os.path.abspath(__file__)
+    parent_dir = os.path.dirname(os.path.dirname(file_path))
+    sys.path.append(parent_dir)
+
+import argparse
+import http.client
+import tempfile
+import time
+from src.core.server import HttpServer
+
+def make_image(path, size_mb):
+    """
+    生成用于测试的随机固件镜像
+
+    参数:
+        path (str): 镜像路径
+        size_mb (int): 镜像大小(MB)
+    """
+    with open(path, "wb") as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(size_mb):
+            f.write(block)
+
+def start_server(image_path, serve_mode, progress_callback):
+    """
+    在回环地址的随机端口上启动HttpServer
+
+    返回:
+        HttpServer: 已开始监听的服务器
+    """
+    server = HttpServer(port=0, image_path=image_path, update_data={}, progress_callback=progress_callback, serve_mode=serve_mode)
+    server.start_threaded()
+    while server.server is None:
+        time.sleep(0.01)
+    return server
+
+def fetch(port, headers=None):
+    """
+    通过回环连接下载image.img并丢弃数据
+
+    返回:
+        int: 收到的字节数
+    """
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    conn.request("GET", "/image.img", headers=headers or {})
+    response = conn.getresponse()
+    received = 0
+    while True:
+        data = response.read(1024 * 1024)
+        if not data:
+            break
+        received += len(data)
+    conn.close()
+    return received
+
+def main():
+    """
+    对比Flask send_file路径、sendfile零拷贝路径和共享内存映射路径的回环下载吞吐量
+    """
+    parser = argparse.ArgumentParser(description="image.img serving throughput benchmark")
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    calls = [0]
+    def progress(current, total):
+        calls[0] += 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "image.img")
+        make_image(path, args.size_mb)
+
+        cases = [("flask", "flask", None),
+                 ("flask+progress", "flask", progress),
+                 ("sendfile", "sendfile", None),
+                 ("sendfile+progress", "sendfile", progress),
+                 ("mmap", "mmap", None),
+                 ("mmap+progress", "mmap", progress)]
+        for name, serve_mode, callback in cases:
+            server = start_server(path, serve_mode, callback)
+            port = server.server.server_port
+            fetch(port)
+            calls[0] = 0
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                received = fetch(port)
+                assert received == args.size_mb * 1024 * 1024
+            elapsed = time.perf_counter() - start
+            # 原有的带进度路径传入的是文件对象，send_file无法得知大小，Range会被忽略
+            ranged = fetch(port, {"Range": f"bytes={args.size_mb * 1024 * 512}-"}) == args.size_mb * 1024 * 512
+            server.stop()
+            print(f"{name:<18} {elapsed:8.3f}s  {args.size_mb * args.repeat / elapsed:9.1f} MB/s  "
+                  f"{calls[0]:7d} callbacks  range {'ok' if ranged else 'ignored'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import sys
+import os
+
+if __name__ == "__main__" and __package__ is None:
+    file_path = os.path.abspath(__file__)
+    parent_dir = os.path.dirname(os.path.dirname(file_path))
+    sys.path.append(parent_dir)
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import socket
+import tempfile
+import threading
+import time
+
+def make_image(path, size_mb):
+    """
+    生成用于测试的随机固件镜像
+
+    参数:
+        path (str): 镜像路径
+        size_mb (int): 镜像大小(MB)
+    """
+    with open(path, "wb") as f:
+        block = os.urandom(1024 * 1024)
+        for _ in range(size_mb):
+            f.write(block)
+
+def free_port():
+    """
+    获取一个空闲的回环端口
+
+    返回:
+        int: 端口号
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def serve(port, image_path, engine):
+    """
+    子进程入口：运行HttpServer，与负载生成线程不共享GIL
+    """
+    from src.utils.io import IO
+    from src.core.server import HttpServer
+    IO.info = lambda *args, **kwargs: None
+    update_data = {"code": 0, "data": {"version": {"versionName": "99.99.99", "segmentMd5": "[]" * 64}}}
+    HttpServer(port=port, image_path=image_path, update_data=update_data, engine=engine).run()
+
+def wait_ready(port):
+    """
+    等待服务器开始监听
+    """
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+
+def pen(port, results):
+    """
+    模拟一台词典笔：在同一连接上发送checkVersion后下载整个固件
+
+    参数:
+        port (int): 服务器端口
+        results (list): 用于追加本次耗时(秒)的列表
+    """
+    start = time.perf_counter()
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    conn.request("POST", "/product/1/ota/checkVersion", body=json.dumps({"version": "1.0"}),
+                 headers={"Content-Type": "application/json", "Accept-Encoding": "gzip"})
+    conn.getresponse().read()
+    conn.request("GET", "/image.img")
+    response = conn.getresponse()
+    while response.read(1024 * 1024):
+        pass
+    conn.close()
+    results.append(time.perf_counter() - start)
+
+def run_case(port, clients):
+    """
+    同时启动clients台模拟词典笔
+
+    返回:
+        tuple: (总耗时, 每台耗时列表)
+    """
+    results = []
+    threads = [threading.Thread(target=pen, args=(port, results)) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, sorted(results)
+
+def main():
+    """
+    对比flask与asyncio后端在1、10、100个并发客户端下的表现
+    """
+    parser = argparse.ArgumentParser(description="OTA server concurrency benchmark")
+    parser.add_argument("--size-mb", type=int, default=16)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--engines", nargs="+", default=["flask", "asyncio"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "image.img")
+        make_image(path, args.size_mb)
+
+        for engine in args.engines:
+            port = free_port()
+            process = multiprocessing.Process(target=serve, args=(port, path, engine), daemon=True)
+            process.start()
+            wait_ready(port)
+            try:
+                for clients in args.clients:
+                    elapsed, results = run_case(port, clients)
+                    median = results[len(results) // 2]
+                    print(f"{engine:<8} {clients:4d} clients  {elapsed:8.3f}s  "
+                          f"{clients * 2 / elapsed:8.1f} req/s  {clients * args.size_mb / elapsed:9.1f} MB/s  "
+                          f"p50 {median:7.3f}s  max {results[-1]:7.3f}s")
+            finally:
+                process.terminate()
+                process.join()
+
+if __name__ == "__main__":
+    main()
@@ -6,14 +6,19 @@ import http.client
 from .utils.io import IO, require_admin
 from .utils.i18n import I18N, t
 from .core.capture import capture_ota_request
-from .core.downloader import get_update_data, download_file
+from .core.downloader import get_update_data, download_file, DownloadPipeline, log_coalescing_stats
 from .core.patcher import Patcher
 from .core.host import HostManager
 from .core.server import HttpServer
+from .core.index_cache import SignatureIndexCache
+from .core.firmware_cache import FirmwareCache
+from .core.response_cache import ResponseCache
+from .core.sessions import SessionRegistry
+from .core.catalog import ProductCatalog
 
 class PaperPApp:
     """PaperP应用主类"""
-    def __init__(self, interface="0.0.0.0", image_path="image.img", lang=None, debug=False):
+    def __init__(self, interface="0.0.0.0", image_path="image.img", lang=None, debug=False, hash_workers=1, verify_segments=False, scan_workers=1, index_cache=True, download_connections=1, firmware_cache=None, firmware_cache_budget=None, response_cache=None, response_cache_mode="cache", response_cache_ttl=None, serve_mode="flask", warm_image=False, server_engine="flask", max_transfers=None, server_workers=None, idle_timeout=None, bandwidth_limit=None, client_bandwidth=None, variants=None, catalog=None, serve_catalog=False):
         """
         初始化PaperPApp对象
         
@@ -22,13 +27,132 @@ class PaperPApp:
             image_path (str): 固件文件路径，默认为"image.img"
             lang (str): 语言，默认为None
             debug (bool): 是否启用调试模式，默认为False
+            hash_workers (int): 哈希计算线程数，默认为1
+            verify_segments (bool): 是否校验未修改分段的上游MD5，默认为False
+            scan_workers (int): 密码特征扫描进程数，默认为1
+            index_cache (bool): 是否使用固件特征偏移索引缓存，默认为True
+            download_connections (int): 固件下载并发连接数，默认为1
+            firmware_cache (str): 本地固件缓存目录，默认为None表示不使用缓存
+            firmware_cache_budget (int): 固件缓存的字节上限，默认为None使用FirmwareCache.DEFAULT_BUDGET
+            response_cache (str): checkVersion响应录制/回放目录，默认为None表示不使用
+            response_cache_mode (str): 响应缓存模式，'cache'、'record'或'replay'，默认为'cache'
+            response_cache_ttl (float): cache模式下响应的有效期(秒)，默认为None使用ResponseCache.DEFAULT_TTL
+            serve_mode (str): 固件发送方式，'flask'、'sendfile'或'mmap'，默认为'flask'
+            warm_image (bool): mmap模式下是否在服务器启动时预读固件，默认为False
+            server_engine (str): OTA服务器后端，'flask'或'asyncio'，默认为'flask'
+            max_transfers (int): 同时进行的固件传输数上限，默认为None使用TransferScheduler.MAX_TRANSFERS
+            server_workers (int): flask后端的工作线程数，默认为None使用传输数上限加PooledWSGIServer.SPARE_WORKERS
+            idle_timeout (float): 长连接空闲超时(秒)，默认为None使用各后端的默认值
+            bandwidth_limit (float): 固件服务的全局带宽上限(字节/秒)，默认为None表示不限
+            client_bandwidth (float): 每台设备的带宽上限(字节/秒)，默认为None表示不限
+            variants (str): VariantFactory生成的manifest.json路径，设置后不修改固件，
+                            按设备序列号或IP提供各自的更新数据和虚拟固件，默认为None
+            catalog (str): 多产品固件目录文件夹，设置后修改好的产品会加入目录并一同提供，默认为None
+            serve_catalog (bool): 是否跳过抓取和修改，只提供目录中已有的产品，默认为False
         """
         self.interface = interface
         self.image_path = image_path
         self.lang = lang
         self.debug = debug
+        self.hash_workers = hash_workers
+        self.verify_segments = verify_segments
+        self.scan_workers = scan_workers
+        self.use_index_cache = index_cache
+        self.download_connections = download_connections
+        self.firmware_cache_dir = firmware_cache
+        self.firmware_cache_budget = firmware_cache_budget
+        self.response_cache_dir = response_cache
+        self.response_cache_mode = response_cache_mode
+        self.response_cache_ttl = response_cache_ttl
+        self.serve_mode = serve_mode
+        self.warm_image = warm_image
+        self.server_engine = server_engine
+        self.max_transfers = max_transfers
+        self.server_workers = server_workers
+        self.idle_timeout = idle_timeout
+        self.bandwidth_limit = bandwidth_limit
+        self.client_bandwidth = client_bandwidth
+        self.variants = variants
+        self.catalog_dir = catalog
+        self.serve_catalog = serve_catalog
+        self.patched_ranges = []
         self.update_data = None
         
+    def get_index_cache(self):
+        """
+        获取固件所在目录的特征偏移索引缓存
+        
+        返回:
+            SignatureIndexCache: 索引缓存对象，未启用时返回None
+        """
+        if not self.use_index_cache:
+            return None
+        return SignatureIndexCache.for_image(self.image_path)
+
+    def get_firmware_cache(self):
+        """
+        获取本地固件缓存
+        
+        返回:
+            FirmwareCache: 固件缓存对象，未配置时返回None
+        """
+        if not self.firmware_cache_dir:
+            return None
+        return FirmwareCache(self.firmware_cache_dir, self.firmware_cache_budget)
+
+    def get_response_cache(self):
+        """
+        获取checkVersion响应的录制/回放缓存
+        
+        返回:
+            ResponseCache: 响应缓存对象，未配置时返回None
+        """
+        if not self.response_cache_dir:
+            return None
+        return ResponseCache(self.response_cache_dir, self.response_cache_mode, self.response_cache_ttl)
+
+    def get_sessions(self):
+        """
+        根据变体清单创建多设备会话注册表
+        
+        返回:
+            SessionRegistry: 会话注册表，未配置变体时返回None
+        """
+        if not self.variants:
+            return None
+        return SessionRegistry.from_manifest(self.variants, os.path.abspath(self.image_path), self.interface)
+
+    def get_catalog(self):
+        """
+        获取多产品固件目录
+        
+        返回:
+            ProductCatalog: 产品目录，未配置时返回None
+        """
+        if not self.catalog_dir:
+            return None
+        return ProductCatalog(self.catalog_dir, self.interface)
+
+    def start_server(self, server):
+        """
+        运行服务器，端口被占用时提示用户处理后重试一次
+        
+        参数:
+            server (HttpServer): 服务器对象
+        """
+        retry_count = 0
+        while retry_count < 2:
+            try:
+                server.run()
+                break
+            except Exception as e:
+                retry_count += 1
+                if retry_count < 2:
+                    IO.input(t("retry_port"))
+                    continue
+                else:
+                    raise e
+
     def setup(self):
         """
         初始化应用环境
@@ -90,6 +214,24 @@ class PaperPApp:
         has_error = False
         try:
             self.setup()
+            catalog = self.get_catalog()
+
+            # 只提供目录中已有的产品，不需要为每个型号重新抓取、下载和修改
+            if self.serve_catalog:
+                if catalog is None or not catalog.entries:
+                    IO.error(t("catalog_empty"))
+                    has_error = True
+                    return
+                IO.info(t("catalog_loaded").format(len(catalog.entries), catalog.directory))
+                if not HostManager.enable_redirect(self.interface):
+                    has_error = True
+                    return
+                self.start_server(HttpServer(port=80, image_path=os.path.abspath(self.image_path), update_data=None,
+                                             serve_mode=self.serve_mode, engine=self.server_engine, max_transfers=self.max_transfers,
+                                             bandwidth_limit=self.bandwidth_limit, client_bandwidth=self.client_bandwidth,
+                                             catalog=catalog, workers=self.server_workers, idle_timeout=self.idle_timeout,
+                                             warm_image=self.warm_image))
+                return
             
             # 1. 抓取
             capture_result = capture_ota_request(self.interface)
@@ -99,7 +241,9 @@ class PaperPApp:
                 return
 
             # 2. 下载信息
-            self.update_data = get_update_data(capture_result.product_url, capture_result.request_body)
+            self.update_data = get_update_data(
+                capture_result.product_url, capture_result.request_body,
+                response_cache=self.get_response_cache())
             if not self.update_data:
                 has_error = True
                 return
@@ -114,17 +258,45 @@ class PaperPApp:
                 return
 
             # 3. 下载文件
-            if not download_file(delta_url, self.image_path):
+            pipeline = DownloadPipeline.from_update_data(self.update_data)
+            if not download_file(
+                delta_url, self.image_path,
+                pipeline=pipeline,
+                connections=self.download_connections,
+                cache=self.get_firmware_cache()
+            ):
                 has_error = True
                 return
+            log_coalescing_stats()
+
+            index_cache = self.get_index_cache()
+            pipeline.record(index_cache, self.image_path)
 
             # 4. 修改文件
-            if not Patcher.replace_hash(self.image_path):
+            self.patched_ranges = []
+            if self.variants:
+                IO.info(t("variants_skip_patch"))
+            elif not Patcher.replace_hash(
+                self.image_path,
+                patched_ranges=self.patched_ranges,
+                scan_workers=self.scan_workers,
+                index_cache=index_cache,
+                md5sum=self.update_data['data']['version'].get('md5sum')
+            ):
                 has_error = True
                 return
 
             # 5. 重新计算哈希
-            Patcher.update_version_data(self.update_data, self.image_path, self.interface)
+            if not self.variants:
+                Patcher.update_version_data(
+                    self.update_data, self.image_path, self.interface,
+                    hash_workers=self.hash_workers,
+                    patched_ranges=self.patched_ranges,
+                    verify_segments=self.verify_segments,
+                    index_cache=index_cache
+                )
+                if catalog is not None:
+                    catalog.add(capture_result.product_url, self.update_data, self.image_path, self.interface)
 
             # 6. Host重定向
             if not HostManager.enable_redirect(self.interface):
@@ -132,21 +304,14 @@ class PaperPApp:
                 return
 
             # 7. 启动服务器
-            server = HttpServer(port=80, image_path=os.path.abspath(self.image_path), update_data=self.update_data)
-            
-            retry_count = 0
-            while retry_count < 2:
-                try:
-                    server.run()
-                    break
-                except Exception as e:
-                    retry_count += 1
-                    if retry_count < 2:
-                        IO.input(t("retry_port"))
-                        continue
-                    else:
-                        has_error = True
-                        raise e
+            # 变体模式下未登记的设备不下发未修改的上游数据
+            server = HttpServer(port=80, image_path=os.path.abspath(self.image_path),
+                                update_data=None if self.variants else self.update_data,
+                                serve_mode=self.serve_mode, engine=self.server_engine, max_transfers=self.max_transfers,
+                                bandwidth_limit=self.bandwidth_limit, client_bandwidth=self.client_bandwidth,
+                                sessions=self.get_sessions(), catalog=catalog,
+                                workers=self.server_workers, idle_timeout=self.idle_timeout, warm_image=self.warm_image)
+            self.start_server(server)
             
         except Exception as e:
              IO.error(t("unknown_error").format(e))
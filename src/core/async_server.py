@@ -0,0 +1,350 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+from contextlib import nullcontext
+from urllib.parse import urlsplit
+from ..utils import IO, t
+from .image_sender import IMAGE_ROUTE, RangeNotSatisfiable, ProgressSampler, parse_range, if_range_matches
+from .scheduler import TransferScheduler
+from .sessions import image_for_client, response_for_client
+from .catalog import CATALOG_IMAGE_PREFIX
+from .metrics import METRICS_ROUTE, CONTENT_TYPE, route_label
+
+REASONS = {
+    200: "OK", 206: "Partial Content", 304: "Not Modified", 400: "Bad Request",
+    404: "Not Found", 405: "Method Not Allowed", 411: "Length Required",
+    413: "Payload Too Large", 416: "Range Not Satisfiable", 500: "Internal Server Error"
+}
+
+class AsyncOtaServer:
+    """
+    基于asyncio流的OTA服务器类
+    单线程事件循环处理所有连接，支持HTTP/1.1长连接、Range、HEAD，固件传输由TransferScheduler限流排队，
+    接口与werkzeug服务器保持一致(serve_forever/shutdown/server_close/server_port)，供HttpServer切换使用
+    """
+    MAX_HEADER_SIZE = 64 * 1024
+    MAX_BODY_SIZE = 1024 * 1024
+    IDLE_TIMEOUT = 30
+    SEND_BLOCK = 8 * 1024 * 1024
+    MAP_BLOCK = 256 * 1024
+    BACKLOG = 1024
+
+    def __init__(self, host, port, config, idle_timeout=None):
+        """
+        初始化AsyncOtaServer对象并绑定监听套接字
+
+        参数:
+            host (str): 监听地址
+            port (int): 监听端口，0表示随机端口
+            config (dict): Flask应用配置，读取UPDATE_DATA、IMAGE_PATH、PROGRESS_CALLBACK和TRANSFER_SCHEDULER
+            idle_timeout (float): 长连接空闲超时(秒)，默认为IDLE_TIMEOUT
+        """
+        self.config = config
+        self.idle_timeout = idle_timeout or AsyncOtaServer.IDLE_TIMEOUT
+        self.scheduler = config.get('TRANSFER_SCHEDULER') or TransferScheduler()
+        self.socket = socket.create_server((host, port), backlog=AsyncOtaServer.BACKLOG)
+        self.server_port = self.socket.getsockname()[1]
+        self.loop = None
+        self.stop_event = None
+        self.stopped = threading.Event()
+        self.shutdown_requested = False
+        self.connections = {}
+
+    def serve_forever(self):
+        """
+        运行事件循环直到shutdown被调用
+        """
+        try:
+            asyncio.run(self.main())
+        finally:
+            self.stopped.set()
+
+    async def main(self):
+        """
+        启动监听并等待停止信号
+        """
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        if self.shutdown_requested:
+            return
+        server = await asyncio.start_server(self.handle_connection, sock=self.socket, limit=AsyncOtaServer.MAX_HEADER_SIZE)
+        async with server:
+            await self.stop_event.wait()
+            # 主动关闭仍在等待请求的连接，让处理协程自行结束而不是在退出时被取消
+            for writer in list(self.connections):
+                writer.close()
+            if self.connections:
+                await asyncio.wait(list(self.connections.values()), timeout=1)
+
+    def shutdown(self):
+        """
+        停止事件循环并等待serve_forever返回
+        """
+        self.shutdown_requested = True
+        if self.loop is not None and self.stop_event is not None:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+            self.stopped.wait(5)
+
+    def get_stats(self):
+        """
+        获取连接统计信息
+
+        返回:
+            dict: connections为当前打开的连接数
+        """
+        return {'connections': len(self.connections)}
+
+    def server_close(self):
+        """
+        关闭监听套接字
+        """
+        try:
+            self.socket.close()
+        except OSError:
+            pass
+
+    async def handle_connection(self, reader, writer):
+        """
+        处理一个连接上的全部请求
+
+        参数:
+            reader (StreamReader): 读取流
+            writer (StreamWriter): 写入流
+        """
+        self.connections[writer] = asyncio.current_task()
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        peer = writer.get_extra_info('peername') or ('-', 0)
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.idle_timeout)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+                    break
+                except asyncio.LimitOverrunError:
+                    await self.send_simple(writer, 400, keep_alive=False)
+                    break
+                keep_alive = await self.handle_request(head, reader, writer, peer[0])
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self.connections.pop(writer, None)
+            writer.close()
+
+    @staticmethod
+    def parse_head(head):
+        """
+        解析请求行和请求头
+
+        参数:
+            head (bytes): 以空行结尾的请求头部
+
+        返回:
+            tuple: (method, path, version, headers)，headers的键为小写
+        """
+        lines = head.decode('latin-1').split("\r\n")
+        method, target, version = lines[0].split(" ", 2)
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return method, urlsplit(target).path, version, headers
+
+    async def handle_request(self, head, reader, writer, client_ip):
+        """
+        处理单个请求，配置中有METRICS时记录路由、状态码和耗时
+
+        返回:
+            bool: 连接是否可以继续复用
+        """
+        start = time.perf_counter()
+        keep_alive, status, path = await self.dispatch(head, reader, writer, client_ip)
+        metrics = self.config.get('METRICS')
+        if metrics is not None:
+            metrics.observe_request(route_label(path), status, time.perf_counter() - start)
+        return keep_alive
+
+    async def dispatch(self, head, reader, writer, client_ip):
+        """
+        解析请求并分发到对应的处理方法
+
+        返回:
+            tuple: (连接是否可以继续复用, 响应状态码, 请求路径)
+        """
+        try:
+            method, path, version, headers = AsyncOtaServer.parse_head(head)
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            await self.send_simple(writer, 400, keep_alive=False)
+            return False, 400, None
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+
+        if 'transfer-encoding' in headers:
+            await self.send_simple(writer, 411, keep_alive=False)
+            return False, 411, path
+        if length > AsyncOtaServer.MAX_BODY_SIZE:
+            await self.send_simple(writer, 413, keep_alive=False)
+            return False, 413, path
+        body = await reader.readexactly(length) if length else b''
+
+        if method == 'POST' and "ota/checkVersion" in path:
+            IO.info(t("ota_check_received").format(path.lstrip('/')))
+            status = await self.send_check_version(writer, path, headers, body, keep_alive, client_ip)
+        elif (path == IMAGE_ROUTE or path.startswith(CATALOG_IMAGE_PREFIX)) and method in ('GET', 'HEAD'):
+            keep_alive, status = await self.send_image(writer, path, method, headers, keep_alive, client_ip)
+        elif path == IMAGE_ROUTE or path.startswith(CATALOG_IMAGE_PREFIX):
+            status = 405
+            await self.send_simple(writer, status, keep_alive=keep_alive)
+        elif path == METRICS_ROUTE and method == 'GET' and self.config.get('METRICS') is not None:
+            status = 200
+            body = self.config['METRICS'].render().encode()
+            AsyncOtaServer.write_head(writer, status, [('Content-Type', CONTENT_TYPE), ('Content-Length', str(len(body)))], keep_alive)
+            writer.write(body)
+            await writer.drain()
+        else:
+            status = 404
+            await self.send_simple(writer, status, keep_alive=keep_alive)
+        return keep_alive, status, path
+
+    @staticmethod
+    def write_head(writer, status, headers, keep_alive):
+        """
+        写入状态行和响应头
+
+        参数:
+            writer (StreamWriter): 写入流
+            status (int): 状态码
+            headers (list): 响应头列表
+            keep_alive (bool): 是否保持连接
+        """
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+        lines.extend(f"{name}: {value}" for name, value in headers)
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+
+    async def send_simple(self, writer, status, body=None, keep_alive=True):
+        """
+        发送简单的文本响应
+        """
+        body = body if body is not None else REASONS.get(status, '').encode()
+        AsyncOtaServer.write_head(writer, status, [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))], keep_alive)
+        writer.write(body)
+        await writer.drain()
+
+    async def send_check_version(self, writer, path, headers, body, keep_alive, client_ip):
+        """
+        发送预序列化的checkVersion响应，登记了设备会话时使用该设备的更新数据
+
+        返回:
+            int: 响应状态码
+        """
+        try:
+            request_body = json.loads(body) if body else None
+        except ValueError:
+            request_body = None
+        prepared = response_for_client(self.config, client_ip, request_body, path)
+        metrics = self.config.get('METRICS')
+        if prepared is None:
+            if metrics is not None:
+                metrics.count_check_version(None)
+            await self.send_simple(writer, 500, b"No update data configured", keep_alive)
+            return 500
+        accept_gzip = 'gzip' in headers.get('accept-encoding', '')
+        status, response_headers, body = prepared.render(accept_gzip, headers.get('if-none-match'))
+        if metrics is not None:
+            metrics.count_check_version(status, response_headers)
+        response_headers.append(('Content-Length', str(len(body))))
+        AsyncOtaServer.write_head(writer, status, response_headers, keep_alive)
+        writer.write(body)
+        await writer.drain()
+        return status
+
+    async def send_image(self, writer, path, method, headers, keep_alive, client_ip):
+        """
+        发送固件，排队等到传输名额后才发送响应头，正文通过loop.sendfile或共享内存映射按调度器分配的速率发送
+
+        返回:
+            tuple: (连接是否可以继续复用, 响应状态码)
+        """
+        image = image_for_client(self.config, client_ip, path)
+        IO.info(t("image_request_received").format(client_ip))
+        if image is None:
+            IO.error(t("firmware_not_found"))
+            await self.send_simple(writer, 404, b"File not found", keep_alive)
+            return keep_alive, 404
+
+        IO.info(t("serving_firmware").format(image.base_path))
+        maps = self.config.get('IMAGE_MAPS')
+        mapped = maps.get(image.base_path) if maps is not None else None
+        with (nullcontext(mapped.file) if mapped is not None else open(image.base_path, 'rb')) as f:
+            size, etag, last_modified = image.validators(f)
+            try:
+                byte_range = None
+                if if_range_matches(headers.get('if-range'), etag, last_modified):
+                    byte_range = parse_range(headers.get('range'), size)
+            except RangeNotSatisfiable:
+                AsyncOtaServer.write_head(writer, 416, [('Content-Range', f'bytes */{size}'), ('Content-Length', '0')], keep_alive)
+                await writer.drain()
+                return keep_alive, 416
+
+            start, end = byte_range or (0, size)
+            status = 206 if byte_range else 200
+            response_headers = [
+                ('Content-Type', 'application/octet-stream'),
+                ('Content-Disposition', 'attachment; filename=image.img'),
+                ('Content-Length', str(end - start)),
+                ('Accept-Ranges', 'bytes'),
+                ('ETag', etag),
+                ('Last-Modified', last_modified)
+            ]
+            if byte_range:
+                response_headers.append(('Content-Range', f'bytes {start}-{end - 1}/{size}'))
+
+            if method == 'HEAD':
+                AsyncOtaServer.write_head(writer, status, response_headers, keep_alive)
+                await writer.drain()
+                return keep_alive, status
+
+            transfer = await self.scheduler.acquire_async(client_ip)
+            try:
+                AsyncOtaServer.write_head(writer, status, response_headers, keep_alive)
+                await writer.drain()
+                sampler = ProgressSampler(self.config.get('PROGRESS_CALLBACK'), size)
+                position = start
+                for offset, length, data in image.pieces(start, end):
+                    if data is not None:
+                        writer.write(data)
+                        await writer.drain()
+                        position += length
+                        continue
+                    piece_end = offset + length
+                    while position < piece_end:
+                        if mapped is not None:
+                            block = min(transfer.block_size(AsyncOtaServer.MAP_BLOCK), piece_end - position)
+                            writer.write(mapped.slice(position, position + block))
+                            await writer.drain()
+                            sent = block
+                        else:
+                            block = transfer.block_size(AsyncOtaServer.SEND_BLOCK)
+                            sent = await self.loop.sendfile(writer.transport, f, position, min(block, piece_end - position))
+                        if sent == 0:
+                            break
+                        position += sent
+                        sampler.update(position)
+                        delay = transfer.pace(sent)
+                        if delay:
+                            await asyncio.sleep(delay)
+                    if position < piece_end:
+                        break
+                sampler.update(position, force=True)
+            finally:
+                self.scheduler.release_async(transfer)
+            return keep_alive and position == end, status
@@ -0,0 +1,190 @@
+import copy
+import json
+import os
+import re
+import threading
+from ..utils import IO, t
+from .check_version import CheckVersionResponse
+from .firmware_cache import link_or_copy
+from .patcher import Patcher
+
+CATALOG_IMAGE_PREFIX = "/images/"
+PRODUCT_PATTERN = re.compile(r'/product/([^/]+)/')
+IMAGE_PATTERN = re.compile(r'^/images/([^/]+)\.img$')
+
+class CatalogEntry:
+    """产品目录中的单个产品，持有该型号的更新数据和已修改的固件"""
+
+    def __init__(self, product_id, product_url, update_data, image_path):
+        """
+        初始化CatalogEntry对象
+
+        参数:
+            product_id (str): 产品ID(checkVersion路径中/product/后的部分)
+            product_url (str): 抓取到的checkVersion路径
+            update_data (dict): 已指向本地固件URL的更新数据
+            image_path (str): 已修改的固件路径
+        """
+        self.product_id = product_id
+        self.product_url = product_url
+        self.update_data = update_data
+        self.image_path = image_path
+        self.prepared = None
+
+    @property
+    def image_route(self):
+        """
+        该产品固件的下载路径
+        """
+        return f"{CATALOG_IMAGE_PREFIX}{self.product_id}.img"
+
+    def response(self):
+        """
+        获取该产品的预序列化checkVersion响应
+
+        返回:
+            CheckVersionResponse: 预序列化响应
+        """
+        if self.prepared is None or self.prepared.source is not self.update_data:
+            self.prepared = CheckVersionResponse(self.update_data)
+        return self.prepared
+
+class ProductCatalog:
+    """
+    多产品固件目录类
+    按checkVersion路径中的产品ID保存多个型号的更新数据和固件，固件通过/images/<产品ID>.img提供，
+    目录保存在磁盘上，长期运行的服务器可以直接加载而无需为每个型号重新抓取和修改
+    """
+    INDEX_FILENAME = "catalog.json"
+
+    def __init__(self, directory, interface_ip=None):
+        """
+        初始化ProductCatalog对象并加载已有目录
+
+        参数:
+            directory (str): 目录所在文件夹
+            interface_ip (str): 提供服务的网卡IP地址，加载时把各产品的固件URL改写为该地址，
+                                默认为None表示保留加入目录时的地址
+        """
+        self.directory = directory
+        self.interface_ip = interface_ip
+        self.lock = threading.Lock()
+        self.entries = {}
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, ProductCatalog.INDEX_FILENAME)
+        self.load()
+
+    @staticmethod
+    def product_id(path):
+        """
+        从checkVersion路径中提取产品ID
+
+        参数:
+            path (str): 请求路径
+
+        返回:
+            str: 产品ID，路径不含/product/<id>/时返回None
+        """
+        match = PRODUCT_PATTERN.search(path or '')
+        return match.group(1) if match else None
+
+    def load(self):
+        """
+        读取目录索引，跳过固件或更新数据已不存在的条目；
+        设置了interface_ip时把固件URL改写为当前网卡地址，热点IP变化后目录仍然可用
+        """
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            IO.warn(t("catalog_load_fail").format(e))
+            return
+        for product_id, item in index.items():
+            image_path = os.path.join(self.directory, item['image'])
+            data_path = os.path.join(self.directory, item['update_data'])
+            if not os.path.exists(image_path) or not os.path.exists(data_path):
+                continue
+            with open(data_path, 'r', encoding='utf-8') as f:
+                update_data = json.load(f)
+            entry = CatalogEntry(product_id, item.get('product_url'), update_data, image_path)
+            if self.interface_ip:
+                Patcher.set_image_url(update_data, f"http://{self.interface_ip}{entry.image_route}")
+            self.entries[product_id] = entry
+
+    def save(self):
+        """
+        原子写回目录索引
+        """
+        index = {
+            product_id: {
+                'product_url': entry.product_url,
+                'image': os.path.basename(entry.image_path),
+                'update_data': f"{product_id}.json"
+            }
+            for product_id, entry in self.entries.items()
+        }
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def add(self, product_url, update_data, image_path, interface_ip):
+        """
+        将一个已修改好的产品加入目录，固件以克隆、硬链接或复制方式放入目录文件夹
+
+        参数:
+            product_url (str): 抓取到的checkVersion路径
+            update_data (dict): 已重新计算哈希的更新数据
+            image_path (str): 已修改的固件路径
+            interface_ip (str): 本地接口IP地址，用于构建固件URL
+
+        返回:
+            CatalogEntry: 目录条目，无法识别产品ID时返回None
+        """
+        product_id = ProductCatalog.product_id(product_url)
+        if product_id is None:
+            IO.warn(t("catalog_no_product").format(product_url))
+            return None
+
+        target = os.path.join(self.directory, f"{product_id}.img")
+        if os.path.abspath(target) != os.path.abspath(image_path):
+            link_or_copy(image_path, target)
+
+        data = copy.deepcopy(update_data)
+        entry = CatalogEntry(product_id, product_url, data, target)
+        Patcher.set_image_url(data, f"http://{interface_ip}{entry.image_route}")
+        with open(os.path.join(self.directory, f"{product_id}.json"), 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+
+        with self.lock:
+            self.entries[product_id] = entry
+            self.save()
+        IO.info(t("catalog_added").format(product_id, len(self.entries)))
+        return entry
+
+    def for_path(self, path):
+        """
+        根据checkVersion路径查找产品
+
+        参数:
+            path (str): 请求路径
+
+        返回:
+            CatalogEntry: 目录条目，未收录时返回None
+        """
+        return self.entries.get(ProductCatalog.product_id(path))
+
+    def for_image(self, path):
+        """
+        根据固件下载路径查找产品
+
+        参数:
+            path (str): 请求路径，形如/images/<产品ID>.img
+
+        返回:
+            CatalogEntry: 目录条目，未收录时返回None
+        """
+        match = IMAGE_PATTERN.match(path or '')
+        return self.entries.get(match.group(1)) if match else None
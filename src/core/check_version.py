@@ -0,0 +1,85 @@
+import gzip
+import hashlib
+import json
+
+class CheckVersionResponse:
+    """
+    预先序列化的checkVersion响应类
+    安装更新数据时一次性生成JSON字节、gzip压缩版本和强ETag，之后每次检查直接返回缓存的字节
+    """
+    GZIP_MIN_SIZE = 256
+
+    def __init__(self, update_data):
+        """
+        初始化CheckVersionResponse对象
+
+        参数:
+            update_data (dict): 更新数据
+        """
+        self.source = update_data
+        # 与jsonify的输出保持一致：键排序、紧凑分隔符、末尾换行
+        self.body = (json.dumps(update_data, sort_keys=True, separators=(',', ':')) + "\n").encode('utf-8')
+        self.etag = '"' + hashlib.sha1(self.body).hexdigest() + '"'
+        self.gzip_body = None
+        if len(self.body) >= CheckVersionResponse.GZIP_MIN_SIZE:
+            self.gzip_body = gzip.compress(self.body, mtime=0)
+        self.gzip_etag = self.etag[:-1] + '-gz"'
+
+    @staticmethod
+    def etag_matches(if_none_match, etags):
+        """
+        判断If-None-Match请求头是否与ETag匹配
+
+        参数:
+            if_none_match (str): If-None-Match请求头，可为None
+            etags (tuple): 当前表示可接受的ETag
+
+        返回:
+            bool: 匹配时返回True
+        """
+        if not if_none_match:
+            return False
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        return '*' in candidates or any(tag in etags for tag in candidates)
+
+    def render(self, accept_gzip=False, if_none_match=None):
+        """
+        选择响应内容
+
+        参数:
+            accept_gzip (bool): 客户端是否接受gzip编码
+            if_none_match (str): If-None-Match请求头
+
+        返回:
+            tuple: (状态码, 响应头列表, 响应体字节)
+        """
+        use_gzip = accept_gzip and self.gzip_body is not None
+        etag = self.gzip_etag if use_gzip else self.etag
+        headers = [('ETag', etag), ('Vary', 'Accept-Encoding')]
+        if CheckVersionResponse.etag_matches(if_none_match, (self.etag, self.gzip_etag)):
+            return 304, headers, b''
+        headers.append(('Content-Type', 'application/json'))
+        if use_gzip:
+            headers.append(('Content-Encoding', 'gzip'))
+            return 200, headers, self.gzip_body
+        return 200, headers, self.body
+
+    @staticmethod
+    def for_config(config):
+        """
+        获取应用配置中的预序列化响应，更新数据对象被替换后自动重新生成
+
+        参数:
+            config (dict): Flask应用配置
+
+        返回:
+            CheckVersionResponse: 预序列化响应，未配置更新数据时返回None
+        """
+        update_data = config.get('UPDATE_DATA')
+        if not update_data:
+            return None
+        prepared = config.get('CHECK_VERSION_RESPONSE')
+        if prepared is None or prepared.source is not update_data:
+            prepared = CheckVersionResponse(update_data)
+            config['CHECK_VERSION_RESPONSE'] = prepared
+        return prepared
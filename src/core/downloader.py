@@ -1,15 +1,238 @@
 import requests
+import copy
 import json
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from ..utils import IO, t
+from .hasher import DigestEngine
+from .scanner import SignatureScanner
+from .response_cache import ResponseCache
+from .singleflight import SingleFlight
+from .firmware_cache import link_or_copy
 
-def get_update_data(product_url, request_body):
+# 进程内共享的合并器，同一产品的并发更新检查和同一固件的并发下载只访问一次上游
+update_flights = SingleFlight("checkVersion")
+download_flights = SingleFlight("download")
+
+class UpstreamClient:
+    """上游HTTP客户端类，持有带连接池、超时和重试策略的共享requests.Session，复用已建立的连接"""
+    CONNECT_TIMEOUT = 10
+    READ_TIMEOUT = 60
+    POOL_SIZE = 16
+    RETRIES = 3
+    BACKOFF_FACTOR = 0.5
+
+    default_client = None
+    default_lock = threading.Lock()
+
+    def __init__(self, pool_size=None, connect_timeout=None, read_timeout=None, retries=None):
+        """
+        初始化UpstreamClient对象
+        
+        参数:
+            pool_size (int): 每个主机的连接池大小，默认为POOL_SIZE
+            connect_timeout (float): 连接超时(秒)，默认为CONNECT_TIMEOUT
+            read_timeout (float): 读取超时(秒)，默认为READ_TIMEOUT
+            retries (int): 连接失败和5xx/429响应的重试次数，默认为RETRIES
+        """
+        pool_size = pool_size or UpstreamClient.POOL_SIZE
+        self.timeout = (connect_timeout or UpstreamClient.CONNECT_TIMEOUT, read_timeout or UpstreamClient.READ_TIMEOUT)
+
+        retry = Retry(
+            total=UpstreamClient.RETRIES if retries is None else retries,
+            backoff_factor=UpstreamClient.BACKOFF_FACTOR,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["HEAD", "GET", "POST"]),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @staticmethod
+    def get_default():
+        """
+        获取进程内共享的默认客户端
+        
+        返回:
+            UpstreamClient: 默认客户端
+        """
+        with UpstreamClient.default_lock:
+            if UpstreamClient.default_client is None:
+                UpstreamClient.default_client = UpstreamClient()
+            return UpstreamClient.default_client
+
+    def get(self, url, **kwargs):
+        """
+        发送GET请求
+        
+        参数:
+            url (str): 请求URL
+            **kwargs: 传递给requests的其他参数
+        
+        返回:
+            Response: 响应对象
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def head(self, url, **kwargs):
+        """
+        发送HEAD请求
+        
+        参数:
+            url (str): 请求URL
+            **kwargs: 传递给requests的其他参数
+        
+        返回:
+            Response: 响应对象
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.head(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """
+        发送POST请求
+        
+        参数:
+            url (str): 请求URL
+            **kwargs: 传递给requests的其他参数
+        
+        返回:
+            Response: 响应对象
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.post(url, **kwargs)
+
+class DownloadPipeline:
+    """下载流水线类，在下载过程中对每个数据块计算摘要并扫描密码特征"""
+    def __init__(self, expected_md5=None, expected_sha1=None, segment_md5=None):
+        """
+        初始化DownloadPipeline对象
+        
+        参数:
+            expected_md5 (str): 上游提供的整文件MD5
+            expected_sha1 (str): 上游提供的整文件SHA1
+            segment_md5 (list): 上游提供的分段信息列表，每项包含startpos、endpos和md5
+        """
+        self.expected_md5 = expected_md5
+        self.expected_sha1 = expected_sha1
+        self.segment_md5 = segment_md5 or []
+        self.reset()
+
+    def reset(self):
+        """
+        清空已输入的数据，重新开始计算
+        """
+        self.engine = DigestEngine([(item['startpos'], item['endpos']) for item in self.segment_md5])
+        self.scanner = SignatureScanner()
+        self.digests = None
+        self.patterns = None
+        self.complete = False
+        self.segments_verified = False
+
+    @staticmethod
+    def from_update_data(update_data):
+        """
+        根据更新数据创建下载流水线
+        
+        参数:
+            update_data (dict): 上游返回的更新数据
+        
+        返回:
+            DownloadPipeline: 下载流水线对象
+        """
+        version_data = update_data['data']['version']
+        segment_md5 = version_data.get('segmentMd5') or []
+        if isinstance(segment_md5, str):
+            segment_md5 = json.loads(segment_md5)
+        return DownloadPipeline(version_data.get('md5sum'), version_data.get('sha'), segment_md5)
+
+    def update(self, chunk):
+        """
+        处理下一个下载的数据块
+        
+        参数:
+            chunk (bytes): 数据块
+        """
+        self.engine.update(chunk)
+        self.scanner.update(chunk)
+
+    def update_from_file(self, path, length=None):
+        """
+        从已写入磁盘的文件顺序读取数据输入流水线
+        
+        参数:
+            path (str): 文件路径
+            length (int): 读取的字节数，默认为None表示读取整个文件
+        """
+        remaining = length
+        with open(path, 'rb') as f:
+            while remaining is None or remaining > 0:
+                size = DigestEngine.CHUNK_SIZE if remaining is None else min(DigestEngine.CHUNK_SIZE, remaining)
+                chunk = f.read(size)
+                if not chunk:
+                    break
+                self.update(chunk)
+                if remaining is not None:
+                    remaining -= len(chunk)
+
+    def finish(self):
+        """
+        结束下载并校验摘要
+        
+        返回:
+            bool: 摘要与上游一致（或上游未提供）时返回True
+        """
+        self.digests = self.engine.result()
+        self.patterns = self.scanner.patterns()
+        self.complete = True
+
+        ok = True
+        if self.expected_md5 and self.expected_md5.lower() != self.digests.md5:
+            IO.error(t("download_digest_mismatch").format("MD5", self.expected_md5, self.digests.md5))
+            ok = False
+        if self.expected_sha1 and self.expected_sha1.lower() != self.digests.sha1:
+            IO.error(t("download_digest_mismatch").format("SHA1", self.expected_sha1, self.digests.sha1))
+            ok = False
+
+        self.segments_verified = bool(self.segment_md5) and all(
+            item.get('md5') and item['md5'].lower() == md5
+            for item, md5 in zip(self.segment_md5, self.digests.segment_md5)
+        )
+        if ok:
+            IO.info(t("download_verified"))
+        return ok
+
+    def record(self, index_cache, filename):
+        """
+        将下载时得到的特征偏移和已校验的分段MD5写入索引缓存，后续修改步骤无需再次读取整个文件
+        
+        参数:
+            index_cache (SignatureIndexCache): 索引缓存对象
+            filename (str): 下载的文件路径
+        """
+        if not self.complete or index_cache is None:
+            return
+        index_cache.store_patterns(filename, self.patterns, md5sum=self.expected_md5)
+        if self.segments_verified:
+            index_cache.store_segments(self.expected_md5, self.segment_md5)
+
+def get_update_data(product_url, request_body, client=None, response_cache=None, flights=None):
     """
     重新发送OTA检查请求以获取更新信息
     
     参数:
         product_url (str): 产品URL路径
         request_body (dict): 请求体数据
+        client (UpstreamClient): 上游客户端，默认为共享客户端
+        response_cache (ResponseCache): 可选，checkVersion响应的录制/回放缓存
+        flights (SingleFlight): 请求合并器，默认为update_flights
     
     返回:
         dict: 更新信息数据，失败返回None
@@ -29,30 +252,426 @@ def get_update_data(product_url, request_body):
     if 'version' in request_body:
         IO.info(t("force_version").format(request_body['version']))
         request_body['version'] = "99.99.90"
+
+    if response_cache is not None:
+        data = response_cache.lookup(product_url, request_body)
+        if data is not None:
+            return data
+        if response_cache.mode == 'replay':
+            IO.error(t("response_cache_replay_miss").format(product_url))
+            return None
+
+    client = client or UpstreamClient.get_default()
         
-    try:
-        IO.debug(t("request_body_log").format(json.dumps(request_body)))
-        response = requests.post(url, json=request_body, headers=headers)
+    def fetch():
+        try:
+            IO.debug(t("request_body_log").format(json.dumps(request_body)))
+            response = client.post(url, json=request_body, headers=headers)
+            
+            if response.status_code != 200:
+                 IO.error(t("server_status_error").format(response.status_code, response.text))
+                 response.raise_for_status()
+            
+            data = response.json()
+            IO.debug(t("update_info_received").format(json.dumps(data)[:200]))
+        except Exception as e:
+            IO.error(t("get_update_fail").format(e))
+            return None
+        if response_cache is not None:
+            # 录制失败不影响本次已成功获取的更新信息
+            try:
+                response_cache.store(product_url, request_body, data)
+            except Exception as e:
+                IO.warn(t("response_cache_store_fail").format(e))
+        return data
+
+    # 同一产品的并发请求只向上游发送一次，各调用方随后会分别修改结果，因此每方各得一份副本
+    flights = flights or update_flights
+    data, shared = flights.do((product_url, ResponseCache.normalize(request_body)), fetch)
+    return copy.deepcopy(data) if data is not None else None
+
+def coalescing_stats():
+    """
+    获取更新检查和固件下载的请求合并统计
+    
+    返回:
+        dict: 键为'checkVersion'和'download'，值为SingleFlight.get_stats的结果
+    """
+    return {'checkVersion': update_flights.get_stats(), 'download': download_flights.get_stats()}
+
+def log_coalescing_stats():
+    """
+    输出请求合并统计信息
+    """
+    stats = coalescing_stats()
+    IO.debug(t("request_coalesced_stats").format(
+        stats['checkVersion']['coalesced'], stats['checkVersion']['executed'],
+        stats['download']['coalesced'], stats['download']['executed']))
+
+class RangeNotSupported(Exception):
+    """服务器不支持分段请求时抛出的异常"""
+    pass
+
+def report_progress(downloaded, total_length, progress_callback=None):
+    """
+    报告下载进度
+    
+    参数:
+        downloaded (int): 已下载字节数
+        total_length (int): 总字节数
+        progress_callback (function): 进度回调函数，为None时在控制台输出进度
+    """
+    if total_length <= 0:
+        return
+    if progress_callback:
+        progress_callback(downloaded, total_length)
+    else:
+        percentage = (downloaded / total_length) * 100
+        print(f"\r{t('download_progress').format(percentage, downloaded, total_length)}", end="")
+
+class DownloadJournal:
+    """断点续传日志类，记录.part文件中已完成的字节范围和服务器校验信息"""
+    CHECKPOINT_BYTES = 8 * 1024 * 1024
+
+    def __init__(self, path, validator=None, ranges=None):
+        """
+        初始化DownloadJournal对象
         
-        if response.status_code != 200:
-             IO.error(t("server_status_error").format(response.status_code, response.text))
-             response.raise_for_status()
+        参数:
+            path (str): 日志文件路径
+            validator (dict): 服务器校验信息，包含etag、last_modified和content_length
+            ranges (list): 已完成的字节范围列表，每项为[start, end)
+        """
+        self.path = path
+        self.validator = validator or {}
+        self.ranges = ranges or []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def load(path):
+        """
+        读取日志文件，不存在或损坏时返回空日志
         
-        data = response.json()
-        IO.debug(t("update_info_received").format(json.dumps(data)[:200]))
-        return data
+        参数:
+            path (str): 日志文件路径
+        
+        返回:
+            DownloadJournal: 日志对象
+        """
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return DownloadJournal(path, data.get('validator'), [tuple(r) for r in data.get('ranges', [])])
+        except Exception:
+            return DownloadJournal(path)
+
+    def matches(self, validator):
+        """
+        检查日志记录的校验信息是否与服务器当前返回的一致
+        没有ETag和Last-Modified时无法确认上游文件未变，也无法发送If-Range，不允许续传
+        
+        参数:
+            validator (dict): 服务器当前的校验信息
+        
+        返回:
+            bool: 一致时返回True
+        """
+        if not self.validator or not self.ranges:
+            return False
+        if not any(validator.get(key) for key in ('etag', 'last_modified')):
+            return False
+        if self.validator.get('content_length') != validator.get('content_length'):
+            return False
+        for key in ('etag', 'last_modified'):
+            if self.validator.get(key) != validator.get(key):
+                return False
+        return True
+
+    def add(self, start, end):
+        """
+        记录一个已完成的字节范围并合并相邻范围，随后写回磁盘
+        
+        参数:
+            start (int): 起始位置
+            end (int): 结束位置（不含）
+        """
+        with self.lock:
+            merged = []
+            for s, e in sorted(self.ranges + [(start, end)]):
+                if merged and s <= merged[-1][1]:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+                else:
+                    merged.append((s, e))
+            self.ranges = merged
+            self.save()
+
+    def completed(self):
+        """
+        获取已完成的字节数
+        
+        返回:
+            int: 已完成的字节数
+        """
+        return sum(e - s for s, e in self.ranges)
+
+    def prefix(self):
+        """
+        获取从文件开头起连续完成的字节数
+        
+        返回:
+            int: 连续完成的字节数
+        """
+        if self.ranges and self.ranges[0][0] == 0:
+            return self.ranges[0][1]
+        return 0
+
+    def missing(self, total_length):
+        """
+        获取尚未完成的字节范围
+        
+        参数:
+            total_length (int): 文件大小
+        
+        返回:
+            list: 未完成的字节范围列表，每项为(start, end)，end不含
+        """
+        result = []
+        position = 0
+        for s, e in self.ranges:
+            if s > position:
+                result.append((position, s))
+            position = max(position, e)
+        if position < total_length:
+            result.append((position, total_length))
+        return result
+
+    def save(self):
+        """
+        原子写回日志文件
+        """
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'validator': self.validator, 'ranges': self.ranges}, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        """
+        删除日志文件
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def probe(url, client):
+    """
+    探测服务器上的文件信息
+    
+    参数:
+        url (str): 下载URL
+        client (UpstreamClient): 上游客户端
+    
+    返回:
+        dict: 包含content_length、accept_ranges、etag和last_modified的字典，失败返回None
+    """
+    try:
+        r = client.head(url, allow_redirects=True)
+        if r.status_code != 200:
+            return None
+        return {
+            'content_length': int(r.headers.get('content-length', 0)),
+            'accept_ranges': r.headers.get('accept-ranges', '').lower() == 'bytes',
+            'etag': r.headers.get('etag'),
+            'last_modified': r.headers.get('last-modified')
+        }
     except Exception as e:
-        IO.error(t("get_update_fail").format(e))
+        IO.debug(t("range_probe_fail").format(e))
         return None
 
-def download_file(url, filename, progress_callback=None):
+def if_range_header(validator):
+    """
+    根据校验信息构造If-Range请求头，保证续传时服务器文件未变化
+
+    参数:
+        validator (dict): 服务器校验信息
+
+    返回:
+        dict: 请求头字典
+    """
+    value = validator.get('etag') or validator.get('last_modified')
+    return {"If-Range": value} if value else {}
+
+def sync_file(f):
+    """
+    将文件内容刷新到磁盘，之后才能在日志中记录这部分数据已完成
+
+    参数:
+        f: 文件对象
+    """
+    f.flush()
+    os.fsync(f.fileno())
+
+def download_stream(client, url, part_path, journal, progress_callback=None, pipeline=None):
+    """
+    使用单个连接流式下载文件，日志中有连续完成的前缀时从该位置续传
+    
+    参数:
+        client (UpstreamClient): 上游客户端
+        url (str): 下载URL
+        part_path (str): .part文件路径
+        journal (DownloadJournal): 断点续传日志
+        progress_callback (function): 进度回调函数
+        pipeline (DownloadPipeline): 可选，下载流水线
+    """
+    offset = journal.prefix() if os.path.exists(part_path) else 0
+    if offset > 0 and offset == journal.validator.get('content_length'):
+        IO.info(t("download_resuming").format(offset))
+        if pipeline:
+            pipeline.update_from_file(part_path)
+        return
+
+    headers = {}
+    if offset > 0:
+        headers = {"Range": f"bytes={offset}-"}
+        headers.update(if_range_header(journal.validator))
+
+    with client.get(url, headers=headers, stream=True) as r:
+        r.raise_for_status()
+        if offset > 0 and r.status_code == 206:
+            IO.info(t("download_resuming").format(offset))
+            total_length = offset + int(r.headers.get('content-length', 0))
+            f = open(part_path, 'r+b')
+            if pipeline:
+                pipeline.update_from_file(part_path, offset)
+            f.seek(offset)
+            f.truncate()
+        else:
+            offset = 0
+            journal.ranges = []
+            total_length = int(r.headers.get('content-length', 0))
+            f = open(part_path, 'wb')
+
+        with f:
+            downloaded = offset
+            checkpoint = offset
+            for chunk in r.iter_content(chunk_size=65536): 
+                f.write(chunk)
+                if pipeline:
+                    pipeline.update(chunk)
+                downloaded += len(chunk)
+                if downloaded - checkpoint >= DownloadJournal.CHECKPOINT_BYTES:
+                    sync_file(f)
+                    journal.add(0, downloaded)
+                    checkpoint = downloaded
+                report_progress(downloaded, total_length, progress_callback)
+            sync_file(f)
+            journal.add(0, downloaded)
+
+        if total_length and downloaded != total_length:
+            raise IOError(t("range_incomplete").format(0, total_length - 1, downloaded))
+
+def download_ranged(client, url, part_path, journal, total_length, connections, progress_callback=None):
+    """
+    使用多个连接并发下载文件中尚未完成的字节范围，直接写入预分配文件的对应偏移
+    
+    参数:
+        client (UpstreamClient): 上游客户端
+        url (str): 下载URL
+        part_path (str): .part文件路径
+        journal (DownloadJournal): 断点续传日志
+        total_length (int): 文件大小
+        connections (int): 并发连接数
+        progress_callback (function): 进度回调函数
+    """
+    if not os.path.exists(part_path) or os.path.getsize(part_path) != total_length:
+        journal.ranges = []
+        with open(part_path, 'wb') as f:
+            f.truncate(total_length)
+    elif journal.ranges:
+        IO.info(t("download_resuming").format(journal.completed()))
+
+    # 分块数多于连接数，让较快的连接多承担一些范围
+    piece_size = max(1024 * 1024, -(-total_length // (connections * 4)))
+    pieces = []
+    for start, end in journal.missing(total_length):
+        for piece_start in range(start, end, piece_size):
+            pieces.append((piece_start, min(piece_start + piece_size, end) - 1))
+
+    lock = threading.Lock()
+    state = {'downloaded': journal.completed()}
+
+    def fetch(piece):
+        start, end = piece
+        headers = {"Range": f"bytes={start}-{end}"}
+        headers.update(if_range_header(journal.validator))
+        with client.get(url, headers=headers, stream=True) as r:
+            if r.status_code != 206:
+                raise RangeNotSupported(r.status_code)
+            with open(part_path, 'r+b') as f:
+                f.seek(start)
+                written = 0
+                for chunk in r.iter_content(chunk_size=65536):
+                    chunk = chunk[:end - start + 1 - written]
+                    f.write(chunk)
+                    written += len(chunk)
+                    with lock:
+                        state['downloaded'] += len(chunk)
+                        report_progress(state['downloaded'], total_length, progress_callback)
+                sync_file(f)
+            if written != end - start + 1:
+                raise IOError(t("range_incomplete").format(start, end, written))
+            journal.add(start, end + 1)
+
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        for future in [executor.submit(fetch, piece) for piece in pieces]:
+            future.result()
+
+def fetch_from_cache(cache, url, filename, pipeline=None):
+    """
+    尝试从本地固件缓存提供文件
+    
+    参数:
+        cache (FirmwareCache): 固件缓存
+        url (str): 下载URL
+        filename (str): 保存文件名
+        pipeline (DownloadPipeline): 可选，下载流水线
+    
+    返回:
+        bool: 命中且校验通过时返回True
+    """
+    md5sum = pipeline.expected_md5 if pipeline else None
+    sha = pipeline.expected_sha1 if pipeline else None
+    entry = cache.lookup(md5sum, sha, url)
+    if entry is None:
+        return False
+    if not cache.verify(entry):
+        IO.warn(t("firmware_cache_corrupt").format(entry['file']))
+        cache.invalidate(entry)
+        return False
+
+    cache.materialize(entry, filename)
+    if pipeline:
+        pipeline.update_from_file(filename)
+        if not pipeline.finish():
+            os.remove(filename)
+            cache.invalidate(entry)
+            pipeline.reset()
+            return False
+    return True
+
+def download_file(url, filename, progress_callback=None, pipeline=None, connections=1, cache=None, client=None, flights=None):
     """
     下载文件并显示进度条
+    同一URL已有进行中的下载时等待其完成并共享结果，不再重复下载；
+    只有保存到不同文件的调用方共享下载(各自得到一份副本)，保存到同一文件的并发调用失败
     
     参数:
         url (str): 下载URL
         filename (str): 保存文件名
         progress_callback (function): 进度回调函数，接收(current, total)参数
+        pipeline (DownloadPipeline): 可选，对下载数据边下载边计算摘要和扫描特征
+        connections (int): 并发连接数，大于1且服务器支持分段请求时启用多连接下载，默认为1
+        cache (FirmwareCache): 可选，本地固件缓存，命中时不访问网络
+        client (UpstreamClient): 上游客户端，默认为共享客户端
+        flights (SingleFlight): 下载合并器，默认为download_flights
     
     返回:
         bool: 下载是否成功
@@ -63,29 +682,113 @@ def download_file(url, filename, progress_callback=None):
             IO.info(t("using_existing"))
             return True
 
+    def fetch():
+        return fetch_firmware(url, filename, progress_callback, pipeline, connections, cache, client), filename
+
+    flights = flights or download_flights
+    (ok, path), shared = flights.do(url, fetch)
+    if not shared:
+        return ok
+    if os.path.abspath(path) == os.path.abspath(filename):
+        # 同一目标文件只有一份，下载方随后会原地修改它，本调用方不能再校验或修改同一文件
+        IO.error(t("download_target_busy").format(filename))
+        return False
+    return adopt_download(path, filename, ok, pipeline)
+
+def adopt_download(path, filename, ok, pipeline=None):
+    """
+    使用并发调用方已完成的下载结果
+    
+    参数:
+        path (str): 已下载的文件路径
+        filename (str): 本调用方的保存文件名，必须与path不同
+        ok (bool): 共享的下载是否成功
+        pipeline (DownloadPipeline): 可选，本调用方的下载流水线
+    
+    返回:
+        bool: 是否成功得到已校验的文件
+    """
+    if not ok:
+        return False
+    # 修改密码前replace_hash会断开硬链接，不会影响另一方的文件
+    link_or_copy(path, filename)
+    if pipeline:
+        pipeline.update_from_file(filename)
+        return pipeline.finish()
+    return True
+
+def fetch_firmware(url, filename, progress_callback=None, pipeline=None, connections=1, cache=None, client=None):
+    """
+    从本地缓存或上游获取固件
+    数据先写入filename.part，并在filename.part.json中记录已完成的范围，中断后再次运行时
+    使用Range请求续传；下载完成且摘要校验通过后才原子重命名为filename
+    
+    参数:
+        url (str): 下载URL
+        filename (str): 保存文件名
+        progress_callback (function): 进度回调函数，接收(current, total)参数
+        pipeline (DownloadPipeline): 可选，对下载数据边下载边计算摘要和扫描特征
+        connections (int): 并发连接数，大于1且服务器支持分段请求时启用多连接下载，默认为1
+        cache (FirmwareCache): 可选，本地固件缓存，命中时不访问网络
+        client (UpstreamClient): 上游客户端，默认为共享客户端
+    
+    返回:
+        bool: 下载是否成功
+    """
+    if cache is not None:
+        hit = fetch_from_cache(cache, url, filename, pipeline)
+        stats = cache.get_stats()
+        IO.info(t("firmware_cache_stats").format(stats['hits'], stats['misses'], stats['entries'], stats['bytes']))
+        if hit:
+            return True
+
     IO.info(t("downloading_url").format(url))
+
+    client = client or UpstreamClient.get_default()
+    part_path = filename + ".part"
+    journal = DownloadJournal.load(part_path + ".json")
     
     try:
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            total_length = int(r.headers.get('content-length', 0))
-            
-            with open(filename, 'wb') as f:
-                downloaded = 0
-                for chunk in r.iter_content(chunk_size=8192): 
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    if total_length > 0:
-                        if progress_callback:
-                            progress_callback(downloaded, total_length)
-                        else:
-                            percentage = (downloaded / total_length) * 100
-                            print(f"\r{t('download_progress').format(percentage, downloaded, total_length)}", end="")
+        info = probe(url, client) or {}
+        validator = {k: info.get(k) for k in ('content_length', 'etag', 'last_modified')}
+        if not journal.matches(validator) or not os.path.exists(part_path):
+            journal.ranges = []
+        journal.validator = validator
+
+        total_length = info.get('content_length', 0)
+        ranged = False
+        if connections > 1 and info.get('accept_ranges') and total_length > 0:
+            IO.info(t("ranged_download").format(connections))
+            try:
+                download_ranged(client, url, part_path, journal, total_length, connections, progress_callback)
+                ranged = True
+            except RangeNotSupported:
+                IO.warn(t("range_fallback"))
+
+        if not ranged:
+            download_stream(client, url, part_path, journal, progress_callback, pipeline)
+        elif pipeline:
+            # 分段数据乱序到达，下载完成后从刚写入的页缓存顺序读取一次
+            pipeline.update_from_file(part_path)
         
         if not progress_callback:
             print()
         IO.info(t("download_complete"))
+        if pipeline and not pipeline.finish():
+            os.remove(part_path)
+            journal.remove()
+            return False
+
+        os.replace(part_path, filename)
+        journal.remove()
+
+        if cache is not None:
+            cache.store(filename, pipeline.expected_md5 if pipeline else None, pipeline.expected_sha1 if pipeline else None, url)
         return True
     except Exception as e:
+        if not progress_callback:
+            print()
         IO.error(t("download_fail").format(e))
+        if os.path.exists(part_path):
+            IO.info(t("download_resumable").format(part_path))
         return False
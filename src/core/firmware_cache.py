@@ -0,0 +1,292 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from ..utils import IO, t
+
+# Linux FICLONE ioctl，在支持的文件系统(btrfs/xfs等)上创建写时复制克隆
+FICLONE = 0x40049409
+
+def clone_file(src, dst):
+    """
+    尝试以写时复制方式克隆文件
+
+    参数:
+        src (str): 源文件路径
+        dst (str): 目标文件路径
+
+    返回:
+        bool: 克隆成功时返回True
+    """
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        return False
+
+def link_or_copy(src, dst, allow_hardlink=True):
+    """
+    以最低代价得到src的一份内容：写时复制克隆、硬链接或完整复制
+
+    参数:
+        src (str): 源文件路径
+        dst (str): 目标文件路径
+        allow_hardlink (bool): 是否允许使用硬链接
+
+    返回:
+        str: 使用的方式，'clone'、'hardlink'或'copy'
+    """
+    if os.path.exists(dst):
+        os.remove(dst)
+    if clone_file(src, dst):
+        return 'clone'
+    if allow_hardlink:
+        try:
+            os.link(src, dst)
+            return 'hardlink'
+        except OSError:
+            pass
+    shutil.copyfile(src, dst)
+    return 'copy'
+
+class FirmwareCache:
+    """
+    按内容寻址的本地固件缓存类
+    以上游md5sum/sha为键保存已校验的固件，下载前先查找缓存，命中时通过克隆或硬链接提供文件，
+    按最近使用时间在字节预算内淘汰。
+    上游没有给出摘要时以下载URL为键，并记录存入时文件的MD5，命中后先校验缓存文件未损坏再使用
+    """
+    INDEX_FILENAME = "index.json"
+    DEFAULT_BUDGET = 4 * 1024 * 1024 * 1024
+
+    def __init__(self, directory, budget=None):
+        """
+        初始化FirmwareCache对象
+
+        参数:
+            directory (str): 缓存目录
+            budget (int): 缓存占用的字节上限，默认为DEFAULT_BUDGET
+        """
+        self.directory = directory
+        self.budget = budget or FirmwareCache.DEFAULT_BUDGET
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, FirmwareCache.INDEX_FILENAME)
+        self.entries = {}
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'bytes_served': 0}
+        self.load()
+
+    @staticmethod
+    def make_key(md5sum=None, sha=None, url=None):
+        """
+        根据上游摘要生成缓存键，摘要均未知时使用URL
+
+        参数:
+            md5sum (str): 上游MD5
+            sha (str): 上游SHA1
+            url (str): 下载URL
+
+        返回:
+            str: 缓存键，摘要和URL均未知时返回None
+        """
+        if md5sum or sha:
+            return f"{(md5sum or '').lower()}-{(sha or '').lower()}"
+        if url:
+            return "url-" + hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return None
+
+    @staticmethod
+    def file_md5(path):
+        """
+        计算文件的MD5
+
+        参数:
+            path (str): 文件路径
+
+        返回:
+            str: 十六进制MD5
+        """
+        md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                md5.update(block)
+        return md5.hexdigest()
+
+    def load(self):
+        """
+        读取缓存索引并丢弃文件已不存在的条目
+        """
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.entries = data.get('entries', {})
+            self.stats.update(data.get('stats', {}))
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            IO.warn(t("firmware_cache_load_fail").format(e))
+            return
+        for key in list(self.entries):
+            if not os.path.exists(os.path.join(self.directory, self.entries[key]['file'])):
+                del self.entries[key]
+
+    def save(self):
+        """
+        原子写回缓存索引
+        """
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'entries': self.entries, 'stats': self.stats}, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def lookup(self, md5sum=None, sha=None, url=None):
+        """
+        查找缓存条目，摘要已知时按摘要匹配，摘要未知时按URL匹配
+
+        参数:
+            md5sum (str): 上游MD5
+            sha (str): 上游SHA1
+            url (str): 下载URL
+
+        返回:
+            dict: 缓存条目，未命中返回None
+        """
+        with self.lock:
+            key = FirmwareCache.make_key(md5sum, sha, url)
+            entry = self.entries.get(key) if key else None
+            if entry is None:
+                self.stats['misses'] += 1
+                self.save()
+                return None
+            entry['last_used'] = time.time()
+            self.stats['hits'] += 1
+            self.stats['bytes_served'] += entry['size']
+            self.save()
+            return dict(entry)
+
+    def verify(self, entry):
+        """
+        校验按URL缓存的条目，文件MD5须与存入时记录的一致(按摘要缓存的条目由下载流水线校验)
+
+        参数:
+            entry (dict): lookup返回的缓存条目
+
+        返回:
+            bool: 校验通过或无需校验时返回True
+        """
+        if not entry.get('file_md5'):
+            return True
+        try:
+            return FirmwareCache.file_md5(os.path.join(self.directory, entry['file'])) == entry['file_md5']
+        except OSError:
+            return False
+
+    def materialize(self, entry, target, allow_hardlink=True):
+        """
+        将缓存中的固件提供到目标路径
+
+        参数:
+            entry (dict): lookup返回的缓存条目
+            target (str): 目标路径
+            allow_hardlink (bool): 是否允许使用硬链接
+
+        返回:
+            str: 使用的方式，'clone'、'hardlink'或'copy'
+        """
+        method = link_or_copy(os.path.join(self.directory, entry['file']), target, allow_hardlink)
+        IO.info(t("firmware_cache_hit").format(entry['file'], method))
+        return method
+
+    def store(self, path, md5sum=None, sha=None, url=None):
+        """
+        将已校验的固件加入缓存并按字节预算淘汰旧条目，上游没有摘要时按URL存入并记录文件MD5
+
+        参数:
+            path (str): 已下载并校验的固件路径
+            md5sum (str): 上游MD5
+            sha (str): 上游SHA1
+            url (str): 下载URL
+        """
+        key = FirmwareCache.make_key(md5sum, sha, url)
+        if key is None:
+            return
+        size = os.path.getsize(path)
+        if size > self.budget:
+            return
+        file_md5 = None if md5sum or sha else FirmwareCache.file_md5(path)
+        with self.lock:
+            filename = f"{key}.img"
+            if key not in self.entries:
+                link_or_copy(path, os.path.join(self.directory, filename))
+                self.stats['stores'] += 1
+            self.entries[key] = {
+                'file': filename,
+                'size': size,
+                'url': url,
+                'md5sum': md5sum,
+                'sha': sha,
+                'file_md5': file_md5,
+                'last_used': time.time()
+            }
+            self.evict(keep=key)
+            self.save()
+
+    def invalidate(self, entry):
+        """
+        删除校验失败的缓存条目
+
+        参数:
+            entry (dict): lookup返回的缓存条目
+        """
+        with self.lock:
+            key = FirmwareCache.make_key(entry.get('md5sum'), entry.get('sha'), entry.get('url'))
+            if self.entries.pop(key, None) is not None:
+                try:
+                    os.remove(os.path.join(self.directory, entry['file']))
+                except OSError:
+                    pass
+                self.save()
+
+    def evict(self, keep=None):
+        """
+        按最近使用时间淘汰条目，直到总大小不超过字节预算
+
+        参数:
+            keep (str): 不参与淘汰的缓存键
+        """
+        total = sum(e['size'] for e in self.entries.values())
+        for key in sorted(self.entries, key=lambda k: self.entries[k]['last_used']):
+            if total <= self.budget:
+                break
+            if key == keep:
+                continue
+            entry = self.entries.pop(key)
+            try:
+                os.remove(os.path.join(self.directory, entry['file']))
+            except OSError:
+                pass
+            total -= entry['size']
+            self.stats['evictions'] += 1
+            IO.debug(t("firmware_cache_evicted").format(entry['file']))
+
+    def get_stats(self):
+        """
+        获取缓存统计信息
+
+        返回:
+            dict: 包含命中、未命中、写入、淘汰次数以及条目数和占用字节数
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats['entries'] = len(self.entries)
+            stats['bytes'] = sum(e['size'] for e in self.entries.values())
+            return stats
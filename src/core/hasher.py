@@ -0,0 +1,293 @@
+import bisect
+import hashlib
+import os
+import queue
+import threading
+
+class DigestResult:
+    """摘要计算结果类，用于存储整文件和各分段的哈希值"""
+    def __init__(self, md5=None, sha1=None, segment_md5=None, size=0):
+        """
+        初始化DigestResult对象
+
+        参数:
+            md5 (str): 整文件MD5哈希值
+            sha1 (str): 整文件SHA1哈希值
+            segment_md5 (list): 各分段MD5哈希值，顺序与输入分段一致
+            size (int): 已计算的字节数
+        """
+        self.md5 = md5
+        self.sha1 = sha1
+        self.segment_md5 = segment_md5 or []
+        self.size = size
+
+class SegmentIndex:
+    """分段区间索引类，用于快速查找与给定字节范围重叠的分段"""
+    def __init__(self, segments):
+        """
+        初始化SegmentIndex对象
+
+        参数:
+            segments (list): 分段列表，每项为(start, end)元组，区间为[start, end)
+        """
+        self.segments = [(int(start), int(end)) for start, end in segments]
+        self.order = sorted(range(len(self.segments)), key=lambda i: self.segments[i][0])
+        self.starts = [self.segments[i][0] for i in self.order]
+
+        # max_ends[k] 为排序后前k+1个分段的最大结束位置，用于提前终止向前扫描
+        self.max_ends = []
+        current = None
+        for i in self.order:
+            end = self.segments[i][1]
+            current = end if current is None else max(current, end)
+            self.max_ends.append(current)
+
+    def overlapping(self, start, end):
+        """
+        查找与[start, end)重叠的分段
+
+        参数:
+            start (int): 起始位置
+            end (int): 结束位置
+
+        返回:
+            list: 重叠分段在原列表中的下标，按下标排序
+        """
+        result = []
+        k = bisect.bisect_left(self.starts, end) - 1
+        while k >= 0 and self.max_ends[k] > start:
+            index = self.order[k]
+            seg_start, seg_end = self.segments[index]
+            if seg_end > start and seg_end > seg_start:
+                result.append(index)
+            k -= 1
+        return sorted(result)
+
+    def dirty(self, ranges):
+        """
+        查找被任意修改范围触及的分段
+
+        参数:
+            ranges (list): 修改范围列表，每项为(start, end)元组
+
+        返回:
+            list: 受影响分段的下标，按下标排序
+        """
+        result = set()
+        for start, end in ranges:
+            result.update(self.overlapping(start, end))
+        return sorted(result)
+
+class DigestEngine:
+    """单遍多摘要计算引擎，顺序读取一次数据同时计算整文件MD5、SHA1和所有分段MD5"""
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, segments=None, md5=True, sha1=True):
+        """
+        初始化DigestEngine对象
+
+        参数:
+            segments (list): 分段列表，每项为(start, end)元组，区间为[start, end)，
+                             允许重叠和无序
+            md5 (bool): 是否计算整文件MD5，默认为True
+            sha1 (bool): 是否计算整文件SHA1，默认为True
+        """
+        self.segments = [(int(start), int(end)) for start, end in (segments or [])]
+        self.md5 = hashlib.md5() if md5 else None
+        self.sha1 = hashlib.sha1() if sha1 else None
+        self.segment_hashes = [hashlib.md5() for _ in self.segments]
+        self.position = 0
+
+        # 按起始位置排序后逐个激活，已结束的分段从活动列表移除
+        self.pending = sorted(range(len(self.segments)), key=lambda i: self.segments[i][0])
+        self.pending_index = 0
+        self.active = []
+
+    def update(self, data):
+        """
+        输入下一段连续数据
+
+        参数:
+            data (bytes): 紧接上次数据之后的字节内容
+        """
+        if not data:
+            return
+        view = memoryview(data)
+        chunk_start = self.position
+        chunk_end = chunk_start + len(view)
+
+        if self.md5:
+            self.md5.update(view)
+        if self.sha1:
+            self.sha1.update(view)
+
+        while self.pending_index < len(self.pending):
+            index = self.pending[self.pending_index]
+            if self.segments[index][0] >= chunk_end:
+                break
+            self.active.append(index)
+            self.pending_index += 1
+
+        if self.active:
+            still_active = []
+            for index in self.active:
+                start, end = self.segments[index]
+                lo = max(start, chunk_start)
+                hi = min(end, chunk_end)
+                if hi > lo:
+                    self.segment_hashes[index].update(view[lo - chunk_start:hi - chunk_start])
+                if end > chunk_end:
+                    still_active.append(index)
+            self.active = still_active
+
+        self.position = chunk_end
+
+    def copy(self):
+        """
+        复制当前的哈希状态，用于从同一检查点继续计算不同的后续数据
+
+        返回:
+            DigestEngine: 状态独立的新对象
+        """
+        clone = DigestEngine.__new__(DigestEngine)
+        clone.segments = self.segments
+        clone.md5 = self.md5.copy() if self.md5 else None
+        clone.sha1 = self.sha1.copy() if self.sha1 else None
+        clone.segment_hashes = [h.copy() for h in self.segment_hashes]
+        clone.position = self.position
+        clone.pending = self.pending
+        clone.pending_index = self.pending_index
+        clone.active = list(self.active)
+        return clone
+
+    def result(self):
+        """
+        获取当前的计算结果
+
+        返回:
+            DigestResult: 计算结果
+        """
+        return DigestResult(
+            md5=self.md5.hexdigest() if self.md5 else None,
+            sha1=self.sha1.hexdigest() if self.sha1 else None,
+            segment_md5=[h.hexdigest() for h in self.segment_hashes],
+            size=self.position
+        )
+
+    @staticmethod
+    def compute_file(filepath, segments=None, chunk_size=None):
+        """
+        顺序读取一次文件并计算所有摘要
+
+        参数:
+            filepath (str): 文件路径
+            segments (list): 分段列表，每项为(start, end)元组
+            chunk_size (int): 读取块大小，默认为CHUNK_SIZE
+
+        返回:
+            DigestResult: 计算结果
+        """
+        engine = DigestEngine(segments)
+        buffer = bytearray(chunk_size or DigestEngine.CHUNK_SIZE)
+        view = memoryview(buffer)
+        with open(filepath, "rb", buffering=0) as f:
+            while True:
+                n = f.readinto(buffer)
+                if not n:
+                    break
+                engine.update(view[:n])
+        return engine.result()
+
+    @staticmethod
+    def compute_file_parallel(filepath, segments=None, workers=4, chunk_size=None, queue_depth=8):
+        """
+        使用多线程并行计算所有摘要
+        单个读取线程顺序读取大块数据并共享给各工作线程，MD5、SHA1和分段MD5
+        分配到不同线程上计算（hashlib在大块数据上会释放GIL）
+
+        参数:
+            filepath (str): 文件路径
+            segments (list): 分段列表，每项为(start, end)元组
+            workers (int): 工作线程数，小于2时退化为单线程计算
+            chunk_size (int): 读取块大小，默认为CHUNK_SIZE
+            queue_depth (int): 每个工作线程最多缓存的块数
+
+        返回:
+            DigestResult: 计算结果
+        """
+        segments = [(int(start), int(end)) for start, end in (segments or [])]
+        if workers < 2:
+            return DigestEngine.compute_file(filepath, segments, chunk_size)
+
+        # 按字节数贪心分配，整文件MD5和SHA1各计为一个文件大小的负载
+        file_size = os.path.getsize(filepath)
+        loads = [0] * workers
+        assigned = [[] for _ in range(workers)]
+        loads[0] += file_size
+        loads[1 % workers] += file_size
+        order = sorted(range(len(segments)), key=lambda i: segments[i][0] - segments[i][1])
+        for index in order:
+            target = loads.index(min(loads))
+            assigned[target].append(index)
+            loads[target] += max(min(segments[index][1], file_size) - segments[index][0], 0)
+
+        engines = []
+        for worker_id in range(workers):
+            engines.append(DigestEngine(
+                [segments[i] for i in assigned[worker_id]],
+                md5=(worker_id == 0),
+                sha1=(worker_id == 1 % workers)
+            ))
+
+        queues = [queue.Queue(maxsize=queue_depth) for _ in range(workers)]
+        errors = []
+        stop = threading.Event()
+
+        def worker(engine, q):
+            while True:
+                chunk = q.get()
+                if chunk is None:
+                    return
+                if stop.is_set():
+                    continue
+                try:
+                    engine.update(chunk)
+                except Exception as e:
+                    errors.append(e)
+                    stop.set()
+
+        threads = [threading.Thread(target=worker, args=(engines[i], queues[i]), daemon=True)
+                   for i in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            size = chunk_size or DigestEngine.CHUNK_SIZE
+            with open(filepath, "rb", buffering=0) as f:
+                while not stop.is_set():
+                    chunk = f.read(size)
+                    if not chunk:
+                        break
+                    for q in queues:
+                        q.put(chunk)
+        finally:
+            for q in queues:
+                q.put(None)
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            raise errors[0]
+
+        segment_md5 = [None] * len(segments)
+        for worker_id, engine in enumerate(engines):
+            partial = engine.result()
+            for index, md5 in zip(assigned[worker_id], partial.segment_md5):
+                segment_md5[index] = md5
+
+        return DigestResult(
+            md5=engines[0].result().md5,
+            sha1=engines[1 % workers].result().sha1,
+            segment_md5=segment_md5,
+            size=engines[0].position
+        )
@@ -0,0 +1,104 @@
+import mmap
+import os
+import threading
+
+class MappedImage:
+    """
+    固件文件的只读内存映射
+    所有下载和Range请求都是同一映射的切片，N台设备同时下载只占用一份页缓存，也不需要为每个连接分配读缓冲区
+    """
+    PAGE_SIZE = mmap.PAGESIZE
+
+    def __init__(self, path):
+        """
+        初始化MappedImage对象，打开并映射文件
+
+        参数:
+            path (str): 固件路径
+        """
+        self.path = path
+        self.file = open(path, 'rb')
+        st = os.fstat(self.file.fileno())
+        self.identity = (st.st_ino, st.st_size, st.st_mtime_ns)
+        self.size = st.st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self.map.madvise(mmap.MADV_SEQUENTIAL)
+
+    def slice(self, start, end):
+        """
+        获取[start, end)范围的只读视图，不复制数据
+
+        返回:
+            memoryview: 映射的切片
+        """
+        return self.view[start:end]
+
+    def warm_up(self):
+        """
+        预先把整个固件读入页缓存，第一批设备下载时不再等待磁盘
+        """
+        if hasattr(mmap, 'MADV_WILLNEED'):
+            self.map.madvise(mmap.MADV_WILLNEED)
+        view = self.view
+        for offset in range(0, self.size, MappedImage.PAGE_SIZE):
+            view[offset]
+
+class ImageMapCache:
+    """
+    按路径缓存固件映射，文件被替换(inode、大小或修改时间变化)后重新映射，
+    正在进行的传输仍持有旧映射，传输结束后旧映射随引用释放
+    """
+
+    def __init__(self):
+        """
+        初始化ImageMapCache对象
+        """
+        self.lock = threading.Lock()
+        self.maps = {}
+
+    def get(self, path):
+        """
+        获取固件的映射
+
+        参数:
+            path (str): 固件路径
+
+        返回:
+            MappedImage: 映射对象，文件为空或无法映射时返回None
+        """
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        identity = (st.st_ino, st.st_size, st.st_mtime_ns)
+        with self.lock:
+            mapped = self.maps.get(path)
+            if mapped is not None and mapped.identity == identity:
+                return mapped
+            if st.st_size == 0:
+                return None
+            try:
+                mapped = MappedImage(path)
+            except (OSError, ValueError):
+                return None
+            self.maps[path] = mapped
+            return mapped
+
+    def discard(self, path):
+        """
+        丢弃某个固件的映射，不再提供的旧固件在传输结束后即可关闭和删除
+
+        参数:
+            path (str): 固件路径
+        """
+        with self.lock:
+            self.maps.pop(path, None)
+
+    def clear(self):
+        """
+        丢弃所有映射，仍在使用的映射在传输结束后释放
+        """
+        with self.lock:
+            self.maps.clear()
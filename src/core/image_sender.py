@@ -0,0 +1,219 @@
+import re
+import time
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
+from werkzeug.serving import WSGIRequestHandler
+from ..utils import IO, t
+from .scheduler import TransferScheduler
+from .sessions import image_for_client
+from .catalog import CATALOG_IMAGE_PREFIX
+
+IMAGE_ROUTE = "/image.img"
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+class RangeNotSatisfiable(Exception):
+    """请求的范围超出文件大小时抛出的异常"""
+    pass
+
+def parse_range(header, size):
+    """
+    解析单个Range请求头
+
+    参数:
+        header (str): Range请求头，可为None
+        size (int): 文件大小
+
+    返回:
+        tuple: (start, end)半开区间，无Range或无法解析(包括多段请求)时返回None表示发送整个文件
+
+    异常:
+        RangeNotSatisfiable: 范围超出文件大小
+    """
+    if not header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    first, last = match.group(1), match.group(2)
+    if not first:
+        length = int(last)
+        if length == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size
+    start = int(first)
+    end = min(size, int(last) + 1) if last else size
+    if start >= size or end <= start:
+        raise RangeNotSatisfiable()
+    return start, end
+
+def if_range_matches(if_range, etag, last_modified):
+    """
+    判断If-Range条件是否仍然成立
+
+    参数:
+        if_range (str): If-Range请求头，可为None
+        etag (str): 当前ETag
+        last_modified (str): 当前Last-Modified
+
+    返回:
+        bool: 未携带If-Range或条件成立时返回True
+    """
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    try:
+        return parsedate_to_datetime(if_range) >= parsedate_to_datetime(last_modified)
+    except (TypeError, ValueError):
+        return False
+
+class ProgressSampler:
+    """按时间间隔采样的进度回调类，避免每次发送都调用回调"""
+    INTERVAL = 0.25
+
+    def __init__(self, callback, total, interval=None):
+        """
+        初始化ProgressSampler对象
+
+        参数:
+            callback (function): 进度回调函数，接收(current, total)参数
+            total (int): 文件总大小
+            interval (float): 最小回调间隔(秒)，默认为INTERVAL
+        """
+        self.callback = callback
+        self.total = total
+        self.interval = ProgressSampler.INTERVAL if interval is None else interval
+        self.last = 0.0
+
+    def update(self, position, force=False):
+        """
+        报告当前位置，距上次回调不足采样间隔时忽略
+
+        参数:
+            position (int): 已发送到的文件位置
+            force (bool): 是否忽略采样间隔强制回调
+        """
+        if not self.callback:
+            return
+        now = time.monotonic()
+        if not force and now - self.last < self.interval:
+            return
+        self.last = now
+        try:
+            self.callback(position, self.total)
+        except Exception:
+            pass
+
+class SendfileRequestHandler(WSGIRequestHandler):
+    """
+    在WSGI分发之前拦截固件下载请求的请求处理类
+    固件数据通过socket.sendfile从页缓存直接写入套接字，应用配置中有IMAGE_MAPS时改为发送共享内存映射的切片，
+    支持单段Range、If-Range和HEAD，按应用配置中的TRANSFER_SCHEDULER限制并发和速率，其余请求仍交由Flask处理
+    """
+    SEND_BLOCK = 8 * 1024 * 1024
+    MAP_BLOCK = 256 * 1024
+
+    def run_wsgi(self):
+        """
+        处理请求，固件下载走零拷贝路径
+        """
+        path = self.path.split('?', 1)[0]
+        if self.command in ('GET', 'HEAD') and (path == IMAGE_ROUTE or path.startswith(CATALOG_IMAGE_PREFIX)):
+            config = self.server.app.config
+            image = image_for_client(config, self.client_address[0], path)
+            if image is not None:
+                if config.get('TRANSFER_SCHEDULER') is None:
+                    config['TRANSFER_SCHEDULER'] = TransferScheduler()
+                self.send_image(image, config.get('PROGRESS_CALLBACK'), config['TRANSFER_SCHEDULER'], config.get('IMAGE_MAPS'))
+                return
+        super().run_wsgi()
+
+    def send_image(self, image, progress_callback, scheduler, maps=None):
+        """
+        使用sendfile或共享内存映射发送固件
+
+        参数:
+            image (VirtualImage): 要发送的固件
+            progress_callback (function): 进度回调函数，接收(current, total)参数
+            scheduler (TransferScheduler): 传输调度器
+            maps (ImageMapCache): 固件映射缓存，默认为None表示使用sendfile
+        """
+        IO.info(t("image_request_received").format(self.client_address[0]))
+        IO.info(t("serving_firmware").format(image.base_path))
+
+        mapped = maps.get(image.base_path) if maps is not None else None
+        with (nullcontext(mapped.file) if mapped is not None else open(image.base_path, 'rb')) as f:
+            size, etag, last_modified = image.validators(f)
+            try:
+                byte_range = None
+                if if_range_matches(self.headers.get('If-Range'), etag, last_modified):
+                    byte_range = parse_range(self.headers.get('Range'), size)
+            except RangeNotSatisfiable:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            start, end = byte_range or (0, size)
+            if self.command == 'HEAD':
+                self.send_image_head(byte_range, start, end, size, etag, last_modified)
+                return
+
+            transfer = scheduler.acquire(self.client_address[0])
+            try:
+                self.send_image_head(byte_range, start, end, size, etag, last_modified)
+                self.send_image_body(f, image, transfer, start, end, ProgressSampler(progress_callback, size), mapped)
+            finally:
+                scheduler.release(transfer)
+
+    def send_image_head(self, byte_range, start, end, size, etag, last_modified):
+        """
+        发送固件响应的状态行和响应头
+        """
+        self.send_response(206 if byte_range else 200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Disposition', 'attachment; filename=image.img')
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        if byte_range:
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{size}')
+        self.end_headers()
+
+    def send_image_body(self, f, image, transfer, start, end, sampler, mapped=None):
+        """
+        按调度器分配的速率发送固件正文，覆盖字节从内存写出，其余部分通过sendfile发送，
+        有映射时直接发送映射的切片
+        """
+        position = start
+        try:
+            for offset, length, data in image.pieces(start, end):
+                if data is not None:
+                    self.wfile.write(data)
+                    position += length
+                    continue
+                piece_end = offset + length
+                while position < piece_end:
+                    if mapped is not None:
+                        block = min(transfer.block_size(SendfileRequestHandler.MAP_BLOCK), piece_end - position)
+                        self.connection.sendall(mapped.slice(position, position + block))
+                        sent = block
+                    else:
+                        block = transfer.block_size(SendfileRequestHandler.SEND_BLOCK)
+                        sent = self.connection.sendfile(f, position, min(block, piece_end - position))
+                    if sent == 0:
+                        break
+                    position += sent
+                    sampler.update(position)
+                    delay = transfer.pace(sent)
+                    if delay:
+                        time.sleep(delay)
+                if position < piece_end:
+                    break
+        except (ConnectionError, TimeoutError):
+            self.close_connection = True
+        sampler.update(position, force=True)
+        if position < end:
+            self.close_connection = True
@@ -0,0 +1,217 @@
+import json
+import os
+import threading
+import time
+from ..utils import IO, t
+from .scanner import SignatureScanner
+
+class SignatureIndexCache:
+    """
+    固件特征偏移索引缓存类
+    按固件标识（大小、mtime_ns、inode以及已知时的上游md5sum）记录find_hash_patterns的结果
+    和已校验的分段MD5，保存在固件旁的索引文件中，按最近使用时间淘汰
+    """
+    FILENAME = ".paperp_index.json"
+    MAX_ENTRIES = 64
+
+    def __init__(self, path, max_entries=None):
+        """
+        初始化SignatureIndexCache对象
+
+        参数:
+            path (str): 索引文件路径
+            max_entries (int): 最多保留的条目数，默认为MAX_ENTRIES
+        """
+        self.path = path
+        self.max_entries = max_entries or SignatureIndexCache.MAX_ENTRIES
+        self.lock = threading.Lock()
+        self.entries = self.load()
+
+    @staticmethod
+    def for_image(image_path, max_entries=None):
+        """
+        创建位于固件同目录下的索引缓存
+
+        参数:
+            image_path (str): 固件文件路径
+            max_entries (int): 最多保留的条目数
+
+        返回:
+            SignatureIndexCache: 索引缓存对象
+        """
+        directory = os.path.dirname(os.path.abspath(image_path))
+        return SignatureIndexCache(os.path.join(directory, SignatureIndexCache.FILENAME), max_entries)
+
+    @staticmethod
+    def image_identity(image_path):
+        """
+        获取固件文件的标识
+
+        参数:
+            image_path (str): 固件文件路径
+
+        返回:
+            dict: 包含size、mtime_ns和inode的字典
+        """
+        st = os.stat(image_path)
+        return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'inode': st.st_ino}
+
+    def load(self):
+        """
+        从磁盘读取索引文件，文件损坏时视为空缓存
+
+        返回:
+            list: 条目列表，按最近使用时间从旧到新排列
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+            if isinstance(entries, list):
+                return sorted(entries, key=lambda e: e.get('last_used', 0))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            IO.warn(t("index_cache_load_fail").format(e))
+        return []
+
+    def save(self):
+        """
+        淘汰超出上限的旧条目并原子写回索引文件
+        """
+        while len(self.entries) > self.max_entries:
+            self.entries.pop(0)
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            IO.warn(t("index_cache_save_fail").format(e))
+
+    def find(self, identity, md5sum=None):
+        """
+        查找与固件标识匹配的条目
+
+        参数:
+            identity (dict): image_identity返回的标识
+            md5sum (str): 上游md5sum，已知时按内容匹配
+
+        返回:
+            dict: 匹配的条目，未找到返回None
+        """
+        for entry in reversed(self.entries):
+            if md5sum and entry.get('md5sum') == md5sum and entry.get('size') == identity['size']:
+                return entry
+            if all(entry.get(k) == identity[k] for k in ('size', 'mtime_ns', 'inode')):
+                return entry
+        return None
+
+    def touch(self, entry):
+        """
+        将条目标记为最近使用
+
+        参数:
+            entry (dict): 条目
+        """
+        entry['last_used'] = time.time()
+        self.entries.remove(entry)
+        self.entries.append(entry)
+
+    def lookup_patterns(self, image_path, md5sum=None, first_only=False):
+        """
+        查找缓存的哈希模式，并只在记录的偏移处校验特征是否仍然存在
+
+        参数:
+            image_path (str): 固件文件路径
+            md5sum (str): 上游md5sum
+            first_only (bool): 是否只需要第一个模式
+
+        返回:
+            list: 哈希模式列表，未命中返回None
+        """
+        with self.lock:
+            identity = SignatureIndexCache.image_identity(image_path)
+            entry = self.find(identity, md5sum)
+            if entry is None or entry.get('patterns') is None:
+                return None
+            if not first_only and not entry.get('complete'):
+                return None
+
+            patterns = entry['patterns'][:1] if first_only else entry['patterns']
+            if not SignatureScanner.verify(image_path, patterns):
+                IO.info(t("index_cache_stale"))
+                self.entries.remove(entry)
+                self.save()
+                return None
+
+            entry.update(identity)
+            self.touch(entry)
+            self.save()
+            IO.info(t("index_cache_hit").format(len(patterns)))
+            return [dict(p) for p in patterns]
+
+    def store_patterns(self, image_path, patterns, md5sum=None, complete=True):
+        """
+        记录固件的哈希模式
+
+        参数:
+            image_path (str): 固件文件路径
+            patterns (list): 哈希模式列表
+            md5sum (str): 上游md5sum
+            complete (bool): 是否为完整扫描结果（提前结束的扫描为False）
+        """
+        with self.lock:
+            identity = SignatureIndexCache.image_identity(image_path)
+            entry = self.find(identity, md5sum)
+            if entry is None:
+                entry = {'last_used': 0}
+                self.entries.append(entry)
+            elif entry.get('complete') and not complete:
+                complete = True
+                patterns = entry['patterns']
+            entry.update(identity)
+            if md5sum:
+                entry['md5sum'] = md5sum
+            entry['patterns'] = [dict(p) for p in patterns]
+            entry['complete'] = complete
+            self.touch(entry)
+            self.save()
+
+    def lookup_segments(self, md5sum):
+        """
+        查找已校验过的上游分段MD5
+
+        参数:
+            md5sum (str): 上游md5sum
+
+        返回:
+            list: 分段信息列表，未命中返回None
+        """
+        if not md5sum:
+            return None
+        with self.lock:
+            for entry in reversed(self.entries):
+                if entry.get('md5sum') == md5sum and entry.get('segment_md5') is not None:
+                    self.touch(entry)
+                    self.save()
+                    return entry['segment_md5']
+        return None
+
+    def store_segments(self, md5sum, segment_md5):
+        """
+        记录已校验的修改前分段MD5
+
+        参数:
+            md5sum (str): 上游md5sum
+            segment_md5 (list): 分段信息列表，每项包含startpos、endpos和md5
+        """
+        if not md5sum:
+            return
+        with self.lock:
+            entry = next((e for e in reversed(self.entries) if e.get('md5sum') == md5sum), None)
+            if entry is None:
+                entry = {'md5sum': md5sum, 'last_used': 0}
+                self.entries.append(entry)
+            entry['segment_md5'] = [dict(item) for item in segment_md5]
+            self.touch(entry)
+            self.save()
@@ -0,0 +1,243 @@
+import bisect
+import threading
+import time
+from .catalog import CATALOG_IMAGE_PREFIX
+
+METRICS_ROUTE = "/metrics"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def route_label(path):
+    """
+    将请求路径归类为指标中的route标签
+
+    参数:
+        path (str): 请求路径，可带查询字符串
+
+    返回:
+        str: check_version、image、catalog_image、metrics或other
+    """
+    path = (path or '').split('?', 1)[0]
+    if "ota/checkVersion" in path:
+        return "check_version"
+    if path == "/image.img":
+        return "image"
+    if path.startswith(CATALOG_IMAGE_PREFIX):
+        return "catalog_image"
+    if path == METRICS_ROUTE:
+        return "metrics"
+    return "other"
+
+class MetricShard:
+    """单个线程的计数器，只由所属线程修改，抓取时由ServerMetrics汇总"""
+
+    def __init__(self, buckets):
+        """
+        初始化MetricShard对象
+
+        参数:
+            buckets (int): 延迟直方图的桶数(不含+Inf)
+        """
+        self.buckets = buckets
+        self.requests = {}
+        self.latency = {}
+        self.sent = {}
+        self.check_version = {}
+
+class ServerMetrics:
+    """
+    OTA服务器指标类，以Prometheus文本格式输出
+    传输路径上的记录只修改当前线程自己的分片，不加锁；抓取/metrics时才遍历所有分片求和，
+    因此即使每发送一块数据都记录一次字节数也不会拖慢传输。
+    吞吐量由采样线程每THROUGHPUT_INTERVAL秒计算一次，抓取只读取结果，多个抓取方互不影响
+    """
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+    THROUGHPUT_INTERVAL = 5
+
+    def __init__(self, stats_source=None):
+        """
+        初始化ServerMetrics对象
+
+        参数:
+            stats_source (function): 返回HttpServer.get_stats()格式统计信息的函数，默认为None
+        """
+        self.stats_source = stats_source
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = []
+        self.throughput = 0.0
+        self.stopped = threading.Event()
+        self.sampler = None
+
+    def start(self):
+        """
+        启动吞吐量采样线程
+        """
+        if self.sampler is not None:
+            return
+        self.stopped.clear()
+        self.sampler = threading.Thread(target=self.sample, name="ota-metrics", daemon=True)
+        self.sampler.start()
+
+    def stop(self):
+        """
+        停止吞吐量采样线程
+        """
+        self.stopped.set()
+        if self.sampler is not None:
+            self.sampler.join(timeout=1)
+            self.sampler = None
+        self.throughput = 0.0
+
+    def sample(self):
+        """
+        采样线程主循环，按固定间隔计算发送速率
+        """
+        last_time, last_sent = time.monotonic(), self.sent_total()
+        while not self.stopped.wait(ServerMetrics.THROUGHPUT_INTERVAL):
+            now, sent = time.monotonic(), self.sent_total()
+            self.throughput = (sent - last_sent) / (now - last_time) if now > last_time else 0.0
+            last_time, last_sent = now, sent
+
+    def sent_total(self):
+        """
+        汇总所有分片发送的固件字节数
+
+        返回:
+            int: 字节数
+        """
+        with self.lock:
+            shards = list(self.shards)
+        return sum(sum(shard.sent.copy().values()) for shard in shards)
+
+    def shard(self):
+        """
+        获取当前线程的分片，线程第一次记录时创建
+        """
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = MetricShard(len(ServerMetrics.LATENCY_BUCKETS))
+            with self.lock:
+                self.shards.append(shard)
+            self.local.shard = shard
+        return shard
+
+    def observe_request(self, route, status, seconds):
+        """
+        记录一个已完成的请求
+
+        参数:
+            route (str): route标签
+            status (int): 响应状态码
+            seconds (float): 从收到请求到响应结束的耗时
+        """
+        shard = self.shard()
+        key = (route, str(status))
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+        histogram = shard.latency.get(route)
+        if histogram is None:
+            histogram = shard.latency[route] = [0] * (shard.buckets + 1) + [0.0]
+        histogram[bisect.bisect_left(ServerMetrics.LATENCY_BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+
+    def add_sent(self, client, nbytes):
+        """
+        记录发送给客户端的固件字节数
+
+        参数:
+            client (str): 客户端IP
+            nbytes (int): 字节数
+        """
+        sent = self.shard().sent
+        sent[client] = sent.get(client, 0) + nbytes
+
+    def count_check_version(self, status, headers=()):
+        """
+        记录一次checkVersion应答
+
+        参数:
+            status (int): 响应状态码，None表示没有可用的更新数据
+            headers (list): 响应头列表，用于判断是否gzip压缩
+        """
+        if status is None:
+            key = ("unavailable", "identity")
+        else:
+            gzipped = ('Content-Encoding', 'gzip') in headers
+            key = ("not_modified" if status == 304 else "served", "gzip" if gzipped else "identity")
+        counts = self.shard().check_version
+        counts[key] = counts.get(key, 0) + 1
+
+    def collect(self):
+        """
+        汇总所有分片
+
+        返回:
+            dict: requests、latency、sent、check_version四类计数
+        """
+        with self.lock:
+            shards = list(self.shards)
+        total = {'requests': {}, 'latency': {}, 'sent': {}, 'check_version': {}}
+        for shard in shards:
+            for name in ('requests', 'sent', 'check_version'):
+                merged = total[name]
+                for key, value in getattr(shard, name).copy().items():
+                    merged[key] = merged.get(key, 0) + value
+            for route, histogram in shard.latency.copy().items():
+                merged = total['latency'].setdefault(route, [0] * len(histogram))
+                for i, value in enumerate(list(histogram)):
+                    merged[i] += value
+        return total
+
+    def render(self):
+        """
+        生成Prometheus文本格式的指标
+
+        返回:
+            str: 指标文本
+        """
+        total = self.collect()
+        stats = self.stats_source() if self.stats_source else {}
+        transfers = stats.get('transfers') or {}
+        pool = stats.get('pool')
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels)
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        sent_total = sum(total['sent'].values())
+
+        metric("ota_active_connections", "gauge", "Client connections currently open",
+               [((), stats.get('connections', 0))])
+        metric("ota_requests_total", "counter", "Requests handled, by route and status",
+               [((('route', route), ('status', status)), value) for (route, status), value in sorted(total['requests'].items())])
+
+        lines.append("# HELP ota_request_duration_seconds Time from request line to end of response")
+        lines.append("# TYPE ota_request_duration_seconds histogram")
+        for route, histogram in sorted(total['latency'].items()):
+            cumulative = 0
+            for bound, count in zip(ServerMetrics.LATENCY_BUCKETS + ("+Inf",), histogram):
+                cumulative += count
+                lines.append(f'ota_request_duration_seconds_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+            lines.append(f'ota_request_duration_seconds_sum{{route="{route}"}} {histogram[-1]}')
+            lines.append(f'ota_request_duration_seconds_count{{route="{route}"}} {cumulative}')
+
+        metric("ota_client_sent_bytes_total", "counter", "Firmware bytes sent, by client",
+               [((('client', client),), value) for client, value in sorted(total['sent'].items())])
+        metric("ota_sent_bytes_total", "counter", "Firmware bytes sent to all clients", [((), sent_total)])
+        metric("ota_transfer_throughput_bytes_per_second", "gauge",
+               f"Firmware send rate over the last {ServerMetrics.THROUGHPUT_INTERVAL}s, use rate(ota_sent_bytes_total) for other windows",
+               [((), self.throughput)])
+        metric("ota_transfers_active", "gauge", "Firmware transfers in progress", [((), transfers.get('active', 0))])
+        metric("ota_transfers_queued", "gauge", "Firmware transfers waiting for a slot", [((), transfers.get('queued', 0))])
+        metric("ota_transfers_completed_total", "counter", "Firmware transfers finished", [((), transfers.get('completed', 0))])
+        metric("ota_check_version_total", "counter", "checkVersion answers, by result and encoding",
+               [((('result', result), ('encoding', encoding)), value) for (result, encoding), value in sorted(total['check_version'].items())])
+        if pool is not None:
+            metric("ota_pool_workers", "gauge", "Worker threads of the flask engine", [((), pool['workers'])])
+            metric("ota_pool_busy", "gauge", "Worker threads handling a connection", [((), pool['busy'])])
+            metric("ota_pool_queued", "gauge", "Accepted connections waiting for a worker", [((), pool['queued'])])
+            metric("ota_pool_idle", "gauge", "Keep-alive connections waiting for their next request", [((), pool['idle'])])
+        return "\n".join(lines) + "\n"
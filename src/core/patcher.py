@@ -1,21 +1,30 @@
 import hashlib
-import re
 import json
+import os
 from ..utils import IO, t
+from .hasher import DigestEngine, SegmentIndex
+from .scanner import SignatureScanner
+from .firmware_cache import link_or_copy
 
 class Patcher:
     """固件修改类，用于修改固件中的密码哈希值和更新版本信息"""
     
     @staticmethod
-    def update_version_data(update_data, image_path, interface_ip):
+    def update_version_data(update_data, image_path, interface_ip, hash_workers=1, patched_ranges=None, verify_segments=False, index_cache=None):
         """
         重新计算修改后固件的MD5和SHA1哈希值
         更新update_data字典中的哈希值和本地URL
+        给出patched_ranges时只重新计算被修改触及的分段，其余分段沿用上游提供的MD5
         
         参数:
             update_data (dict): 包含版本信息的JSON字典
             image_path (str): 修改后固件的路径
             interface_ip (str): 本地接口IP地址，用于构建本地URL
+            hash_workers (int): 哈希计算线程数，大于1时启用并行计算，默认为1
+            patched_ranges (list): replace_hash记录的修改范围列表，每项为(start, end)元组，
+                                   默认为None表示重新计算全部分段
+            verify_segments (bool): 是否校验未修改分段与上游MD5一致，默认为False
+            index_cache (SignatureIndexCache): 可选，同一版本已校验过时跳过分段校验
         
         返回:
             dict: 更新后的update_data字典
@@ -30,36 +39,101 @@ class Patcher:
         else:
             segment_md5 = segment_md5_str
             
-        for item in segment_md5:
-            start = item['startpos']
-            end = item['endpos']
-            item['md5'] = Patcher.calc_segment_md5(image_path, start, end)
+        segments = [(item['startpos'], item['endpos']) for item in segment_md5]
+        upstream_md5sum = version_data.get('md5sum')
+        upstream_segments = [dict(item) for item in segment_md5]
+
+        if verify_segments and patched_ranges is not None and index_cache is not None:
+            if index_cache.lookup_segments(upstream_md5sum) == upstream_segments:
+                IO.info(t("segments_verified_cached"))
+                verify_segments = False
+
+        dirty = None
+        targets = list(range(len(segments)))
+        if patched_ranges is not None:
+            touched = set(SegmentIndex(segments).dirty(patched_ranges))
+            dirty = {i for i, item in enumerate(segment_md5) if i in touched or not item.get('md5')}
+            IO.info(t("dirty_segments").format(len(dirty), len(segments)))
+            if not verify_segments:
+                targets = sorted(dirty)
+
+        digests = DigestEngine.compute_file_parallel(
+            image_path, [segments[i] for i in targets], workers=hash_workers)
+
+        mismatches = 0
+        for index, md5 in zip(targets, digests.segment_md5):
+            item = segment_md5[index]
+            if dirty is not None and index not in dirty and item['md5'].lower() != md5:
+                IO.warn(t("segment_md5_mismatch").format(index, item['startpos'], item['endpos']))
+                mismatches += 1
+            item['md5'] = md5
+
+        if verify_segments and dirty is not None and not mismatches and index_cache is not None:
+            index_cache.store_segments(upstream_md5sum, upstream_segments)
             
-        if isinstance(segment_md5_str, str):
+        Patcher.apply_version_data(update_data, segment_md5, digests.md5, digests.sha1, interface_ip)
+        IO.debug(json.dumps(update_data, indent=2))
+        return update_data
+
+    @staticmethod
+    def apply_version_data(update_data, segment_md5, md5sum, sha, interface_ip):
+        """
+        将计算好的哈希值和本地URL写回update_data字典
+        
+        参数:
+            update_data (dict): 包含版本信息的JSON字典
+            segment_md5 (list): 分段信息列表，每项包含startpos、endpos和md5
+            md5sum (str): 整文件MD5哈希值
+            sha (str): 整文件SHA1哈希值
+            interface_ip (str): 本地接口IP地址，用于构建本地URL
+        
+        返回:
+            dict: 更新后的update_data字典
+        """
+        version_data = update_data['data']['version']
+
+        if isinstance(version_data['segmentMd5'], str):
             version_data['segmentMd5'] = json.dumps(segment_md5)
         else:
             version_data['segmentMd5'] = segment_md5
             
-        version_data['md5sum'] = Patcher.calc_md5(image_path)
-        version_data['sha'] = Patcher.calc_sha1(image_path)
+        version_data['md5sum'] = md5sum
+        version_data['sha'] = sha
+        
+        return Patcher.set_image_url(update_data, f"http://{interface_ip}/image.img")
+
+    @staticmethod
+    def set_image_url(update_data, url):
+        """
+        将update_data中的固件下载地址替换为指定URL
+        
+        参数:
+            update_data (dict): 包含版本信息的JSON字典
+            url (str): 固件下载URL
         
-        local_url = f"http://{interface_ip}/image.img"
-        version_data['deltaUrl'] = local_url
-        version_data['bakUrl'] = local_url
+        返回:
+            dict: 更新后的update_data字典
+        """
+        version_data = update_data['data']['version']
+        version_data['deltaUrl'] = url
+        version_data['bakUrl'] = url
         
         if 'fullUrl' in version_data:
-            version_data['fullUrl'] = local_url
+            version_data['fullUrl'] = url
             
-        IO.debug(json.dumps(update_data, indent=2))
         return update_data
 
     @staticmethod
-    def find_hash_patterns(filepath):
+    def find_hash_patterns(filepath, workers=1, first_only=False, index_cache=None, md5sum=None):
         """
         在固件文件中查找密码哈希模式
         
         参数:
             filepath (str): 固件文件路径
+            workers (int): 扫描进程数，大于1时启用多进程并行扫描，默认为1
+            first_only (bool): 是否只查找replace_hash使用的第一个模式，默认为False
+            index_cache (SignatureIndexCache): 可选，命中时跳过扫描只校验记录的偏移
+            md5sum (str): 上游md5sum，用于按内容匹配索引缓存
         
         返回:
             list: 找到的哈希模式列表
@@ -68,59 +142,66 @@ class Patcher:
         
         patterns = []
         try:
-            with open(filepath, 'rb') as f:
-                data = f.read()
-                
-            # Pattern 1: SHA256 (64 hex chars)
-            # C++: buffer[i] == '#' && ... && buffer[i + 65] == ' ' && buffer[i + 66] == ' ' && buffer[i + 67] == '-'
-            # i is '#'
-            # i+1 to i+64 (64 chars) is hex
-            # i+65 is ' '
-            # i+66 is ' '
-            # i+67 is '-'
-            # Total length: 1 (#) + 64 (hash) + 2 (spaces) + 1 (-) = 68
-            # Regex: b'#([0-9a-fA-F]{64})  -'
-            # Capture group 1 is the hash.
-            # Offset of hash is match.start(1)
-            for match in re.finditer(rb'#([0-9a-fA-F]{64})  -', data):
-                IO.info(t("hash_found_sha256").format(match.start(1)))
-                patterns.append({'type': 'sha256', 'offset': match.start(1), 'length': 64})
-                
-            # Pattern 2: MD5 (32 hex chars)
-            # C++: buffer[i] == '=' && buffer[i+1] == ' ' && buffer[i+2] == '"' && ... 
-            # ... && buffer[i+35] == ' ' && buffer[i+36] == ' ' && buffer[i+37] == '-' && buffer[i+38] == '"'
-            # i is '='
-            # i+1 is ' '
-            # i+2 is '"'
-            # i+3 to i+34 (32 chars) is hex (hash)
-            # i+35 is ' '
-            # i+36 is ' '
-            # i+37 is '-'
-            # i+38 is '"'
-            # Regex: b'= "([0-9a-fA-F]{32})  -"'
-            # Capture group 1 is the hash.
-            # Offset of hash is match.start(1)
-            for match in re.finditer(rb'= "([0-9a-fA-F]{32})  -"', data):
-                IO.info(t("hash_found_md5").format(match.start(1)))
-                patterns.append({'type': 'md5', 'offset': match.start(1), 'length': 32})
-                
+            if index_cache is not None:
+                cached = index_cache.lookup_patterns(filepath, md5sum=md5sum, first_only=first_only)
+                if cached is not None:
+                    return cached
+
+            if workers > 1:
+                patterns = SignatureScanner.scan_file_parallel(filepath, workers=workers, first_only=first_only)
+            else:
+                patterns = SignatureScanner.scan_file(filepath)
+                if first_only:
+                    patterns = patterns[:1]
+            for pattern in patterns:
+                key = "hash_found_sha256" if pattern['type'] == 'sha256' else "hash_found_md5"
+                IO.info(t(key).format(pattern['offset']))
+
+            if index_cache is not None:
+                index_cache.store_patterns(filepath, patterns, md5sum=md5sum, complete=not first_only)
         except Exception as e:
             IO.error(t("error_reading_file").format(e))
             
         return patterns
 
     @staticmethod
-    def replace_hash(filepath):
+    def hash_password(password, pattern_type):
+        """
+        按固件中的哈希类型计算新密码的哈希值
+        
+        参数:
+            password (str): 新密码
+            pattern_type (str): 哈希类型，'md5'或'sha256'
+        
+        返回:
+            str: 十六进制哈希字符串
+        """
+        if pattern_type == 'md5':
+            # Note: C++ adds a newline for MD5? "newPassword + '\n'"
+            # Let's verify C++ code:
+            # const std::string newHash = (positions[0].second == 32 ? HASH::MD5(newPassword + '\n') : HASH::SHA256(newPassword));
+            return hashlib.md5((password + '\n').encode()).hexdigest()
+        return hashlib.sha256(password.encode()).hexdigest()
+
+    @staticmethod
+    def replace_hash(filepath, patched_ranges=None, scan_workers=1, index_cache=None, md5sum=None):
         """
         替换固件中的密码哈希值
         
         参数:
             filepath (str): 固件文件路径
+            patched_ranges (list): 可选，用于记录被修改的字节范围(start, end)
+            scan_workers (int): 扫描进程数，大于1时并行扫描，默认为1；
+                                并行扫描同样扫描整个文件，发现多个模式时与串行扫描一样给出提示
+            index_cache (SignatureIndexCache): 可选，特征偏移索引缓存
+            md5sum (str): 上游md5sum，用于按内容匹配索引缓存
         
         返回:
             bool: 操作是否成功
         """
-        patterns = Patcher.find_hash_patterns(filepath)
+        patterns = Patcher.find_hash_patterns(
+            filepath, workers=scan_workers,
+            index_cache=index_cache, md5sum=md5sum)
         
         if not patterns:
             IO.error(t("no_passwords_found"))
@@ -135,20 +216,27 @@ class Patcher:
         while not new_password:
             new_password = IO.input(t("input_new_password")).strip()
             
-        if pattern['type'] == 'md5':
-            # Note: C++ adds a newline for MD5? "newPassword + '\n'"
-            # Let's verify C++ code:
-            # const std::string newHash = (positions[0].second == 32 ? HASH::MD5(newPassword + '\n') : HASH::SHA256(newPassword));
-            new_hash = hashlib.md5((new_password + '\n').encode()).hexdigest()
-        else:
-            new_hash = hashlib.sha256(new_password.encode()).hexdigest()
+        new_hash = Patcher.hash_password(new_password, pattern['type'])
             
         IO.info(t("new_hash_log").format(new_hash))
         
         try:
+            # 固件可能与本地缓存共享硬链接，原地修改前先断开链接以免改动缓存内容
+            if os.stat(filepath).st_nlink > 1:
+                tmp_path = filepath + ".unlink"
+                link_or_copy(filepath, tmp_path, allow_hardlink=False)
+                os.replace(tmp_path, filepath)
+
             with open(filepath, 'r+b') as f:
                 f.seek(pattern['offset'])
                 f.write(new_hash.encode())
+
+            if patched_ranges is not None:
+                patched_ranges.append((pattern['offset'], pattern['offset'] + len(new_hash)))
+
+            # 修改后文件标识发生变化，重新记录以便下次运行直接命中
+            if index_cache is not None:
+                index_cache.store_patterns(filepath, patterns, md5sum=md5sum)
                 
             IO.info(t("patch_success"))
             return True
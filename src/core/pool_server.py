@@ -0,0 +1,383 @@
+import collections
+import io
+import queue
+import selectors
+import socket
+import threading
+import time
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from .metrics import route_label
+from .scheduler import TransferScheduler
+
+class KeepAliveHandlerMixin:
+    """
+    线程池服务器使用的请求处理混入类
+    werkzeug总是在WSGI响应后关闭连接，并在响应后读掉套接字中剩余的数据，因为无法确定应用是否读完了请求体；
+    这里先把不超过MAX_BODY_SIZE的请求体整体读入内存，处理期间用空流替换rfile，
+    使werkzeug的清理读不到下一个请求，读取位置确定后即可保持HTTP/1.1长连接。
+    一个请求处理完后如果连接保持打开且没有已收到的后续请求，就结束处理并标记parked，
+    由服务器把连接交给选择器等待，空闲的长连接不占用工作线程。
+    空闲连接超时被关闭属于正常情况，不作为错误记录；服务器设置了metrics时记录每个请求的路由、状态码和耗时
+    """
+    protocol_version = "HTTP/1.1"
+    MAX_BODY_SIZE = 1024 * 1024
+
+    def handle_one_request(self):
+        """
+        处理一个请求，记录指标，长连接上没有后续请求时标记parked并结束本次处理
+        """
+        self.keep_alive = False
+        self.parked = False
+        self.request_start = None
+        self.response_status = None
+        rfile = self.rfile
+        try:
+            super().handle_one_request()
+        finally:
+            self.rfile = rfile
+            metrics = self.server.metrics
+            if metrics is not None and self.request_start is not None and self.response_status is not None:
+                metrics.observe_request(route_label(self.path), self.response_status, time.perf_counter() - self.request_start)
+        if not self.close_connection and not self.has_pending_request():
+            self.parked = True
+            self.close_connection = True
+
+    def has_pending_request(self):
+        """
+        检查是否已经收到后续请求的数据(客户端流水线发送的请求可能已读入rfile的缓冲区)
+
+        返回:
+            bool: rfile缓冲区或套接字中有可读数据时返回True
+        """
+        timeout = self.connection.gettimeout()
+        self.connection.setblocking(False)
+        try:
+            # 非阻塞套接字上没有数据时peek返回空，不会等待
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(timeout)
+
+    def parse_request(self):
+        """
+        解析请求行和请求头，从读到请求行开始计时，不包括长连接上等待下一个请求的空闲时间
+        """
+        self.request_start = time.perf_counter()
+        return super().parse_request()
+
+    def send_response(self, code, message=None):
+        """
+        发送状态行并记录状态码
+        """
+        self.response_status = code
+        super().send_response(code, message)
+
+    def make_environ(self):
+        """
+        生成WSGI环境，请求体不超过MAX_BODY_SIZE时整体读入内存并允许保持长连接
+
+        返回:
+            dict: WSGI环境
+        """
+        environ = super().make_environ()
+        if self.close_connection or environ.get('wsgi.input_terminated'):
+            return environ
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return environ
+        if length < 0 or length > KeepAliveHandlerMixin.MAX_BODY_SIZE:
+            return environ
+        body = self.rfile.read(length) if length else b''
+        if len(body) < length:
+            return environ
+        environ['wsgi.input'] = io.BytesIO(body)
+        self.rfile = io.BytesIO()
+        self.keep_alive = True
+        return environ
+
+    def send_header(self, keyword, value):
+        """
+        发送响应头，保持长连接时丢弃werkzeug添加的Connection: close
+        """
+        if self.keep_alive and keyword.lower() == 'connection' and value.lower() == 'close':
+            return
+        super().send_header(keyword, value)
+
+    def log_error(self, format, *args):
+        """
+        记录错误，忽略空闲连接超时
+        """
+        if format.startswith("Request timed out"):
+            return
+        super().log_error(format, *args)
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    固定线程池的werkzeug服务器类
+    接受的连接放入有界队列，由固定数量的工作线程处理，避免突发的checkVersion轮询导致线程数和内存暴涨；
+    队列满时暂停接受新连接，多余的连接留在内核的监听队列中。
+    请求之间空闲的长连接交给一个选择器线程等待，收到下一个请求时才重新放入队列，工作线程只在处理请求时被占用；
+    空闲超过idle_timeout的连接由选择器线程关闭。
+    接受的连接开启TCP_NODELAY并增大发送缓冲区
+    """
+    multithread = True
+    # 工作线程多于同时传输数上限，传输占满时仍有线程应答checkVersion，多余的下载在传输调度器中排队
+    SPARE_WORKERS = 32
+    WORKERS = TransferScheduler.MAX_TRANSFERS + SPARE_WORKERS
+    MAX_QUEUE = 128
+    MAX_IDLE = 500
+    IDLE_TIMEOUT = 15
+    SEND_BUFFER = 1024 * 1024
+    request_queue_size = 1024
+
+    def __init__(self, host, port, app, handler=None, workers=None, idle_timeout=None, max_queue=None, send_buffer=None, metrics=None):
+        """
+        初始化PooledWSGIServer对象，绑定监听套接字并启动工作线程和空闲连接的选择器线程
+
+        参数:
+            host (str): 监听地址
+            port (int): 监听端口，0表示随机端口
+            app: WSGI应用
+            handler (type): 请求处理类，默认为WSGIRequestHandler
+            workers (int): 工作线程数，默认为WORKERS
+            idle_timeout (float): 长连接空闲超时(秒)，默认为IDLE_TIMEOUT
+            max_queue (int): 等待工作线程的连接数上限，默认为MAX_QUEUE
+            send_buffer (int): 连接的SO_SNDBUF大小(字节)，默认为SEND_BUFFER
+            metrics (ServerMetrics): 记录请求计数和耗时的指标对象，默认为None
+        """
+        handler = handler or WSGIRequestHandler
+        handler = type(handler.__name__, (KeepAliveHandlerMixin, handler), {})
+        super().__init__(host, port, app, handler=handler)
+        self.metrics = metrics
+        self.workers = workers or PooledWSGIServer.WORKERS
+        self.idle_timeout = idle_timeout or PooledWSGIServer.IDLE_TIMEOUT
+        self.send_buffer = send_buffer or PooledWSGIServer.SEND_BUFFER
+        self.requests = queue.Queue(max_queue or PooledWSGIServer.MAX_QUEUE)
+        self.lock = threading.Lock()
+        self.connections = set()
+        self.closing = False
+        self.stats = {'accepted': 0, 'busy': 0, 'idle': 0, 'peak_busy': 0, 'peak_queued': 0}
+        # 选择器只由选择器线程操作，工作线程通过parking列表和唤醒套接字移交空闲连接
+        self.selector = selectors.DefaultSelector()
+        self.parking = []
+        self.ready = collections.deque()
+        self.waker, self.wake_writer = socket.socketpair()
+        self.waker.setblocking(False)
+        self.selector.register(self.waker, selectors.EVENT_READ)
+        self.idle_thread = threading.Thread(target=self.watch_idle, name="ota-idle", daemon=True)
+        self.idle_thread.start()
+        self.threads = []
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.work, name=f"ota-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def get_request(self):
+        """
+        接受连接并设置套接字选项
+
+        返回:
+            tuple: (连接套接字, 客户端地址)
+        """
+        connection, client_address = super().get_request()
+        try:
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connection.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.send_buffer)
+        except OSError:
+            pass
+        connection.settimeout(self.idle_timeout)
+        return connection, client_address
+
+    def process_request(self, request, client_address):
+        """
+        将连接放入队列，队列满时等待空闲的工作线程
+
+        参数:
+            request (socket): 连接套接字
+            client_address (tuple): 客户端地址
+        """
+        with self.lock:
+            self.stats['accepted'] += 1
+        while True:
+            try:
+                self.requests.put((request, client_address), timeout=0.5)
+                break
+            except queue.Full:
+                if self.closing:
+                    self.shutdown_request(request)
+                    return
+        with self.lock:
+            self.stats['peak_queued'] = max(self.stats['peak_queued'], self.requests.qsize())
+
+    def finish_request(self, request, client_address):
+        """
+        用请求处理类处理连接上已到达的请求
+
+        返回:
+            KeepAliveHandlerMixin: 处理结束的请求处理对象，parked为True时连接应保持打开
+        """
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def work(self):
+        """
+        工作线程主循环，依次处理队列中的连接直到收到None，
+        长连接处理完已到达的请求后交给选择器线程，其余连接关闭
+        """
+        while True:
+            item = self.requests.get()
+            if item is None:
+                return
+            request, client_address = item
+            with self.lock:
+                self.connections.add(request)
+                self.stats['busy'] += 1
+                self.stats['peak_busy'] = max(self.stats['peak_busy'], self.stats['busy'])
+            handler = None
+            try:
+                handler = self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                with self.lock:
+                    self.connections.discard(request)
+                    self.stats['busy'] -= 1
+                if getattr(handler, 'parked', False):
+                    self.park(request, client_address)
+                else:
+                    self.shutdown_request(request)
+
+    def park(self, request, client_address):
+        """
+        把空闲的长连接交给选择器线程等待下一个请求
+
+        参数:
+            request (socket): 连接套接字
+            client_address (tuple): 客户端地址
+        """
+        with self.lock:
+            if not self.closing:
+                self.parking.append((request, client_address))
+                request = None
+        if request is not None:
+            self.shutdown_request(request)
+            return
+        self.wake()
+
+    def wake(self):
+        """
+        唤醒阻塞在select上的选择器线程
+        """
+        try:
+            self.wake_writer.send(b'\0')
+        except OSError:
+            pass
+
+    def watch_idle(self):
+        """
+        选择器线程主循环：登记工作线程移交的空闲连接，连接可读时放回工作队列，关闭空闲超时的连接；
+        Windows上的select最多只能监视512个套接字，空闲连接超过MAX_IDLE时关闭等待最久的连接
+        """
+        idle = {}
+        while not self.closing:
+            with self.lock:
+                parking, self.parking = self.parking, []
+            now = time.monotonic()
+            for request, client_address in parking:
+                if len(idle) >= PooledWSGIServer.MAX_IDLE:
+                    oldest = min(idle, key=lambda sock: idle[sock][1])
+                    self.selector.unregister(oldest)
+                    del idle[oldest]
+                    self.shutdown_request(oldest)
+                try:
+                    self.selector.register(request, selectors.EVENT_READ)
+                except (ValueError, OSError):
+                    self.shutdown_request(request)
+                    continue
+                idle[request] = (client_address, now)
+
+            # 工作队列满时可读的连接暂存在ready中，下一轮再放入，不阻塞选择器线程
+            while self.ready:
+                try:
+                    self.requests.put_nowait(self.ready[0])
+                except queue.Full:
+                    break
+                self.ready.popleft()
+
+            events = self.selector.select(timeout=0.05 if self.ready else 1)
+            for key, _ in events:
+                sock = key.fileobj
+                if sock is self.waker:
+                    try:
+                        while self.waker.recv(4096):
+                            pass
+                    except OSError:
+                        pass
+                    continue
+                self.selector.unregister(sock)
+                client_address, _ = idle.pop(sock)
+                self.ready.append((sock, client_address))
+
+            now = time.monotonic()
+            for sock, (client_address, since) in list(idle.items()):
+                if now - since > self.idle_timeout:
+                    self.selector.unregister(sock)
+                    del idle[sock]
+                    self.shutdown_request(sock)
+            with self.lock:
+                self.stats['idle'] = len(idle)
+
+        for sock in list(idle) + [request for request, _ in self.ready]:
+            self.shutdown_request(sock)
+        self.selector.close()
+
+    def server_close(self):
+        """
+        关闭监听套接字，断开仍在处理、等待或空闲的连接并结束工作线程和选择器线程
+        """
+        if self.closing:
+            return
+        with self.lock:
+            self.closing = True
+            connections = list(self.connections)
+            parking, self.parking = self.parking, []
+        super().server_close()
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        for request, _ in parking:
+            self.shutdown_request(request)
+        self.wake()
+        self.idle_thread.join(timeout=2)
+        self.waker.close()
+        self.wake_writer.close()
+        while True:
+            try:
+                request, _ = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            self.shutdown_request(request)
+        for _ in self.threads:
+            self.requests.put(None)
+        for thread in self.threads:
+            thread.join(timeout=1)
+
+    def get_stats(self):
+        """
+        获取线程池统计信息
+
+        返回:
+            dict: 包含workers、busy、queued、idle、max_queue、accepted、peak_busy、peak_queued和
+                  connections(处理中、排队与空闲等待的连接数)
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats['idle'] += len(self.parking)
+        stats['workers'] = self.workers
+        stats['queued'] = self.requests.qsize() + len(self.ready)
+        stats['connections'] = stats['busy'] + stats['queued'] + stats['idle']
+        stats['max_queue'] = self.requests.maxsize
+        return stats
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from ..utils import IO, t
+
+class ResponseCache:
+    """
+    checkVersion上游响应的录制/回放缓存类
+    以产品URL和规范化后的请求体为键，把响应保存到磁盘，支持以下模式:
+        cache: TTL内直接使用已保存的响应，过期或未命中时请求上游并保存
+        record: 始终请求上游并保存响应
+        replay: 只使用已保存的响应，未命中时失败，不访问网络
+    """
+    MODES = ('cache', 'record', 'replay')
+    DEFAULT_TTL = 3600
+    # 每台设备各不相同的字段，不参与缓存键，使同型号的不同词典笔可以共享响应
+    IGNORED_FIELDS = ('mid', 'sn', 'serial', 'timestamp', 'ts', 'sign', 'nonce')
+
+    def __init__(self, directory, mode='cache', ttl=None):
+        """
+        初始化ResponseCache对象
+
+        参数:
+            directory (str): 响应保存目录
+            mode (str): 缓存模式，'cache'、'record'或'replay'，默认为'cache'
+            ttl (float): cache模式下响应的有效期(秒)，默认为DEFAULT_TTL
+        """
+        if mode not in ResponseCache.MODES:
+            raise ValueError(mode)
+        self.directory = directory
+        self.mode = mode
+        self.ttl = ResponseCache.DEFAULT_TTL if ttl is None else ttl
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def normalize(request_body):
+        """
+        规范化请求体：去掉设备相关字段并按键排序
+
+        参数:
+            request_body (dict): 请求体
+
+        返回:
+            str: 规范化后的JSON字符串
+        """
+        body = {k: v for k, v in request_body.items() if k not in ResponseCache.IGNORED_FIELDS}
+        return json.dumps(body, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+    def path_for(self, product_url, request_body):
+        """
+        获取请求对应的响应文件路径
+
+        参数:
+            product_url (str): 产品URL路径
+            request_body (dict): 请求体
+
+        返回:
+            str: 响应文件路径
+        """
+        key = product_url + "\n" + ResponseCache.normalize(request_body)
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + ".json")
+
+    def lookup(self, product_url, request_body):
+        """
+        查找已保存的响应
+
+        参数:
+            product_url (str): 产品URL路径
+            request_body (dict): 请求体
+
+        返回:
+            dict: 响应数据，未命中或已过期返回None
+        """
+        if self.mode == 'record':
+            return None
+        path = self.path_for(product_url, request_body)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            IO.warn(t("response_cache_read_fail").format(path, e))
+            return None
+
+        age = time.time() - record.get('recorded_at', 0)
+        if self.mode == 'cache' and age > self.ttl:
+            return None
+        IO.info(t("response_cache_hit").format(self.mode, int(age)))
+        return record['response']
+
+    def store(self, product_url, request_body, response):
+        """
+        保存上游响应
+
+        参数:
+            product_url (str): 产品URL路径
+            request_body (dict): 请求体
+            response (dict): 上游返回的响应数据
+        """
+        if self.mode == 'replay':
+            return
+        path = self.path_for(product_url, request_body)
+        record = {
+            'product_url': product_url,
+            'request_body': request_body,
+            'recorded_at': time.time(),
+            'response': response
+        }
+        with self.lock:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(record, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        IO.debug(t("response_cache_stored").format(path))
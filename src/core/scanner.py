@@ -0,0 +1,173 @@
+import mmap
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+def scan_range(filepath, start, end):
+    """
+    在进程池中扫描文件的[start, end)范围，读取范围之后额外的重叠字节以覆盖跨界特征
+
+    参数:
+        filepath (str): 固件文件路径
+        start (int): 范围起始位置
+        end (int): 范围结束位置，只报告起始于该范围内的特征
+
+    返回:
+        tuple: (SHA256模式列表, MD5模式列表)
+    """
+    sha256 = []
+    md5 = []
+    with open(filepath, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            stop = min(end + SignatureScanner.MAX_SIGNATURE_LENGTH - 1, len(mm))
+            for match in SignatureScanner.PATTERN.finditer(mm, start, stop):
+                if match.start() >= end:
+                    break
+                if match.group(1) is not None:
+                    sha256.append({'type': 'sha256', 'offset': match.start(1), 'length': 64})
+                else:
+                    md5.append({'type': 'md5', 'offset': match.start(2), 'length': 32})
+    return sha256, md5
+
+class SignatureScanner:
+    """
+    固件密码哈希特征扫描类
+    以有界的重叠块增量扫描数据，单次遍历同时查找SHA256和MD5两种特征，内存占用与固件大小无关
+    """
+    # Pattern 1: SHA256, '#' + 64 hex + '  -', 共68字节
+    # Pattern 2: MD5, '= "' + 32 hex + '  -"', 共39字节
+    PATTERN = re.compile(rb'#([0-9a-fA-F]{64})  -|= "([0-9a-fA-F]{32})  -"')
+    MAX_SIGNATURE_LENGTH = 68
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self):
+        """
+        初始化SignatureScanner对象
+        """
+        self.tail = b""
+        self.position = 0
+        self.sha256 = []
+        self.md5 = []
+
+    def update(self, data):
+        """
+        输入下一段连续数据并扫描其中的特征
+
+        参数:
+            data (bytes): 紧接上次数据之后的字节内容
+        """
+        if not data:
+            return
+        window = self.tail + bytes(data)
+        base = self.position - len(self.tail)
+        boundary = len(self.tail)
+
+        for match in self.PATTERN.finditer(window):
+            # 结束于上次保留尾部内的匹配已在上一个窗口中报告过
+            if match.end() <= boundary:
+                continue
+            if match.group(1) is not None:
+                self.sha256.append({'type': 'sha256', 'offset': base + match.start(1), 'length': 64})
+            else:
+                self.md5.append({'type': 'md5', 'offset': base + match.start(2), 'length': 32})
+
+        self.position += len(data)
+        self.tail = window[-(self.MAX_SIGNATURE_LENGTH - 1):]
+
+    def patterns(self):
+        """
+        获取已找到的哈希模式，SHA256在前、MD5在后，与原有查找顺序一致
+
+        返回:
+            list: 哈希模式列表
+        """
+        return self.sha256 + self.md5
+
+    @staticmethod
+    def verify(filepath, patterns):
+        """
+        检查文件中记录的偏移位置是否仍然是完整的哈希特征
+
+        参数:
+            filepath (str): 固件文件路径
+            patterns (list): 哈希模式列表
+
+        返回:
+            bool: 所有偏移位置都匹配时返回True
+        """
+        with open(filepath, 'rb') as f:
+            for pattern in patterns:
+                prefix = 1 if pattern['type'] == 'sha256' else 3
+                suffix = 3 if pattern['type'] == 'sha256' else 4
+                start = pattern['offset'] - prefix
+                if start < 0:
+                    return False
+                f.seek(start)
+                data = f.read(prefix + pattern['length'] + suffix)
+                match = SignatureScanner.PATTERN.fullmatch(data)
+                if not match or match.group(1 if pattern['type'] == 'sha256' else 2) is None:
+                    return False
+        return True
+
+    @staticmethod
+    def scan_file(filepath, chunk_size=None):
+        """
+        分块顺序读取文件并查找所有哈希模式
+
+        参数:
+            filepath (str): 固件文件路径
+            chunk_size (int): 读取块大小，默认为CHUNK_SIZE
+
+        返回:
+            list: 哈希模式列表
+        """
+        scanner = SignatureScanner()
+        size = chunk_size or SignatureScanner.CHUNK_SIZE
+        with open(filepath, 'rb', buffering=0) as f:
+            while True:
+                chunk = f.read(size)
+                if not chunk:
+                    break
+                scanner.update(chunk)
+        return scanner.patterns()
+
+    @staticmethod
+    def scan_file_parallel(filepath, workers=4, range_size=64 * 1024 * 1024, first_only=False):
+        """
+        使用多进程并行扫描文件，各进程映射同一文件并扫描互相重叠的范围，结果按偏移合并去重
+
+        参数:
+            filepath (str): 固件文件路径
+            workers (int): 进程数，小于2时退化为单进程扫描
+            range_size (int): 每个任务扫描的范围大小
+            first_only (bool): 是否在确认第一个模式后提前结束（结果与完整扫描的patterns[0]一致），
+                               只有找到SHA256模式时才能提前确认
+
+        返回:
+            list: 哈希模式列表
+        """
+        size = os.path.getsize(filepath)
+        if workers < 2 or size <= range_size:
+            patterns = SignatureScanner.scan_file(filepath)
+            return patterns[:1] if first_only else patterns
+
+        sha256 = {}
+        md5 = {}
+        executor = ProcessPoolExecutor(max_workers=workers)
+        try:
+            futures = [executor.submit(scan_range, filepath, start, min(start + range_size, size))
+                       for start in range(0, size, range_size)]
+            # 按范围顺序收集，前面所有范围都完成时其中最小偏移的SHA256即为最终的第一个模式
+            for future in futures:
+                found_sha256, found_md5 = future.result()
+                for pattern in found_sha256:
+                    sha256[pattern['offset']] = pattern
+                for pattern in found_md5:
+                    md5[pattern['offset']] = pattern
+                if first_only and sha256:
+                    break
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        patterns = [sha256[k] for k in sorted(sha256)] + [md5[k] for k in sorted(md5)]
+        return patterns[:1] if first_only else patterns
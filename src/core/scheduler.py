@@ -0,0 +1,207 @@
+import asyncio
+import threading
+import time
+
+class Transfer:
+    """单个固件传输的节流状态"""
+
+    def __init__(self, scheduler, client):
+        """
+        初始化Transfer对象
+
+        参数:
+            scheduler (TransferScheduler): 所属调度器
+            client (str): 客户端标识(IP地址)
+        """
+        self.scheduler = scheduler
+        self.client = client
+        self.next_time = time.monotonic()
+        self.sent = 0
+
+    def block_size(self, default):
+        """
+        获取下一次发送的块大小，限速时按约BLOCK_TIME秒的数据量发送以保持平滑
+
+        参数:
+            default (int): 不限速时的块大小
+
+        返回:
+            int: 块大小(字节)
+        """
+        rate = self.scheduler.share(self)
+        if rate is None:
+            return default
+        return max(TransferScheduler.MIN_BLOCK, min(default, int(rate * TransferScheduler.BLOCK_TIME)))
+
+    def pace(self, nbytes):
+        """
+        记录已发送的字节并计算需要等待的时间
+
+        参数:
+            nbytes (int): 本次发送的字节数
+
+        返回:
+            float: 发送下一块前应等待的秒数
+        """
+        self.sent += nbytes
+        if self.scheduler.metrics is not None:
+            self.scheduler.metrics.add_sent(self.client, nbytes)
+        rate = self.scheduler.share(self)
+        if rate is None:
+            return 0
+        now = time.monotonic()
+        # 令牌桶：空闲时最多累积BURST_TIME秒的额度
+        self.next_time = max(self.next_time, now - TransferScheduler.BURST_TIME) + nbytes / rate
+        return max(0.0, self.next_time - now)
+
+class TransferScheduler:
+    """
+    固件传输调度类
+    限制同时进行的传输数，超出的客户端排队等待；可设置全局带宽上限，由正在传输的客户端平分，
+    并可为每个客户端设置令牌桶速率上限，使同一批词典笔以相近的速度完成下载
+    """
+    MAX_TRANSFERS = 64
+    BURST_TIME = 0.1
+    BLOCK_TIME = 0.05
+    MIN_BLOCK = 64 * 1024
+
+    def __init__(self, global_rate=None, client_rate=None, max_transfers=None, metrics=None):
+        """
+        初始化TransferScheduler对象
+
+        参数:
+            global_rate (float): 全局带宽上限(字节/秒)，默认为None表示不限
+            client_rate (float): 每个客户端的带宽上限(字节/秒)，默认为None表示不限
+            max_transfers (int): 同时进行的传输数上限，默认为MAX_TRANSFERS
+            metrics (ServerMetrics): 记录每个客户端已发送字节数的指标对象，默认为None
+        """
+        self.global_rate = global_rate
+        self.client_rate = client_rate
+        self.max_transfers = max_transfers or TransferScheduler.MAX_TRANSFERS
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(self.max_transfers)
+        self.async_slots = None
+        self.clients = {}
+        self.stats = {'active': 0, 'queued': 0, 'completed': 0, 'bytes': 0, 'peak_active': 0}
+
+    def share(self, transfer):
+        """
+        计算传输当前可用的速率
+
+        参数:
+            transfer (Transfer): 传输对象
+
+        返回:
+            float: 速率(字节/秒)，不限速时返回None
+        """
+        if not self.global_rate and not self.client_rate:
+            return None
+        connections = self.clients.get(transfer.client, 1)
+        rates = []
+        if self.global_rate:
+            rates.append(self.global_rate / max(1, len(self.clients)) / connections)
+        if self.client_rate:
+            rates.append(self.client_rate / connections)
+        return min(rates)
+
+    def start(self, client):
+        """
+        登记一个已获得名额的传输
+
+        参数:
+            client (str): 客户端标识
+
+        返回:
+            Transfer: 传输对象
+        """
+        with self.lock:
+            self.clients[client] = self.clients.get(client, 0) + 1
+            self.stats['active'] += 1
+            self.stats['peak_active'] = max(self.stats['peak_active'], self.stats['active'])
+        return Transfer(self, client)
+
+    def finish(self, transfer):
+        """
+        注销传输
+
+        参数:
+            transfer (Transfer): 传输对象
+        """
+        with self.lock:
+            remaining = self.clients.get(transfer.client, 1) - 1
+            if remaining > 0:
+                self.clients[transfer.client] = remaining
+            else:
+                self.clients.pop(transfer.client, None)
+            self.stats['active'] -= 1
+            self.stats['completed'] += 1
+            self.stats['bytes'] += transfer.sent
+
+    def acquire(self, client):
+        """
+        阻塞等待传输名额(线程模型)
+
+        参数:
+            client (str): 客户端标识
+
+        返回:
+            Transfer: 传输对象，用完后调用release
+        """
+        with self.lock:
+            self.stats['queued'] += 1
+        self.slots.acquire()
+        with self.lock:
+            self.stats['queued'] -= 1
+        return self.start(client)
+
+    def release(self, transfer):
+        """
+        归还acquire得到的名额
+
+        参数:
+            transfer (Transfer): 传输对象
+        """
+        self.finish(transfer)
+        self.slots.release()
+
+    async def acquire_async(self, client):
+        """
+        在事件循环中等待传输名额，排队的连接只占用一个挂起的协程
+
+        参数:
+            client (str): 客户端标识
+
+        返回:
+            Transfer: 传输对象，用完后调用release_async
+        """
+        if self.async_slots is None:
+            self.async_slots = asyncio.Semaphore(self.max_transfers)
+        self.stats['queued'] += 1
+        try:
+            await self.async_slots.acquire()
+        finally:
+            self.stats['queued'] -= 1
+        return self.start(client)
+
+    def release_async(self, transfer):
+        """
+        归还acquire_async得到的名额
+
+        参数:
+            transfer (Transfer): 传输对象
+        """
+        self.finish(transfer)
+        self.async_slots.release()
+
+    def get_stats(self):
+        """
+        获取调度统计信息
+
+        返回:
+            dict: 包含active、queued、completed、bytes、peak_active和clients
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats['clients'] = len(self.clients)
+            return stats
@@ -1,10 +1,18 @@
 import threading
-from werkzeug.serving import make_server
-from flask import Flask, jsonify, send_file, request
+from flask import Flask, send_file, request, Response
 import logging
 import os
 import subprocess
+import time
 from ..utils import IO, t
+from .image_sender import SendfileRequestHandler
+from .async_server import AsyncOtaServer
+from .pool_server import PooledWSGIServer
+from .image_map import ImageMapCache
+from .metrics import ServerMetrics, METRICS_ROUTE, CONTENT_TYPE
+from .scheduler import TransferScheduler
+from .check_version import CheckVersionResponse
+from .sessions import response_for_client, image_for_client
 
 app = Flask(__name__)
 
@@ -73,7 +81,11 @@ log.setLevel(logging.ERROR)
 
 class HttpServer:
     """HTTP服务器类，用于提供OTA更新服务"""
-    def __init__(self, port=80, image_path="image.img", update_data=None, progress_callback=None):
+    SERVE_MODES = ('flask', 'sendfile', 'mmap')
+    ENGINES = ('flask', 'asyncio')
+    RETIRE_RETRY = 10
+
+    def __init__(self, port=80, image_path="image.img", update_data=None, progress_callback=None, serve_mode="flask", engine="flask", max_transfers=None, bandwidth_limit=None, client_bandwidth=None, sessions=None, catalog=None, workers=None, idle_timeout=None, warm_image=False):
         """
         初始化HttpServer对象
         
@@ -82,11 +94,38 @@ class HttpServer:
             image_path (str): 固件文件路径，默认为"image.img"
             update_data (dict): 更新数据，默认为None
             progress_callback (function): 进度回调函数，默认为None
+            serve_mode (str): 固件发送方式，'flask'为经由send_file逐块读取；
+                              'sendfile'为可选的零拷贝发送并按时间采样进度(Windows上socket.sendfile退化为普通读写循环，
+                              只在有os.sendfile的平台上更快)；'mmap'为所有下载共享一份只读内存映射，默认为'flask'
+            engine (str): 服务器后端，'flask'为werkzeug固定线程池，'asyncio'为单线程事件循环，默认为'flask'
+            max_transfers (int): 同时进行的固件传输数上限，超出的客户端排队，默认为TransferScheduler.MAX_TRANSFERS
+            bandwidth_limit (float): 全局带宽上限(字节/秒)，由正在下载的客户端平分，默认为None表示不限
+            client_bandwidth (float): 每个客户端的带宽上限(字节/秒)，默认为None表示不限
+            sessions (SessionRegistry): 多设备会话注册表，登记的设备使用各自的更新数据和虚拟固件，默认为None
+            catalog (ProductCatalog): 多产品固件目录，按checkVersion路径中的产品ID应答，默认为None
+            workers (int): flask后端的工作线程数，默认为传输数上限加PooledWSGIServer.SPARE_WORKERS，
+                           传输占满时仍有线程应答checkVersion，多余的下载在传输调度器中排队
+            idle_timeout (float): 长连接空闲超时(秒)，默认使用各后端的IDLE_TIMEOUT
+            warm_image (bool): mmap模式下是否在启动时把固件预读入页缓存，默认为False
         """
         self.port = port
         self.image_path = image_path
         self.update_data = update_data
         self.progress_callback = progress_callback
+        self.serve_mode = serve_mode
+        self.engine = engine
+        self.metrics = ServerMetrics(self.get_stats)
+        self.scheduler = TransferScheduler(bandwidth_limit, client_bandwidth, max_transfers, self.metrics)
+        self.sessions = sessions
+        self.catalog = catalog
+        self.workers = workers
+        self.idle_timeout = idle_timeout
+        self.warm_image = warm_image
+        self.maps = ImageMapCache() if serve_mode == 'mmap' else None
+        self.reload_lock = threading.Lock()
+        self.retire_lock = threading.Lock()
+        self.retired = []
+        self.retire_timer = None
         self.server = None
         self.thread = None
 
@@ -101,15 +140,34 @@ class HttpServer:
             logging.getLogger('werkzeug').setLevel(logging.ERROR)
 
         app.config['UPDATE_DATA'] = self.update_data
+        app.config['CHECK_VERSION_RESPONSE'] = CheckVersionResponse(self.update_data) if self.update_data else None
         app.config['IMAGE_PATH'] = self.image_path
         app.config['PROGRESS_CALLBACK'] = self.progress_callback
+        app.config['TRANSFER_SCHEDULER'] = self.scheduler
+        app.config['SESSION_REGISTRY'] = self.sessions
+        app.config['PRODUCT_CATALOG'] = self.catalog
+        app.config['IMAGE_MAPS'] = self.maps
+        app.config['METRICS'] = self.metrics
+        if self.maps is not None and self.warm_image:
+            mapped = self.maps.get(self.image_path)
+            if mapped is not None:
+                mapped.warm_up()
+                IO.info(t("image_warmed").format(self.image_path, mapped.size / 1024 / 1024))
 
         IO.info(t("server_start").format(self.port))
         
         try:
-            self.server = make_server('0.0.0.0', self.port, app, threaded=True)
+            if self.engine == 'asyncio':
+                self.server = AsyncOtaServer('0.0.0.0', self.port, app.config, idle_timeout=self.idle_timeout)
+            else:
+                request_handler = SendfileRequestHandler if self.serve_mode in ('sendfile', 'mmap') else None
+                workers = self.workers or self.scheduler.max_transfers + PooledWSGIServer.SPARE_WORKERS
+                self.server = PooledWSGIServer('0.0.0.0', self.port, app, handler=request_handler,
+                                               workers=workers, idle_timeout=self.idle_timeout, metrics=self.metrics)
+            self.metrics.start()
             self.server.serve_forever()
         except Exception as e:
+            self.metrics.stop()
             is_port_error = False
             if isinstance(e, OSError) and (e.errno in (10013, 10048) or getattr(e, 'winerror', 0) in (10013, 10048)):
                 is_port_error = True
@@ -124,6 +182,101 @@ class HttpServer:
                 IO.error(t("server_start_fail").format(e))
             raise e
 
+    def set_update_data(self, update_data):
+        """
+        安装新的更新数据并重新生成预序列化的checkVersion响应
+        原地修改了update_data字典后也应调用此方法
+
+        参数:
+            update_data (dict): 更新数据
+        """
+        self.reload(update_data=update_data)
+
+    def reload(self, update_data=None, image_path=None, retire=False):
+        """
+        在服务器运行时原子地替换更新数据和固件，无需重启或重新绑定端口
+        正在进行的下载继续使用已打开的旧文件句柄，新请求立即使用新版本；
+        新固件应写到另一个文件名再传入image_path，Windows上正在传输或被映射的文件不能被替换，也不能原地修改
+
+        参数:
+            update_data (dict): 新的更新数据，默认为None表示保持不变
+            image_path (str): 新的固件路径，默认为None表示保持不变
+            retire (bool): 换用新固件后是否删除旧固件，仍在传输时等传输结束后再删除，默认为False
+
+        返回:
+            bool: 是否已替换
+        """
+        with self.reload_lock:
+            previous = self.image_path
+            if image_path is not None:
+                image_path = os.path.abspath(image_path)
+                if not os.path.exists(image_path):
+                    IO.error(t("reload_image_missing").format(image_path))
+                    return False
+                self.image_path = image_path
+            if update_data is not None:
+                self.update_data = update_data
+            # 先生成响应字节，再一次性替换配置项，请求不会看到只更新了一半的状态
+            prepared = CheckVersionResponse(self.update_data) if self.update_data else None
+            app.config.update({
+                'UPDATE_DATA': self.update_data,
+                'CHECK_VERSION_RESPONSE': prepared,
+                'IMAGE_PATH': self.image_path
+            })
+        IO.info(t("server_reloaded").format(self.image_path))
+        if previous != self.image_path:
+            if self.maps is not None:
+                self.maps.discard(previous)
+            if retire:
+                self.retire_image(previous)
+        return True
+
+    def retire_image(self, path):
+        """
+        删除不再提供的旧固件，文件仍被传输占用(Windows上无法删除打开的文件)时稍后重试
+
+        参数:
+            path (str): 旧固件路径
+        """
+        with self.retire_lock:
+            if path not in self.retired:
+                self.retired.append(path)
+        self.purge_retired()
+
+    def purge_retired(self):
+        """
+        尝试删除所有待删除的旧固件，仍有文件删除失败且服务器在运行时RETIRE_RETRY秒后重试
+        """
+        with self.retire_lock:
+            self.retire_timer = None
+            remaining = []
+            for path in self.retired:
+                try:
+                    os.remove(path)
+                    IO.info(t("image_retired").format(path))
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    remaining.append(path)
+            self.retired = remaining
+            if remaining and self.server is not None:
+                self.retire_timer = threading.Timer(HttpServer.RETIRE_RETRY, self.purge_retired)
+                self.retire_timer.daemon = True
+                self.retire_timer.start()
+
+    def get_stats(self):
+        """
+        获取服务器统计信息
+
+        返回:
+            dict: transfers为传输调度统计，pool为flask后端的线程池统计(其他后端或未运行时为None)，
+                  connections为当前打开的连接数
+        """
+        server = self.server
+        engine = server.get_stats() if server is not None else {}
+        pool = engine if isinstance(server, PooledWSGIServer) else None
+        return {'transfers': self.scheduler.get_stats(), 'pool': pool, 'connections': engine.get('connections', 0)}
+
     def start_threaded(self, error_callback=None):
         """
         在单独的线程中启动服务器
@@ -155,6 +308,13 @@ class HttpServer:
                 IO.warn(t("server_shutdown_error").format(e))
             finally:
                 self.server = None
+                if self.maps is not None:
+                    self.maps.clear()
+                self.metrics.stop()
+                with self.retire_lock:
+                    if self.retire_timer is not None:
+                        self.retire_timer.cancel()
+                self.purge_retired()
                 IO.info(t("server_stopped"))
 
     @staticmethod
@@ -207,11 +367,18 @@ def handle_check_version(subpath):
     """
     if "ota/checkVersion" in subpath:
         IO.info(t("ota_check_received").format(subpath))
-        update_data = app.config.get('UPDATE_DATA')
-        if update_data:
-            return jsonify(update_data)
-        else:
+        prepared = response_for_client(app.config, request.remote_addr, request.get_json(silent=True), request.path)
+        metrics = app.config.get('METRICS')
+        if prepared is None:
+            if metrics is not None:
+                metrics.count_check_version(None)
             return "No update data configured", 500
+        status, headers, body = prepared.render(
+            accept_gzip=request.accept_encodings['gzip'] > 0,
+            if_none_match=request.headers.get('If-None-Match'))
+        if metrics is not None:
+            metrics.count_check_version(status, headers)
+        return Response(body, status=status, headers=headers)
     return "Not Found", 404
 
 @app.route('/image.img', methods=['GET'])
@@ -223,33 +390,145 @@ def serve_image():
         Response: 固件文件或错误信息
     """
     image_path = app.config.get('IMAGE_PATH')
-    progress_callback = app.config.get('PROGRESS_CALLBACK')
     
     IO.info(t("image_request_received").format(request.remote_addr))
+
+    registry = app.config.get('SESSION_REGISTRY')
+    session = registry.for_image(request.remote_addr) if registry is not None else None
+    if session is not None:
+        return schedule_transfer(stream_virtual_image(session.image))
     
     if os.path.exists(image_path):
         IO.info(t("serving_firmware").format(image_path))
-        
-        if progress_callback:
-            try:
-                wrapper = ProgressFileWrapper(image_path, progress_callback)
-                
-                return send_file(
-                    wrapper, 
-                    mimetype='application/octet-stream', 
-                    as_attachment=True, 
-                    download_name='image.img',
-                    conditional=True
-                )
-            except Exception as e:
-                IO.error(t("serve_progress_error").format(e))
-                return send_file(image_path, conditional=True)
-        else:
-            return send_file(image_path, conditional=True)
+        return send_image_file(image_path, 'image.img')
     else:
         IO.error(t("firmware_not_found"))
         return "File not found", 404
 
+def send_image_file(image_path, download_name):
+    """
+    flask发送方式下发送固件文件，设置了进度回调时报告进度，正文经传输调度器限速、排队并计数
+    
+    参数:
+        image_path (str): 固件路径
+        download_name (str): 下载文件名
+    
+    返回:
+        Response: 固件响应
+    """
+    progress_callback = app.config.get('PROGRESS_CALLBACK')
+    if progress_callback:
+        try:
+            wrapper = ProgressFileWrapper(image_path, progress_callback)
+            
+            return schedule_transfer(send_file(
+                wrapper, 
+                mimetype='application/octet-stream', 
+                as_attachment=True, 
+                download_name=download_name,
+                conditional=True
+            ))
+        except Exception as e:
+            IO.error(t("serve_progress_error").format(e))
+    return schedule_transfer(send_file(image_path, conditional=True))
+
+def schedule_transfer(response):
+    """
+    flask发送方式下让固件正文经过TransferScheduler：开始发送前占用传输名额，
+    每块数据按全局和单客户端带宽节流并记录发送的字节数，发送结束或连接断开后释放名额
+    
+    参数:
+        response (Response): 固件响应
+    
+    返回:
+        Response: 原响应，正文被替换为受调度的迭代器
+    """
+    scheduler = app.config.get('TRANSFER_SCHEDULER')
+    if scheduler is None or response.status_code not in (200, 206):
+        return response
+    body = response.response
+    client = request.remote_addr
+
+    def generate():
+        transfer = scheduler.acquire(client)
+        try:
+            for chunk in body:
+                yield chunk
+                delay = transfer.pace(len(chunk))
+                if delay:
+                    time.sleep(delay)
+        finally:
+            scheduler.release(transfer)
+            if hasattr(body, 'close'):
+                body.close()
+
+    response.response = generate()
+    return response
+
+def stream_virtual_image(image):
+    """
+    以流式响应发送设备会话的虚拟固件(flask发送方式下不支持Range)
+    
+    参数:
+        image (VirtualImage): 虚拟固件
+    
+    返回:
+        Response: 流式响应
+    """
+    size, etag, last_modified = image.validators()
+    IO.info(t("serving_firmware").format(image.base_path))
+
+    def generate():
+        with open(image.base_path, 'rb') as f:
+            for offset, length, data in image.pieces(0, size):
+                if data is not None:
+                    yield data
+                    continue
+                f.seek(offset)
+                remaining = length
+                while remaining > 0:
+                    chunk = f.read(min(1024 * 1024, remaining))
+                    if not chunk:
+                        return
+                    remaining -= len(chunk)
+                    yield chunk
+
+    headers = {'Content-Length': str(size), 'ETag': etag, 'Last-Modified': last_modified,
+               'Content-Disposition': 'attachment; filename=image.img'}
+    return Response(generate(), mimetype='application/octet-stream', headers=headers)
+
+@app.route('/images/<name>.img', methods=['GET'])
+def serve_catalog_image(name):
+    """
+    提供产品目录中的固件下载
+    
+    参数:
+        name (str): 产品ID
+    
+    返回:
+        Response: 固件文件或错误信息
+    """
+    IO.info(t("image_request_received").format(request.remote_addr))
+    image = image_for_client(app.config, request.remote_addr, request.path)
+    if image is None:
+        IO.error(t("firmware_not_found"))
+        return "File not found", 404
+    IO.info(t("serving_firmware").format(image.base_path))
+    return send_image_file(image.base_path, f"{name}.img")
+
+@app.route(METRICS_ROUTE, methods=['GET'])
+def serve_metrics():
+    """
+    以Prometheus文本格式提供服务器指标
+    
+    返回:
+        Response: 指标文本
+    """
+    metrics = app.config.get('METRICS')
+    if metrics is None:
+        return "Not Found", 404
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
 @app.route('/<path:subpath>/ota/checkVersion', methods=['POST'])
 def handle_check_version_explicit(subpath):
     """
@@ -0,0 +1,281 @@
+import hashlib
+import json
+import os
+import threading
+from email.utils import formatdate
+from ..utils import IO, t
+from .check_version import CheckVersionResponse
+from .catalog import CATALOG_IMAGE_PREFIX
+from .patcher import Patcher
+from .scanner import SignatureScanner
+
+class VirtualImage:
+    """
+    虚拟固件类
+    由共享的基础固件和少量按偏移覆盖的字节组成，发送时基础部分直接从文件发送，
+    覆盖部分从内存写出，不需要为每台设备写出完整的固件副本
+    """
+
+    def __init__(self, base_path, overlay=None):
+        """
+        初始化VirtualImage对象
+
+        参数:
+            base_path (str): 基础固件路径
+            overlay (list): (偏移, 字节)列表，默认为None表示不覆盖
+        """
+        self.base_path = base_path
+        self.overlay = sorted((offset, bytes(data)) for offset, data in (overlay or []) if data)
+
+    def validators(self, f=None):
+        """
+        获取虚拟固件的大小、强ETag和Last-Modified
+
+        参数:
+            f: 已打开的基础固件文件对象，给出时以该句柄为准，不受文件随后被替换的影响
+
+        返回:
+            tuple: (size, etag, last_modified)
+        """
+        st = os.fstat(f.fileno()) if f is not None else os.stat(self.base_path)
+        size = st.st_size
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        last_modified = formatdate(st.st_mtime, usegmt=True)
+        if self.overlay:
+            digest = hashlib.sha1()
+            for offset, data in self.overlay:
+                digest.update(f"{offset}:".encode() + data)
+            etag = etag[:-1] + '-' + digest.hexdigest()[:16] + '"'
+        return size, etag, last_modified
+
+    def pieces(self, start, end):
+        """
+        将[start, end)拆分为基础文件片段和覆盖片段
+
+        参数:
+            start (int): 起始位置
+            end (int): 结束位置
+
+        返回:
+            generator: 依次产生(offset, length, data)，data为None表示从基础文件发送
+        """
+        position = start
+        for offset, data in self.overlay:
+            overlay_end = offset + len(data)
+            if overlay_end <= position:
+                continue
+            if offset >= end:
+                break
+            if offset > position:
+                yield position, offset - position, None
+                position = offset
+            cut = data[position - offset:min(end, overlay_end) - offset]
+            yield position, len(cut), cut
+            position += len(cut)
+        if position < end:
+            yield position, end - position, None
+
+    def read(self, start, end):
+        """
+        读取虚拟固件的[start, end)范围
+
+        返回:
+            bytes: 数据
+        """
+        chunks = []
+        with open(self.base_path, 'rb') as f:
+            for offset, length, data in self.pieces(start, end):
+                if data is None:
+                    f.seek(offset)
+                    data = f.read(length)
+                chunks.append(data)
+        return b''.join(chunks)
+
+class DeviceSession:
+    """单台设备的会话，持有该设备的更新数据和虚拟固件"""
+
+    def __init__(self, key, update_data, image):
+        """
+        初始化DeviceSession对象
+
+        参数:
+            key (str): 会话键(设备序列号或客户端IP)
+            update_data (dict): 该设备的更新数据
+            image (VirtualImage): 该设备的虚拟固件
+        """
+        self.key = key
+        self.update_data = update_data
+        self.image = image
+        self.prepared = None
+
+    def response(self):
+        """
+        获取该设备的预序列化checkVersion响应，更新数据对象被替换后重新生成
+
+        返回:
+            CheckVersionResponse: 预序列化响应
+        """
+        if self.prepared is None or self.prepared.source is not self.update_data:
+            self.prepared = CheckVersionResponse(self.update_data)
+        return self.prepared
+
+class SessionRegistry:
+    """
+    多设备会话注册表类
+    checkVersion请求体中带有已登记的设备序列号时使用对应会话，并把发起请求的IP绑定到该会话，
+    之后该IP的固件下载请求使用同一会话；也可以直接以客户端IP登记会话
+    """
+    IDENTITY_FIELDS = ('sn', 'serial', 'mid')
+
+    def __init__(self):
+        """
+        初始化SessionRegistry对象
+        """
+        self.lock = threading.Lock()
+        self.sessions = {}
+        self.bindings = {}
+
+    def add(self, key, update_data, image):
+        """
+        登记会话
+
+        参数:
+            key (str): 设备序列号或客户端IP
+            update_data (dict): 该设备的更新数据
+            image (VirtualImage): 该设备的虚拟固件
+
+        返回:
+            DeviceSession: 会话对象
+        """
+        session = DeviceSession(str(key), update_data, image)
+        with self.lock:
+            self.sessions[session.key] = session
+        return session
+
+    def for_check(self, client_ip, body):
+        """
+        查找checkVersion请求对应的会话，并绑定客户端IP
+
+        参数:
+            client_ip (str): 客户端IP
+            body (dict): 请求体，可为None
+
+        返回:
+            DeviceSession: 会话对象，未登记时返回None
+        """
+        with self.lock:
+            session = None
+            if isinstance(body, dict):
+                for field in SessionRegistry.IDENTITY_FIELDS:
+                    value = body.get(field)
+                    if value is not None and str(value) in self.sessions:
+                        session = self.sessions[str(value)]
+                        break
+            if session is None:
+                session = self.sessions.get(client_ip)
+            if session is not None:
+                self.bindings[client_ip] = session.key
+            return session
+
+    def for_image(self, client_ip):
+        """
+        查找固件下载请求对应的会话
+
+        参数:
+            client_ip (str): 客户端IP
+
+        返回:
+            DeviceSession: 会话对象，未登记时返回None
+        """
+        with self.lock:
+            key = self.bindings.get(client_ip, client_ip)
+            return self.sessions.get(key)
+
+    @staticmethod
+    def from_manifest(manifest_path, base_image, interface_ip=None):
+        """
+        根据VariantFactory.save写出的清单创建会话注册表
+        生成变体时写入的下载地址是生成时的--interface，这里改写为实际提供服务的网卡地址；
+        叠加补丁字节前先确认基础固件在每个变体记录的偏移处仍是完整的哈希特征，固件已被替换或修改时拒绝加载
+
+        参数:
+            manifest_path (str): manifest.json路径
+            base_image (str): 生成变体时使用的未修改固件路径
+            interface_ip (str): 提供服务的网卡IP地址，默认为None表示保留清单中的下载地址
+
+        返回:
+            SessionRegistry: 会话注册表
+
+        异常:
+            ValueError: 基础固件与清单不匹配
+        """
+        registry = SessionRegistry()
+        directory = os.path.dirname(os.path.abspath(manifest_path))
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        patterns = [{'type': 'sha256' if len(item['hash']) == 64 else 'md5', 'offset': item['offset'], 'length': len(item['hash'])}
+                    for item in manifest]
+        if not SignatureScanner.verify(base_image, patterns):
+            raise ValueError(t("sessions_base_mismatch").format(base_image, manifest_path))
+        for item in manifest:
+            with open(os.path.join(directory, item['update_data']), 'r', encoding='utf-8') as f:
+                update_data = json.load(f)
+            if interface_ip:
+                Patcher.set_image_url(update_data, f"http://{interface_ip}/image.img")
+            image = VirtualImage(base_image, [(item['offset'], item['hash'].encode())])
+            registry.add(item['name'], update_data, image)
+        IO.info(t("sessions_loaded").format(len(manifest), manifest_path))
+        return registry
+
+def image_for_client(config, client_ip, path="/image.img"):
+    """
+    获取客户端应下载的固件
+
+    参数:
+        config (dict): Flask应用配置
+        client_ip (str): 客户端IP
+        path (str): 请求路径，/images/<产品ID>.img对应产品目录中的固件
+
+    返回:
+        VirtualImage: 产品目录或会话中的固件，未登记时为全局IMAGE_PATH，文件不存在时返回None
+    """
+    if path.startswith(CATALOG_IMAGE_PREFIX):
+        catalog = config.get('PRODUCT_CATALOG')
+        entry = catalog.for_image(path) if catalog is not None else None
+        if entry is None or not os.path.exists(entry.image_path):
+            return None
+        return VirtualImage(entry.image_path)
+    registry = config.get('SESSION_REGISTRY')
+    if registry is not None:
+        session = registry.for_image(client_ip)
+        if session is not None:
+            return session.image
+    image_path = config.get('IMAGE_PATH')
+    if image_path and os.path.exists(image_path):
+        return VirtualImage(image_path)
+    return None
+
+def response_for_client(config, client_ip, body, path=None):
+    """
+    获取客户端应收到的checkVersion响应，依次查找设备会话、产品目录和全局更新数据
+
+    参数:
+        config (dict): Flask应用配置
+        client_ip (str): 客户端IP
+        body (dict): 请求体，可为None
+        path (str): 请求路径，用于按产品ID查找产品目录
+
+    返回:
+        CheckVersionResponse: 预序列化响应，没有可用的更新数据时返回None
+    """
+    registry = config.get('SESSION_REGISTRY')
+    if registry is not None:
+        session = registry.for_check(client_ip, body)
+        if session is not None:
+            return session.response()
+    catalog = config.get('PRODUCT_CATALOG')
+    if catalog is not None:
+        entry = catalog.for_path(path)
+        if entry is not None:
+            return entry.response()
+    return CheckVersionResponse.for_config(config)
@@ -0,0 +1,71 @@
+import threading
+from ..utils import IO, t
+
+class SingleFlight:
+    """
+    单飞请求合并类
+    同一键上同时只执行一次调用，其余并发调用方等待并共享该调用的结果，并统计被合并的请求数
+    """
+
+    def __init__(self, name=""):
+        """
+        初始化SingleFlight对象
+
+        参数:
+            name (str): 名称，用于日志输出
+        """
+        self.name = name
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stats = {'executed': 0, 'coalesced': 0}
+
+    def do(self, key, fn):
+        """
+        执行或加入键对应的调用
+
+        参数:
+            key (hashable): 合并键
+            fn (function): 无参数的调用函数
+
+        返回:
+            tuple: (结果, 是否为共享的结果)，fn抛出的异常会传递给所有等待的调用方
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'event': threading.Event(), 'result': None, 'error': None}
+                self.calls[key] = call
+                self.stats['executed'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            IO.info(t("request_coalesced").format(self.name, key))
+            call['event'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result'], True
+
+        try:
+            call['result'] = fn()
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['event'].set()
+        return call['result'], False
+
+    def get_stats(self):
+        """
+        获取合并统计信息
+
+        返回:
+            dict: 包含executed(实际执行次数)、coalesced(被合并次数)和inflight(进行中的键数)
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats['inflight'] = len(self.calls)
+            return stats
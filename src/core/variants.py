@@ -0,0 +1,207 @@
+import copy
+import json
+import os
+from ..utils import IO, t
+from .hasher import DigestEngine, SegmentIndex
+from .patcher import Patcher
+
+class PasswordVariant:
+    """密码变体类，用于存储单个设备的补丁内容和更新数据"""
+    def __init__(self, name, password, offset, new_hash, update_data=None):
+        """
+        初始化PasswordVariant对象
+
+        参数:
+            name (str): 变体名称（如设备序列号）
+            password (str): 新密码
+            offset (int): 哈希在固件中的偏移量
+            new_hash (str): 写入固件的新哈希值
+            update_data (dict): 该变体对应的更新数据
+        """
+        self.name = name
+        self.password = password
+        self.offset = offset
+        self.new_hash = new_hash
+        self.update_data = update_data
+
+class VariantFactory:
+    """
+    密码变体工厂类，基于同一份原始固件批量生成不同密码的更新数据
+    补丁偏移之前的数据只计算一次并复制哈希状态，补丁之后的数据只读取一次并同时
+    输入所有变体，不需要为每台设备复制固件
+    """
+    CHUNK_SIZE = DigestEngine.CHUNK_SIZE
+
+    def __init__(self, image_path, update_data, pattern=None):
+        """
+        初始化VariantFactory对象
+
+        参数:
+            image_path (str): 未修改的原始固件路径
+            update_data (dict): 上游返回的更新数据
+            pattern (dict): 哈希模式，默认为None时使用find_hash_patterns找到的第一个
+        """
+        self.image_path = image_path
+        self.update_data = update_data
+        self.pattern = pattern
+
+    def build(self, passwords, interface_ip):
+        """
+        为每个密码生成对应的更新数据
+
+        参数:
+            passwords (list): (名称, 密码)元组列表
+            interface_ip (str): 本地接口IP地址，用于构建本地URL
+
+        返回:
+            list: PasswordVariant对象列表，失败返回None
+        """
+        pattern = self.pattern
+        if pattern is None:
+            patterns = Patcher.find_hash_patterns(self.image_path)
+            if not patterns:
+                IO.error(t("no_passwords_found"))
+                return None
+            pattern = patterns[0]
+
+        offset = pattern['offset']
+        patch_end = offset + pattern['length']
+
+        segment_md5 = self.load_segments()
+        segments = [(item['startpos'], item['endpos']) for item in segment_md5]
+
+        # 与补丁范围重叠的分段随密码变化，其余分段所有变体共用
+        touched = SegmentIndex(segments).overlapping(offset, patch_end)
+        shared = [i for i in range(len(segments)) if i not in touched]
+
+        shared_engine = DigestEngine([segments[i] for i in shared], md5=False, sha1=False)
+        base_engine = DigestEngine([segments[i] for i in touched])
+
+        variants = []
+        for name, password in passwords:
+            new_hash = Patcher.hash_password(password, pattern['type'])
+            variants.append(PasswordVariant(name, password, offset, new_hash))
+
+        IO.info(t("variant_building").format(len(variants)))
+
+        buffer = bytearray(self.CHUNK_SIZE)
+        with open(self.image_path, "rb", buffering=0) as f:
+            self.feed_range(f, buffer, 0, offset, [shared_engine, base_engine])
+
+            original = f.read(patch_end - offset)
+            shared_engine.update(original)
+            engines = []
+            for variant in variants:
+                engine = base_engine.copy()
+                engine.update(variant.new_hash.encode())
+                engines.append(engine)
+
+            self.feed_range(f, buffer, patch_end, None, [shared_engine] + engines)
+
+        shared_result = shared_engine.result()
+        for variant, engine in zip(variants, engines):
+            result = engine.result()
+            items = copy.deepcopy(segment_md5)
+            for index, md5 in zip(shared, shared_result.segment_md5):
+                items[index]['md5'] = md5
+            for index, md5 in zip(touched, result.segment_md5):
+                items[index]['md5'] = md5
+            variant.update_data = Patcher.apply_version_data(
+                copy.deepcopy(self.update_data), items, result.md5, result.sha1, interface_ip)
+
+        return variants
+
+    def load_segments(self):
+        """
+        解析更新数据中的segmentMd5字段
+
+        返回:
+            list: 分段信息列表
+        """
+        segment_md5 = self.update_data['data']['version']['segmentMd5']
+        if isinstance(segment_md5, str):
+            return json.loads(segment_md5)
+        return copy.deepcopy(segment_md5)
+
+    @staticmethod
+    def feed_range(f, buffer, start, end, engines):
+        """
+        从文件读取[start, end)范围的数据并依次输入所有哈希引擎
+
+        参数:
+            f: 以二进制模式打开的文件对象
+            buffer (bytearray): 读取缓冲区
+            start (int): 起始位置
+            end (int): 结束位置，为None时读取到文件末尾
+            engines (list): DigestEngine对象列表
+        """
+        view = memoryview(buffer)
+        f.seek(start)
+        remaining = None if end is None else end - start
+        while remaining is None or remaining > 0:
+            size = len(buffer) if remaining is None else min(len(buffer), remaining)
+            n = f.readinto(view[:size])
+            if not n:
+                break
+            for engine in engines:
+                engine.update(view[:n])
+            if remaining is not None:
+                remaining -= n
+
+    @staticmethod
+    def save(variants, output_dir):
+        """
+        将每个变体的更新数据保存为JSON文件，并写入汇总清单
+
+        参数:
+            variants (list): PasswordVariant对象列表
+            output_dir (str): 输出目录
+
+        返回:
+            str: 清单文件路径
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        manifest = []
+        for variant in variants:
+            filename = f"{variant.name}.json"
+            with open(os.path.join(output_dir, filename), 'w', encoding='utf-8') as f:
+                json.dump(variant.update_data, f, indent=2)
+            manifest.append({
+                'name': variant.name,
+                'offset': variant.offset,
+                'hash': variant.new_hash,
+                'update_data': filename
+            })
+
+        manifest_path = os.path.join(output_dir, "manifest.json")
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        IO.info(t("variant_saved").format(len(variants), output_dir))
+        return manifest_path
+
+if __name__ == "__main__":
+    """
+    变体工厂命令行入口，密码文件每行格式为"名称 密码"
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description="Build per-device password variants from one firmware image")
+    parser.add_argument("--image", default="image.img", help="Unpatched firmware image")
+    parser.add_argument("--update-data", required=True, help="Upstream checkVersion response JSON")
+    parser.add_argument("--passwords", required=True, help="Text file with one 'name password' pair per line")
+    parser.add_argument("--interface", default="192.168.137.1", help="Local IP used in the image URL")
+    parser.add_argument("--output-dir", default="variants", help="Directory for per-variant update data")
+    args = parser.parse_args()
+
+    with open(args.update_data, 'r', encoding='utf-8') as f:
+        base_update_data = json.load(f)
+
+    pairs = []
+    with open(args.passwords, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.strip().split(None, 1)
+            if len(parts) == 2:
+                pairs.append((parts[0], parts[1]))
+
+    built = VariantFactory(args.image, base_update_data).build(pairs, args.interface)
+    if built:
+        VariantFactory.save(built, args.output_dir)
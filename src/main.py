@@ -8,6 +8,7 @@ if __name__ == "__main__" and __package__ is None:
     __package__ = "src"
 
 import argparse
+import multiprocessing
 from .utils.i18n import t
 from .app import PaperPApp
 
@@ -21,8 +22,31 @@ def main():
     parser.add_argument("--lang", choices=['en', 'cn'], help="Language (en/cn)")
     parser.add_argument("--debug", action="store_true", help="Enable debug mode with verbose output")
     parser.add_argument("--cli", action="store_true", help="Run in CLI mode (default is GUI)")
+    parser.add_argument("--hash-workers", type=int, default=1, help="Number of threads used to hash the patched firmware (1 = single thread)")
+    parser.add_argument("--verify-segments", action="store_true", help="Verify untouched segments against the upstream MD5s when rehashing")
+    parser.add_argument("--scan-workers", type=int, default=1, help="Number of processes used to scan the firmware for password signatures (1 = single process)")
+    parser.add_argument("--no-index-cache", action="store_true", help="Do not use the cached password signature offsets next to the firmware image")
+    parser.add_argument("--download-connections", type=int, default=1, help="Number of parallel connections used to download the firmware when the server supports ranges")
+    parser.add_argument("--firmware-cache", help="Directory of the local firmware cache shared across sessions (disabled when omitted)")
+    parser.add_argument("--firmware-cache-mb", type=int, help="Disk budget of the firmware cache in MB (default 4096)")
+    parser.add_argument("--response-cache", help="Directory where upstream checkVersion responses are recorded and replayed (disabled when omitted)")
+    parser.add_argument("--response-cache-mode", choices=['cache', 'record', 'replay'], default='cache', help="cache: reuse fresh responses, record: always fetch and save, replay: never contact upstream")
+    parser.add_argument("--response-cache-ttl", type=float, help="Seconds a recorded response stays fresh in cache mode (default 3600)")
+    parser.add_argument("--serve-mode", choices=['flask', 'sendfile', 'mmap'], default='flask', help="How image.img is served: Flask send_file (default), opt-in zero-copy sendfile with sampled progress (fastest where os.sendfile exists, e.g. Linux), or slices of one shared read-only mmap")
+    parser.add_argument("--warm-image", action="store_true", help="With --serve-mode mmap, read the whole image into the page cache at server startup")
+    parser.add_argument("--server-engine", choices=['flask', 'asyncio'], default='flask', help="OTA server backend: werkzeug thread per connection, or a single asyncio event loop for many pens")
+    parser.add_argument("--max-transfers", type=int, help="Maximum number of simultaneous image transfers, further pens wait in a queue (default 64)")
+    parser.add_argument("--server-workers", type=int, help="Worker threads of the flask server engine, further connections wait in a bounded queue; idle keep-alive connections do not hold a worker (default --max-transfers + 32)")
+    parser.add_argument("--idle-timeout", type=float, help="Seconds an idle keep-alive connection is kept open (default 15 for flask, 30 for asyncio)")
+    parser.add_argument("--bandwidth-limit", type=float, help="Total bandwidth for serving image.img in MB/s, shared fairly between downloading pens (unlimited when omitted)")
+    parser.add_argument("--client-bandwidth", type=float, help="Per-pen bandwidth cap in MB/s (unlimited when omitted)")
+    parser.add_argument("--catalog", help="Directory of the multi-product catalog; the patched product is added to it and every catalogued model is served at /images/<product id>.img")
+    parser.add_argument("--serve-catalog", action="store_true", help="Skip capture and patching and only serve the products already in --catalog (requires --cli, the GUI always runs the capture and patch steps)")
+    parser.add_argument("--variants", help="manifest.json written by the variant factory; serve each listed pen (by serial or IP) its own patched view of the unmodified image")
     
     args = parser.parse_args()
+    if args.serve_catalog and not args.cli:
+        parser.error("--serve-catalog requires --cli")
     
     if not args.cli:
         try:
@@ -42,7 +66,28 @@ def main():
         interface=args.interface,
         image_path=args.image,
         lang=args.lang,
-        debug=args.debug
+        debug=args.debug,
+        hash_workers=args.hash_workers,
+        verify_segments=args.verify_segments,
+        scan_workers=args.scan_workers,
+        index_cache=not args.no_index_cache,
+        download_connections=args.download_connections,
+        firmware_cache=args.firmware_cache,
+        firmware_cache_budget=args.firmware_cache_mb * 1024 * 1024 if args.firmware_cache_mb else None,
+        response_cache=args.response_cache,
+        response_cache_mode=args.response_cache_mode,
+        response_cache_ttl=args.response_cache_ttl,
+        serve_mode=args.serve_mode,
+        warm_image=args.warm_image,
+        server_engine=args.server_engine,
+        max_transfers=args.max_transfers,
+        server_workers=args.server_workers,
+        idle_timeout=args.idle_timeout,
+        bandwidth_limit=args.bandwidth_limit * 1024 * 1024 if args.bandwidth_limit else None,
+        client_bandwidth=args.client_bandwidth * 1024 * 1024 if args.client_bandwidth else None,
+        variants=args.variants,
+        catalog=args.catalog,
+        serve_catalog=args.serve_catalog
     )
     
     app.run()
@@ -51,6 +96,7 @@ if __name__ == "__main__":
     """
     程序入口点
     """
+    multiprocessing.freeze_support()
     try:
         main()
     except Exception as e:
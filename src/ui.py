@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import ttk, scrolledtext, simpledialog, messagebox
 import threading
 import queue
+import copy
 import time
 import sys
 import os
@@ -17,10 +18,11 @@ from .utils.io import IO, require_admin
 from .utils.i18n import I18N, t
 from .app import PaperPApp
 from .core.capture import capture_ota_request
-from .core.downloader import get_update_data, download_file
+from .core.downloader import get_update_data, download_file, DownloadPipeline, log_coalescing_stats
 from .core.patcher import Patcher
 from .core.host import HostManager
 from .core.server import HttpServer
+from .core.firmware_cache import link_or_copy
 
 class GUIInputHandler:
     """GUI输入处理器，将IO输入重定向到GUI对话框"""
@@ -309,6 +311,10 @@ class PaperUI:
 
         self.steps = []
         self.current_step_index = 0
+        # 服务器运行中重新修改固件时生成的版本文件，不再提供后删除
+        self.base_image_path = None
+        self.image_version = 0
+        self.hot_images = set()
         
         self.setup_ui()
         
@@ -613,7 +619,9 @@ class PaperUI:
             IO.error(t("no_capture_result"))
             return False
             
-        self.app.update_data = get_update_data(self.app.capture_result.product_url, self.app.capture_result.request_body)
+        self.app.update_data = get_update_data(
+            self.app.capture_result.product_url, self.app.capture_result.request_body,
+            response_cache=self.app.get_response_cache())
         if self.app.update_data:
             IO.info("Update data received.")
             return True
@@ -639,7 +647,18 @@ class PaperUI:
             def progress_cb(current, total):
                 self.root.after(0, lambda: step.update_progress(current, total))
                 
-            return download_file(delta_url, self.app.image_path, progress_callback=progress_cb)
+            pipeline = DownloadPipeline.from_update_data(self.app.update_data)
+            if not download_file(
+                delta_url, self.app.image_path,
+                progress_callback=progress_cb,
+                pipeline=pipeline,
+                connections=self.app.download_connections,
+                cache=self.app.get_firmware_cache()
+            ):
+                return False
+            log_coalescing_stats()
+            pipeline.record(self.app.get_index_cache(), self.app.image_path)
+            return True
         except KeyError as e:
             IO.error(t("json_structure_error").format(e))
             return False
@@ -654,19 +673,124 @@ class PaperUI:
         if not os.path.exists(self.app.image_path):
             IO.error(t("file_exists").format(self.app.image_path) + " (Not Found)")
             return False
+
+        if self.app.variants:
+            IO.info(t("variants_skip_patch"))
+            return True
             
-        if not Patcher.replace_hash(self.app.image_path):
+        # 服务器运行中时在新版本文件上修改，完成后热加载，正在进行的下载继续读取旧文件；
+        # Windows上正在传输或被映射的文件不能被替换，因此不覆盖原路径
+        server = getattr(self, 'server_instance', None)
+        if server is not None:
+            try:
+                return self.patch_and_reload(server)
+            except Exception as e:
+                IO.error(t("reload_failed").format(e))
+                return False
+
+        self.app.patched_ranges = []
+        index_cache = self.app.get_index_cache()
+        if not Patcher.replace_hash(
+            self.app.image_path,
+            patched_ranges=self.app.patched_ranges,
+            scan_workers=self.app.scan_workers,
+            index_cache=index_cache,
+            md5sum=self.app.update_data['data']['version'].get('md5sum')
+        ):
             return False
         
+        self.update_interface()
+        Patcher.update_version_data(
+            self.app.update_data, self.app.image_path, self.app.interface,
+            hash_workers=self.app.hash_workers,
+            patched_ranges=self.app.patched_ranges,
+            verify_segments=self.app.verify_segments,
+            index_cache=index_cache
+        )
+        self.add_to_catalog()
+        return True
+
+    def patch_and_reload(self, server):
+        """
+        服务器运行中时修改固件：复制为新版本文件后修改，再热加载到服务器，
+        此前热加载生成的旧版本在其传输结束后删除，失败时服务器继续提供原来的版本
+
+        参数:
+            server (HttpServer): 运行中的服务器
+
+        返回:
+            bool: 是否成功
+        """
+        image_path = self.next_image_path()
+        link_or_copy(self.app.image_path, image_path, allow_hardlink=False)
+        update_data = copy.deepcopy(self.app.update_data)
+        patched_ranges = []
+        try:
+            index_cache = self.app.get_index_cache()
+            if not Patcher.replace_hash(
+                image_path,
+                patched_ranges=patched_ranges,
+                scan_workers=self.app.scan_workers,
+                index_cache=index_cache,
+                md5sum=update_data['data']['version'].get('md5sum')
+            ):
+                os.remove(image_path)
+                return False
+            self.update_interface()
+            Patcher.update_version_data(
+                update_data, image_path, self.app.interface,
+                hash_workers=self.app.hash_workers,
+                patched_ranges=patched_ranges,
+                verify_segments=self.app.verify_segments,
+                index_cache=index_cache
+            )
+            if not server.reload(update_data=update_data, image_path=image_path, retire=self.app.image_path in self.hot_images):
+                os.remove(image_path)
+                return False
+        except Exception:
+            if os.path.exists(image_path):
+                os.remove(image_path)
+            raise
+        self.hot_images.add(image_path)
+        self.app.image_path = image_path
+        self.app.update_data = update_data
+        self.app.patched_ranges = patched_ranges
+        self.add_to_catalog()
+        return True
+
+    def next_image_path(self):
+        """
+        获取热加载使用的新版本固件路径，如image.img对应image.1.img、image.2.img
+
+        返回:
+            str: 尚不存在的固件路径
+        """
+        root, ext = os.path.splitext(self.base_image_path or self.app.image_path)
+        self.base_image_path = root + ext
+        while True:
+            self.image_version += 1
+            path = f"{root}.{self.image_version}{ext}"
+            if not os.path.exists(path):
+                return path
+
+    def update_interface(self):
+        """
+        使用界面中填写的本机IP作为固件下载地址，未填写时使用默认热点地址
+        """
         ip = self.ip_var.get().strip()
         if ip and ip != "0.0.0.0":
             self.app.interface = ip
         else:
             self.app.interface = "192.168.137.1"
             self.ip_var.set("192.168.137.1")
-            
-        Patcher.update_version_data(self.app.update_data, self.app.image_path, self.app.interface)
-        return True
+
+    def add_to_catalog(self):
+        """
+        把修改后的固件加入产品目录(未配置目录时跳过)
+        """
+        catalog = self.app.get_catalog()
+        if catalog is not None:
+            catalog.add(self.app.capture_result.product_url, self.app.update_data, self.app.image_path, self.app.interface)
 
     def run_network(self):
         """
@@ -710,8 +834,18 @@ class PaperUI:
             self.server_instance = HttpServer(
                 port=80, 
                 image_path=os.path.abspath(self.app.image_path), 
-                update_data=self.app.update_data,
-                progress_callback=progress_cb
+                update_data=None if self.app.variants else self.app.update_data,
+                progress_callback=progress_cb,
+                serve_mode=self.app.serve_mode,
+                warm_image=self.app.warm_image,
+                engine=self.app.server_engine,
+                max_transfers=self.app.max_transfers,
+                bandwidth_limit=self.app.bandwidth_limit,
+                client_bandwidth=self.app.client_bandwidth,
+                sessions=self.app.get_sessions(),
+                catalog=self.app.get_catalog(),
+                workers=self.app.server_workers,
+                idle_timeout=self.app.idle_timeout
             )
             
             error_queue = queue.Queue()
@@ -786,8 +920,51 @@ def main_ui(args=None):
     
     interface = args.interface if args and args.interface else "0.0.0.0"
     image = args.image if args and args.image else "image.img"
+    hash_workers = getattr(args, "hash_workers", 1) if args else 1
+    verify_segments = getattr(args, "verify_segments", False) if args else False
+    scan_workers = getattr(args, "scan_workers", 1) if args else 1
+    index_cache = not getattr(args, "no_index_cache", False) if args else True
+    download_connections = getattr(args, "download_connections", 1) if args else 1
+    firmware_cache = getattr(args, "firmware_cache", None) if args else None
+    firmware_cache_mb = getattr(args, "firmware_cache_mb", None) if args else None
+    response_cache = getattr(args, "response_cache", None) if args else None
+    response_cache_mode = getattr(args, "response_cache_mode", "cache") if args else "cache"
+    response_cache_ttl = getattr(args, "response_cache_ttl", None) if args else None
+    serve_mode = getattr(args, "serve_mode", "flask") if args else "flask"
+    warm_image = getattr(args, "warm_image", False) if args else False
+    server_engine = getattr(args, "server_engine", "flask") if args else "flask"
+    max_transfers = getattr(args, "max_transfers", None) if args else None
+    server_workers = getattr(args, "server_workers", None) if args else None
+    idle_timeout = getattr(args, "idle_timeout", None) if args else None
+    bandwidth_limit = getattr(args, "bandwidth_limit", None) if args else None
+    client_bandwidth = getattr(args, "client_bandwidth", None) if args else None
+    variants = getattr(args, "variants", None) if args else None
+    catalog = getattr(args, "catalog", None) if args else None
     
-    app_context = PaperPApp(interface=interface, image_path=image)
+    app_context = PaperPApp(
+        interface=interface,
+        image_path=image,
+        hash_workers=hash_workers,
+        verify_segments=verify_segments,
+        scan_workers=scan_workers,
+        index_cache=index_cache,
+        download_connections=download_connections,
+        firmware_cache=firmware_cache,
+        firmware_cache_budget=firmware_cache_mb * 1024 * 1024 if firmware_cache_mb else None,
+        response_cache=response_cache,
+        response_cache_mode=response_cache_mode,
+        response_cache_ttl=response_cache_ttl,
+        serve_mode=serve_mode,
+        warm_image=warm_image,
+        server_engine=server_engine,
+        max_transfers=max_transfers,
+        server_workers=server_workers,
+        idle_timeout=idle_timeout,
+        bandwidth_limit=bandwidth_limit * 1024 * 1024 if bandwidth_limit else None,
+        client_bandwidth=client_bandwidth * 1024 * 1024 if client_bandwidth else None,
+        variants=variants,
+        catalog=catalog
+    )
     
     app = PaperUI(root, app_context)
     root.mainloop()
@@ -802,5 +979,25 @@ if __name__ == "__main__":
     parser.add_argument("--image", default="image.img")
     parser.add_argument("--lang", choices=['en', 'cn'])
     parser.add_argument("--debug", action="store_true")
+    parser.add_argument("--hash-workers", type=int, default=1)
+    parser.add_argument("--verify-segments", action="store_true")
+    parser.add_argument("--scan-workers", type=int, default=1)
+    parser.add_argument("--no-index-cache", action="store_true")
+    parser.add_argument("--download-connections", type=int, default=1)
+    parser.add_argument("--firmware-cache")
+    parser.add_argument("--firmware-cache-mb", type=int)
+    parser.add_argument("--response-cache")
+    parser.add_argument("--response-cache-mode", choices=['cache', 'record', 'replay'], default='cache')
+    parser.add_argument("--response-cache-ttl", type=float)
+    parser.add_argument("--serve-mode", choices=['flask', 'sendfile', 'mmap'], default='flask')
+    parser.add_argument("--warm-image", action="store_true")
+    parser.add_argument("--server-engine", choices=['flask', 'asyncio'], default='flask')
+    parser.add_argument("--max-transfers", type=int)
+    parser.add_argument("--server-workers", type=int)
+    parser.add_argument("--idle-timeout", type=float)
+    parser.add_argument("--bandwidth-limit", type=float)
+    parser.add_argument("--client-bandwidth", type=float)
+    parser.add_argument("--variants")
+    parser.add_argument("--catalog")
     args = parser.parse_args()
     main_ui(args)
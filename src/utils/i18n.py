@@ -59,6 +59,40 @@ class I18N:
         "using_existing": {Language.ENGLISH: "Using existing file.", Language.CHINESE: "使用现有文件。"},
         "download_progress": {Language.ENGLISH: "Downloading: {:.1f}% ({}/{})", Language.CHINESE: "下载进度: {:.1f}% ({}/{})"},
         "download_fail": {Language.ENGLISH: "Download failed: {}", Language.CHINESE: "下载失败: {}"},
+        "firmware_cache_hit": {Language.ENGLISH: "Firmware cache hit: {} ({})", Language.CHINESE: "命中固件缓存: {} ({})"},
+        "firmware_cache_corrupt": {Language.ENGLISH: "Cached firmware {} is corrupt, downloading again", Language.CHINESE: "缓存的固件 {} 已损坏，重新下载"},
+        "firmware_cache_stats": {Language.ENGLISH: "Firmware cache: {} hits, {} misses, {} entries, {} bytes", Language.CHINESE: "固件缓存: 命中 {} 次，未命中 {} 次，{} 个条目，{} 字节"},
+        "firmware_cache_evicted": {Language.ENGLISH: "Evicted cached firmware {}", Language.CHINESE: "已淘汰缓存固件 {}"},
+        "firmware_cache_load_fail": {Language.ENGLISH: "Failed to load firmware cache index: {}", Language.CHINESE: "读取固件缓存索引失败: {}"},
+        "response_cache_hit": {Language.ENGLISH: "Using recorded update info ({} mode, recorded {}s ago)", Language.CHINESE: "使用已录制的更新信息 ({} 模式，{} 秒前录制)"},
+        "response_cache_stored": {Language.ENGLISH: "Recorded update info to {}", Language.CHINESE: "已录制更新信息到 {}"},
+        "response_cache_read_fail": {Language.ENGLISH: "Failed to read recorded update info {}: {}", Language.CHINESE: "读取已录制的更新信息 {} 失败: {}"},
+        "response_cache_store_fail": {Language.ENGLISH: "Failed to record update info: {}", Language.CHINESE: "录制更新信息失败: {}"},
+        "variants_skip_patch": {Language.ENGLISH: "Variant sessions configured, serving per-device overlays instead of patching the image", Language.CHINESE: "已配置设备变体会话，不修改固件，按设备叠加补丁字节提供"},
+        "catalog_added": {Language.ENGLISH: "Added product {} to the catalog ({} products)", Language.CHINESE: "已将产品 {} 加入目录 (共 {} 个产品)"},
+        "catalog_loaded": {Language.ENGLISH: "Serving {} products from catalog {}", Language.CHINESE: "正在从目录 {1} 提供 {0} 个产品"},
+        "catalog_load_fail": {Language.ENGLISH: "Failed to load product catalog: {}", Language.CHINESE: "读取产品目录失败: {}"},
+        "catalog_no_product": {Language.ENGLISH: "Cannot find a product id in {}", Language.CHINESE: "无法从 {} 中识别产品ID"},
+        "catalog_empty": {Language.ENGLISH: "The product catalog is empty", Language.CHINESE: "产品目录为空"},
+        "image_warmed": {Language.ENGLISH: "Firmware {} loaded into page cache ({:.1f} MB)", Language.CHINESE: "固件 {} 已预读入页缓存 ({:.1f} MB)"},
+        "server_reloaded": {Language.ENGLISH: "Server reloaded, now serving {}", Language.CHINESE: "服务器已热加载，当前提供 {}"},
+        "reload_image_missing": {Language.ENGLISH: "Cannot reload, firmware not found: {}", Language.CHINESE: "无法热加载，固件不存在: {}"},
+        "image_retired": {Language.ENGLISH: "Deleted retired firmware {}", Language.CHINESE: "已删除不再提供的旧固件 {}"},
+        "reload_failed": {Language.ENGLISH: "Failed to hot reload the patched firmware, still serving the previous version: {}", Language.CHINESE: "热加载修改后的固件失败，继续提供之前的版本: {}"},
+        "sessions_loaded": {Language.ENGLISH: "Loaded {} device sessions from {}", Language.CHINESE: "已加载 {} 个设备会话 (来自 {})"},
+        "sessions_base_mismatch": {Language.ENGLISH: "Base image {} does not match the variant manifest {}, regenerate the variants", Language.CHINESE: "基础固件 {} 与变体清单 {} 不匹配，请重新生成变体"},
+        "request_coalesced": {Language.ENGLISH: "Joined in-flight {} request for {}", Language.CHINESE: "已合并到进行中的 {} 请求: {}"},
+        "request_coalesced_stats": {Language.ENGLISH: "Coalesced requests: checkVersion {}/{}, download {}/{} (coalesced/executed)", Language.CHINESE: "请求合并: checkVersion {}/{}，下载 {}/{} (合并/执行)"},
+        "download_target_busy": {Language.ENGLISH: "{} is already being downloaded and patched by another session, use a different --image", Language.CHINESE: "{} 正由另一个会话下载和修改，请使用其他 --image"},
+        "response_cache_replay_miss": {Language.ENGLISH: "No recorded update info for {} (replay mode)", Language.CHINESE: "回放模式下没有 {} 的已录制更新信息"},
+        "download_resuming": {Language.ENGLISH: "Resuming download, {} bytes already downloaded", Language.CHINESE: "继续下载，已下载 {} 字节"},
+        "download_resumable": {Language.ENGLISH: "Partial download kept at {}, it will be resumed on the next attempt", Language.CHINESE: "已保留部分下载文件 {}，下次将继续下载"},
+        "ranged_download": {Language.ENGLISH: "Server supports ranges, downloading with {} connections", Language.CHINESE: "服务器支持分段请求，使用 {} 个连接下载"},
+        "range_fallback": {Language.ENGLISH: "Server ignored the range request, falling back to a single connection", Language.CHINESE: "服务器未响应分段请求，回退到单连接下载"},
+        "range_probe_fail": {Language.ENGLISH: "Range probe failed: {}", Language.CHINESE: "分段探测失败: {}"},
+        "range_incomplete": {Language.ENGLISH: "Range {}-{} ended early after {} bytes", Language.CHINESE: "范围 {}-{} 在 {} 字节后提前结束"},
+        "download_digest_mismatch": {Language.ENGLISH: "Downloaded file {} mismatch: expected {}, got {}", Language.CHINESE: "下载文件 {} 不一致: 期望 {}，实际 {}"},
+        "download_verified": {Language.ENGLISH: "Downloaded file matches the upstream digests", Language.CHINESE: "下载文件与上游摘要一致"},
         "json_structure_error": {Language.ENGLISH: "JSON structure mismatch: {}", Language.CHINESE: "JSON 结构不匹配: {}"},
         
         # Patch
@@ -76,6 +110,15 @@ class I18N:
         "new_hash_log": {Language.ENGLISH: "New Hash: {}", Language.CHINESE: "新哈希值: {}"},
         "patch_fail": {Language.ENGLISH: "Failed to patch file: {}", Language.CHINESE: "修改文件失败: {}"},
         "calculating_hash": {Language.ENGLISH: "Calculating hashes...", Language.CHINESE: "正在计算哈希..."},
+        "dirty_segments": {Language.ENGLISH: "Rehashing {} of {} segments touched by the patch", Language.CHINESE: "重新计算被修改影响的分段: {}/{}"},
+        "variant_building": {Language.ENGLISH: "Building {} password variants...", Language.CHINESE: "正在生成 {} 个密码变体..."},
+        "variant_saved": {Language.ENGLISH: "Saved {} variants to {}", Language.CHINESE: "已保存 {} 个变体到 {}"},
+        "segments_verified_cached": {Language.ENGLISH: "Segments of this build were already verified, skipping verification", Language.CHINESE: "该版本的分段已校验过，跳过校验"},
+        "index_cache_hit": {Language.ENGLISH: "Using {} cached password pattern offsets, skipping scan", Language.CHINESE: "使用缓存的 {} 个密码模式偏移，跳过扫描"},
+        "index_cache_stale": {Language.ENGLISH: "Cached pattern offsets no longer match the image, rescanning", Language.CHINESE: "缓存的模式偏移与固件不符，重新扫描"},
+        "index_cache_load_fail": {Language.ENGLISH: "Failed to load signature index cache: {}", Language.CHINESE: "读取特征索引缓存失败: {}"},
+        "index_cache_save_fail": {Language.ENGLISH: "Failed to save signature index cache: {}", Language.CHINESE: "保存特征索引缓存失败: {}"},
+        "segment_md5_mismatch": {Language.ENGLISH: "Segment {} ({}-{}) does not match the upstream MD5, using recomputed value", Language.CHINESE: "分段 {} ({}-{}) 与上游 MD5 不一致，使用重新计算的值"},
         
         # Host/Server
         "hosts_modified": {Language.ENGLISH: "Hosts file modified", Language.CHINESE: "Hosts 文件已修改"},